@@ -1,12 +1,19 @@
-import json
+import argparse
 
 import requests
 
-vm_ip = "192.168.101.115"
-broker_port = "9090"
+parser = argparse.ArgumentParser(description="Checks that the broker answers")
+parser.add_argument(
+    "--endpoint",
+    help="Broker URL, e.g. http://127.0.0.1:9090 for benchmarks/mockbroker.py (default: http://192.168.101.115:9090)",
+    type=str,
+    default="http://192.168.101.115:9090",
+)
+args = parser.parse_args()
+
 link_nav = "/ngsi-ld/v1/entities"
-req_url = "http://" + vm_ip + ":" + broker_port + link_nav
+req_url = args.endpoint.rstrip("/") + link_nav
 
 response = requests.get(req_url)
 
-print(response.content)
+print(response.text)
@@ -0,0 +1,321 @@
+"""Open-loop load generator for NGSI-LD brokers, used by requestBuilder.py --load.
+
+Requests are scheduled at fixed (or Poisson distributed) intervals for the target
+rate, independent of how fast the broker answers. Latency is measured from the
+scheduled start, so time spent waiting for a free connection counts as well and
+a slow broker cannot hide its stalls (coordinated omission).
+"""
+
+import json
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from string import Template
+
+import requests
+from requests.adapters import HTTPAdapter
+
+OPERATIONS = ("post", "get", "patch", "delete")
+
+# Latencies are kept in microseconds with 2^SUB_BITS sub-buckets per power of two
+SUB_BITS = 7
+SUB_COUNT = 1 << SUB_BITS
+HALF_COUNT = SUB_COUNT >> 1
+
+
+class LatencyHistogram:
+    """Log-linear histogram in the spirit of HdrHistogram, with < 1.6% error"""
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    @staticmethod
+    def _index(value):
+        if value < SUB_COUNT:
+            return value
+        shift = value.bit_length() - SUB_BITS
+        return SUB_COUNT + (shift - 1) * HALF_COUNT + (value >> shift) - HALF_COUNT
+
+    @staticmethod
+    def _highest(index):
+        if index < SUB_COUNT:
+            return index
+        shift = (index - SUB_COUNT) // HALF_COUNT + 1
+        top = (index - SUB_COUNT) % HALF_COUNT + HALF_COUNT
+        return ((top + 1) << shift) - 1
+
+    def record(self, seconds):
+        value = int(seconds * 1e6)
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q):
+        """Latency in ms below which ``q`` percent of the requests finished"""
+        rank = q / 100 * self.count
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._highest(index), self.max) / 1000
+        return self.max / 1000
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count / 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+            "p99.9_ms": self.percentile(99.9),
+            "max_ms": self.max / 1000,
+        }
+
+
+def parse_mix(mix):
+    """Parses "post=1,get=4,patch=2,delete=1" into operation weights"""
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip().lower()
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation {name!r} in the mix.")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+class PayloadTemplate:
+    """Entity payloads from a JSON template file.
+
+    Placeholders are substituted per request: $n (sequence number), $run (id of
+    this run, ``run_id`` or random), $rand (random number between 0 and 100) and
+    $now (current time, ISO 8601). Without $n in the id, ":<n>" is appended to it,
+    and without $run ":<run>" before that, so every created entity is new, also
+    when the broker still holds the entities of an earlier run.
+    """
+
+    def __init__(self, path, run_id=None):
+        with open(path, "r", encoding="utf-8") as f:
+            self._template = Template(f.read())
+        self.run_id = run_id or uuid.uuid4().hex[:8]
+        rng = random.Random()
+        self._id_has_n = self._render(1, rng)["id"] != self._render(2, rng)["id"]
+        self._id_has_run = (
+            self._render(1, rng, "a")["id"] != self._render(1, rng, "b")["id"]
+        )
+
+    def _render(self, n, rng, run_id=None):
+        return json.loads(
+            self._template.safe_substitute(
+                n=n,
+                run=run_id or self.run_id,
+                rand=round(rng.uniform(0, 100), 3),
+                now=datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            )
+        )
+
+    def render(self, n, rng):
+        entity = self._render(n, rng)
+        if not self._id_has_run:
+            entity["id"] = f"{entity['id']}:{self.run_id}"
+        if not self._id_has_n:
+            entity["id"] = f"{entity['id']}:{n}"
+        return entity
+
+
+class Workload:
+    """The operations of the mix, on entities created by the run itself"""
+
+    def __init__(self, base_url, template, weights, seed=None, timeout=30.0):
+        self._entities_url = base_url.rstrip("/") + "/ngsi-ld/v1/entities"
+        self._template = template
+        self._operations = list(weights)
+        self._weights = list(weights.values())
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._created = deque()
+        self._timeout = timeout
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            session.mount("http://", HTTPAdapter(pool_maxsize=1))
+            session.mount("https://", HTTPAdapter(pool_maxsize=1))
+        return session
+
+    def next_operation(self):
+        """Picks the next operation and its entity, in the scheduling thread"""
+        with self._lock:
+            operation = self._rng.choices(self._operations, self._weights)[0]
+            if operation == "post" or not self._created:
+                self._sequence += 1
+                return "post", self._template.render(self._sequence, self._rng)
+            if operation == "delete":
+                return "delete", self._created.popleft()
+            index = self._rng.randrange(len(self._created))
+            return operation, self._created[index]
+
+    def execute(self, operation, entity):
+        """Sends one request, returns True if the broker accepted it"""
+        session = self._session()
+        if operation == "post":
+            response = session.post(
+                self._entities_url,
+                data=json.dumps(entity),
+                headers={"Content-Type": "application/ld+json"},
+                timeout=self._timeout,
+            )
+            ok = response.status_code == 201
+            if ok:
+                with self._lock:
+                    self._created.append(entity)
+            return ok
+        url = f"{self._entities_url}/{entity['id']}"
+        if operation == "get":
+            response = session.get(url, timeout=self._timeout)
+        elif operation == "patch":
+            attrs = {k: v for k, v in entity.items() if k not in ("id", "type")}
+            response = session.patch(
+                url + "/attrs",
+                data=json.dumps(attrs),
+                headers={"Content-Type": "application/ld+json"},
+                timeout=self._timeout,
+            )
+        else:
+            response = session.delete(url, timeout=self._timeout)
+        response.content  # read the body, as a real client would
+        return 200 <= response.status_code <= 299
+
+    def preload(self, count):
+        """Creates ``count`` entities, returns the number the broker did not accept"""
+        failed = 0
+        for _ in range(count):
+            with self._lock:
+                self._sequence += 1
+                entity = self._template.render(self._sequence, self._rng)
+            try:
+                ok = self.execute("post", entity)
+            except requests.RequestException:
+                ok = False
+            if not ok:
+                failed += 1
+        return failed
+
+
+class Results:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.errors = {}
+
+    def record(self, operation, seconds, ok):
+        with self._lock:
+            histogram = self.histograms.get(operation)
+            if histogram is None:
+                histogram = self.histograms[operation] = LatencyHistogram()
+            histogram.record(seconds)
+            if not ok:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    def summary(self, duration):
+        operations = {}
+        total = LatencyHistogram()
+        for operation in OPERATIONS:
+            histogram = self.histograms.get(operation)
+            if histogram is None:
+                continue
+            total.merge(histogram)
+            operations[operation] = {
+                **histogram.summary(),
+                "errors": self.errors.get(operation, 0),
+                "throughput": histogram.count / duration,
+            }
+        operations["total"] = {
+            **total.summary(),
+            "errors": sum(self.errors.values()),
+            "throughput": total.count / duration,
+        }
+        return operations
+
+
+def _timed(workload, results, operation, entity, scheduled):
+    try:
+        ok = workload.execute(operation, entity)
+    except requests.RequestException:
+        ok = False
+    results.record(operation, time.perf_counter() - scheduled, ok)
+
+
+def run_open_loop(workload, rate, duration, max_in_flight=256, poisson=False):
+    """Starts requests at ``rate`` per second for ``duration`` seconds.
+
+    Latency counts from the scheduled start. Up to ``max_in_flight`` requests run
+    at once; beyond that they queue, and the queueing shows up as latency.
+    """
+    results = Results()
+    rng = random.Random()
+    start = time.perf_counter()
+    end = start + duration
+    scheduled = start
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        while scheduled < end:
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            operation, entity = workload.next_operation()
+            executor.submit(_timed, workload, results, operation, entity, scheduled)
+            scheduled += rng.expovariate(rate) if poisson else 1 / rate
+    return results, time.perf_counter() - start
+
+
+def run_closed_loop(workload, concurrency, duration):
+    """Every one of ``concurrency`` clients sends its next request when the last
+    one was answered, for ``duration`` seconds (latency is service time)."""
+    results = Results()
+    start = time.perf_counter()
+    end = start + duration
+
+    def client():
+        while time.perf_counter() < end:
+            operation, entity = workload.next_operation()
+            _timed(workload, results, operation, entity, time.perf_counter())
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - start
+
+
+def format_summary(summary):
+    columns = ("count", "errors", "throughput", "mean_ms", "p50_ms", "p90_ms")
+    columns += ("p99_ms", "p99.9_ms", "max_ms")
+    lines = ["operation " + " ".join(f"{c:>10}" for c in columns)]
+    for operation, values in summary.items():
+        cells = [
+            f"{values[c]:>10}" if isinstance(values[c], int) else f"{values[c]:>10.2f}"
+            for c in columns
+        ]
+        lines.append(f"{operation:<9} " + " ".join(cells))
+    return "\n".join(lines)
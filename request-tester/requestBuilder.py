@@ -1,9 +1,13 @@
 import argparse
 import json
+import sys
 from os.path import exists
+from urllib.parse import urlsplit
 
 import requests
 
+import loadgen
+
 vm_ip = "192.168.101.115"
 broker_port = "9090"
 
@@ -17,12 +21,79 @@ parser = argparse.ArgumentParser(
 parser.add_argument(
     "rest_method",
     type=int,
-    help="REST Method Type: [1] POST [2] GET [3] DELETE [4] PUT",
+    nargs="?",
+    help="REST Method Type: [1] POST [2] GET [3] DELETE [4] PUT (update the attributes, sent as PATCH)",
 )
 parser.add_argument(
     "file_number",
     type=int,
-    help="File number of JSON file as input for body and URL file as URL for request",
+    nargs="?",
+    default=1,
+    help="File number of JSON file as input for body and URL file as URL for request (default: 1)",
+)
+load_args = parser.add_argument_group(
+    "load generation", "Replay a mix of requests instead of a single one"
+)
+load_args.add_argument(
+    "--load",
+    action="store_true",
+    help="Generate load from the JSON file as a template (see loadgen.py for placeholders)",
+)
+load_args.add_argument(
+    "--template",
+    type=str,
+    default=None,
+    help="Template for the entities (default: the JSON file of file_number)",
+)
+load_args.add_argument(
+    "--endpoint",
+    type=str,
+    default=None,
+    help="Broker URL (default: the host in the URL file of file_number)",
+)
+load_args.add_argument(
+    "--rate",
+    type=float,
+    default=None,
+    help="Requests started per second, independent of the responses (open loop)",
+)
+load_args.add_argument(
+    "--poisson",
+    action="store_true",
+    help="With --rate, start requests at random (exponential) intervals",
+)
+load_args.add_argument(
+    "--concurrency",
+    type=int,
+    default=10,
+    help="Without --rate, clients sending requests back-to-back (closed loop), else the maximum requests in flight (default: 10)",
+)
+load_args.add_argument(
+    "--duration", type=float, default=30.0, help="Seconds to run (default: 30)"
+)
+load_args.add_argument(
+    "--mix",
+    type=str,
+    default="post=1,get=4,patch=2,delete=1",
+    help="Weights of the operations (default: post=1,get=4,patch=2,delete=1)",
+)
+load_args.add_argument(
+    "--preload",
+    type=int,
+    default=100,
+    help="Entities created before the measurement (default: 100)",
+)
+load_args.add_argument(
+    "--run-id",
+    type=str,
+    default=None,
+    help="Replaces $run in the template ids, unique per run (default: random)",
+)
+load_args.add_argument(
+    "--json",
+    type=str,
+    default=None,
+    help="Also write the results to this JSON file",
 )
 cmd_args = parser.parse_args()
 
@@ -45,8 +116,63 @@ def url_reader(fileName):
     return url_line
 
 
+def entity_request(file_number):
+    """Returns the URL and the entity of a .txt/.json file pair, None if missing"""
+    json_file = str(file_number) + ".json"
+    url_file = str(file_number) + ".txt"
+    if not check_file_exists(json_file):
+        print("ERROR: JSON input file: " + json_file + " not found!")
+        return None
+    if not check_file_exists(url_file):
+        print("ERROR: URL input file: " + url_file + " missing!")
+        return None
+    with open(json_file, "r") as f:
+        entity = json.load(f)
+    return url_reader(url_file).rstrip("/"), entity
+
+
+def run_load():
+    template = cmd_args.template or str(cmd_args.file_number) + ".json"
+    endpoint = cmd_args.endpoint
+    if endpoint is None:
+        url = urlsplit(url_reader(str(cmd_args.file_number) + ".txt"))
+        endpoint = f"{url.scheme}://{url.netloc}"
+    payloads = loadgen.PayloadTemplate(template, cmd_args.run_id)
+    workload = loadgen.Workload(endpoint, payloads, loadgen.parse_mix(cmd_args.mix))
+    print(f"\nRun {payloads.run_id}: preloading {cmd_args.preload} entities...")
+    failed = workload.preload(cmd_args.preload)
+    if failed:
+        print(f"ERROR: {failed} of {cmd_args.preload} preloaded entities were rejected")
+        if failed == cmd_args.preload:
+            sys.exit(1)
+    if cmd_args.rate:
+        print(f"Open loop: {cmd_args.rate:g} requests/s for {cmd_args.duration:g}s")
+        results, duration = loadgen.run_open_loop(
+            workload,
+            cmd_args.rate,
+            cmd_args.duration,
+            cmd_args.concurrency,
+            cmd_args.poisson,
+        )
+    else:
+        print(
+            f"Closed loop: {cmd_args.concurrency} clients for {cmd_args.duration:g}s"
+        )
+        results, duration = loadgen.run_closed_loop(
+            workload, cmd_args.concurrency, cmd_args.duration
+        )
+    summary = results.summary(duration)
+    print()
+    print(loadgen.format_summary(summary))
+    if cmd_args.json:
+        with open(cmd_args.json, "w") as f:
+            json.dump({"arguments": vars(cmd_args), "results": summary}, f, indent=2)
+
+
 def main():
-    if cmd_args.rest_method == 1:
+    if cmd_args.load:
+        run_load()
+    elif cmd_args.rest_method == 1:
         print("Working with REST POST method...")
         json_file = str(cmd_args.file_number) + ".json"
         url_file = str(cmd_args.file_number) + ".txt"
@@ -59,8 +185,8 @@ def main():
                     print("\nPOSTing Data Content:\n")
                     print(post_data)
                 post_req_url = url_reader(url_file)
-                post_response = requests.post(post_req_url, data = post_data, headers = post_req_headers)
-                post_response_data = post_response.content.decode("ascii")
+                post_response = requests.post(post_req_url, data = json.dumps(post_data), headers = post_req_headers)
+                post_response_data = post_response.text
                 post_response_code = str(post_response.status_code)
                 print("\nResponse POST Status Code: " + post_response_code)
                 print("\nResponse POST: " + post_response_data)
@@ -75,7 +201,7 @@ def main():
         if check_file_exists(url_file):
             get_req = url_reader(url_file)
             response_get = requests.get(get_req)
-            response_json = response_get.content.decode("ascii")
+            response_json = response_get.text
             print("Response GET: " + response_json)
             # response_output = open("response.json", "w")
             # response_output.writelines(response_json)
@@ -85,14 +211,28 @@ def main():
             print("ERROR: URL input file: " + url_file + " missing!")
 
     elif cmd_args.rest_method == 3:
-        print("Functionality DELETE not yet Ready!")
-        # response_delete = requests.delete(req_url)
-        # print("Response DELETE: " + response_delete.content)
+        print("Working with REST DELETE method...")
+        entity = entity_request(cmd_args.file_number)
+        if entity is not None:
+            delete_req_url = entity[0] + "/" + entity[1]["id"]
+            response_delete = requests.delete(delete_req_url)
+            print("\nResponse DELETE Status Code: " + str(response_delete.status_code))
+            print("\nResponse DELETE: " + response_delete.text)
 
     elif cmd_args.rest_method == 4:
-        print("Functionality PUT not yet Ready!")
-        # response_put = requests.put(req_url)
-        # print("Response PUT: " + response_put.content)
+        print("Working with REST PUT method...")
+        entity = entity_request(cmd_args.file_number)
+        if entity is not None:
+            # NGSI-LD updates the attributes of an entity with PATCH
+            put_req_url = entity[0] + "/" + entity[1]["id"] + "/attrs"
+            put_data = {k: v for k, v in entity[1].items() if k not in ("id", "type")}
+            response_put = requests.patch(
+                put_req_url,
+                data=json.dumps(put_data),
+                headers={"Content-Type": "application/ld+json"},
+            )
+            print("\nResponse PUT Status Code: " + str(response_put.status_code))
+            print("\nResponse PUT: " + response_put.text)
 
     else:
         print("ERROR: Invalid REST Method Request")
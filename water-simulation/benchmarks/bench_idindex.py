@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+"""Micro-benchmark of the node id -> type lookup used for the link relationships.
+
+Compares the plain dict built by earlier versions of water-simulation.py with
+kbscenariotools.idindex.IdTypeIndex, in RAM and spilled to a memory-mapped file.
+Memory is measured with tracemalloc and includes the name strings, as both
+variants have to keep them: what the mapping retains and the peak while building
+it. The lookup latency is the mean and the p99 of single lookups of random names.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kbscenariotools.idindex import IdTypeIndex  # noqa: E402
+
+NODE_TYPES = ("Junction", "Junction", "Junction", "Junction", "Tank", "Reservoir")
+
+
+def make_nodes(count, seed):
+    rng = random.Random(seed)
+    # Going through json like the importer does gives every entry its own strings
+    return json.loads(
+        json.dumps(
+            [
+                {"name": f"J-{i:08d}", "node_type": rng.choice(NODE_TYPES)}
+                for i in range(count)
+            ]
+        )
+    )
+
+
+def measure(build, *build_args, repeat=True):
+    """Result, seconds and the retained and peak memory of ``build(*build_args)``.
+
+    tracemalloc slows down every allocation, so with ``repeat`` the time is taken
+    from a build without it and the memory from a second one.
+    """
+    build_time = None
+    if repeat:
+        start = time.perf_counter()
+        build(*build_args)
+        build_time = time.perf_counter() - start
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build(*build_args)
+    if build_time is None:
+        build_time = time.perf_counter() - start
+    memory, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, build_time, memory, peak
+
+
+def lookup_latency(mapping, names):
+    """Mean and p99 seconds of a lookup, the p99 from individually timed lookups"""
+    start = time.perf_counter()
+    for name in names:
+        mapping[name]
+    mean = (time.perf_counter() - start) / len(names)
+    clock = time.perf_counter
+    timings = []
+    for name in names:
+        start = clock()
+        mapping[name]
+        timings.append(clock() - start)
+    timings.sort()
+    return mean, timings[int(len(timings) * 0.99)]
+
+
+def build_dict(nodes):
+    # Copies of the strings, so the memory of the node dicts is not counted
+    return {(node["name"] + ".")[:-1]: (node["node_type"] + ".")[:-1] for node in nodes}
+
+
+def build_index(nodes):
+    return IdTypeIndex.from_items((node["name"], node["node_type"]) for node in nodes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--elements", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    nodes = make_nodes(args.elements, args.seed)
+    rng = random.Random(args.seed)
+    names = [rng.choice(nodes)["name"] for _ in range(args.lookups)]
+
+    print(f"{args.elements} elements, {args.lookups} random lookups\n")
+    print(
+        f"{'variant':<22}{'build [s]':>11}{'mean [us]':>11}{'p99 [us]':>10}"
+        f"{'memory [MB]':>13}{'peak [MB]':>11}"
+    )
+
+    def report(variant, build_time, mapping, memory, peak):
+        mean, p99 = lookup_latency(mapping, names)
+        print(
+            f"{variant:<22}{build_time:>11.3f}{mean * 1e6:>11.2f}{p99 * 1e6:>10.2f}"
+            f"{memory / 2**20:>13.1f}{peak / 2**20:>11.1f}"
+        )
+
+    mapping, build_time, memory, peak = measure(build_dict, nodes)
+    report("dict", build_time, mapping, memory, peak)
+    del mapping
+
+    index, build_time, memory, peak = measure(build_index, nodes)
+    report("IdTypeIndex", build_time, index, memory, peak)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "nodes.idx")
+        _, spill_time, memory, peak = measure(index.spill, path, repeat=False)
+        report("IdTypeIndex (mmap)", spill_time, index, memory, peak)
+        print(f"\nmapped file: {os.path.getsize(path) / 2**20:.1f} MB")
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,518 @@
+#!/usr/bin/env python
+
+"""In-process stand-in for an NGSI-LD context broker, for benchmarks and tests.
+
+Implements the parts of the API the import tools use:
+
+    POST   /ngsi-ld/v1/entities/
+    GET    /ngsi-ld/v1/entities/          (type, idPattern, limit, offset, count)
+    GET    /ngsi-ld/v1/entities/{id}
+    DELETE /ngsi-ld/v1/entities/{id}
+    POST   /ngsi-ld/v1/entities/{id}/attrs   (append)
+    PATCH  /ngsi-ld/v1/entities/{id}/attrs   (update, existing attributes only)
+    DELETE /ngsi-ld/v1/entities/{id}/attrs/{attr}
+    POST   /ngsi-ld/v1/entityOperations/{create,upsert,update,delete}
+    POST   /ngsi-ld/v1/temporal/entities/
+    GET    /ngsi-ld/v1/temporal/entities/{id}
+    POST   /ngsi-ld/v1/subscriptions/
+    DELETE /ngsi-ld/v1/subscriptions/{id}
+
+Every request is delayed by ``latency`` seconds, fails with 503 with probability
+``error_rate`` and is answered with 429 (and Retry-After) when it exceeds
+``rate_limit`` requests per second. Entities are kept serialized in memory.
+Attribute instances with observedAt, from the temporal API or from updates, are
+kept as the history of their entity.
+Entities created or changed are notified to the matching subscriptions (type and
+idPattern), with modifiedAt, by a background thread in batches of up to 100.
+Like the type names of a JSON-LD broker, the ``type`` of a query only matches
+entities created with the same context (body ``@context`` or Link header).
+Request bodies may be gzip or deflate encoded, and with ``gzip_responses``
+larger responses are gzip encoded for clients accepting it.
+"""
+
+import argparse
+import gzip
+import http.client
+import json
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, unquote, urlsplit
+
+API = "/ngsi-ld/v1"
+CORE_CONTEXT = "https://uri.etsi.org/ngsi-ld/v1/ngsi-ld-core-context.jsonld"
+NOTIFICATION_SIZE = 100
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds")[:-6] + "Z"
+
+
+class _TokenBucket:
+    def __init__(self, rate: float):
+        self._rate = rate
+        self._tokens = rate
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self._rate, self._tokens + (now - self._last) * self._rate
+            )
+            self._last = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class MockBroker:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit: Optional[float] = None,
+        seed: Optional[int] = None,
+        gzip_responses: bool = False,
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.gzip_responses = gzip_responses
+        self._bucket = _TokenBucket(rate_limit) if rate_limit else None
+        self._random = random.Random(seed)
+        self.entities: Dict[str, bytes] = {}
+        # JSON-LD contexts the entities were created with, None for the core context
+        self.contexts: Dict[str, Optional[frozenset]] = {}
+        self.temporal: Dict[str, dict] = {}
+        self.subscriptions: Dict[str, dict] = {}
+        self.notifications = 0
+        self._changes: "queue.Queue[dict]" = queue.Queue()
+        self._notifier: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rejected = 0
+        handler = type("Handler", (_Handler,), {"broker": self})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockBroker":
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="mock-broker", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockBroker":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.stop()
+
+    def admit(self) -> Optional[int]:
+        """Returns the error status for a request, or None if it is served"""
+        with self.lock:
+            self.requests += 1
+            failed = self.error_rate and self._random.random() < self.error_rate
+        if self._bucket is not None and not self._bucket.take():
+            return 429
+        if failed:
+            return 503
+        if self.latency:
+            time.sleep(self.latency)
+        return None
+
+    def changed(self, entity: dict) -> None:
+        """Queues a notification of the entity, called with the lock held"""
+        if self.subscriptions:
+            self._changes.put({**entity, "modifiedAt": _now()})
+
+    def subscribe(self, subscription: dict) -> None:
+        """Adds a subscription, called with the lock held"""
+        subscription["_patterns"] = [
+            (entity.get("type"), re.compile(entity.get("idPattern", "")))
+            for entity in subscription.get("entities", [])
+        ]
+        self.subscriptions[subscription["id"]] = subscription
+        if self._notifier is None:
+            self._notifier = threading.Thread(
+                target=self._notify, name="mock-notifier", daemon=True
+            )
+            self._notifier.start()
+
+    def _notify(self) -> None:
+        connections: Dict[str, http.client.HTTPConnection] = {}
+        while True:
+            changes = [self._changes.get()]
+            while len(changes) < 10 * NOTIFICATION_SIZE:
+                try:
+                    changes.append(self._changes.get_nowait())
+                except queue.Empty:
+                    break
+            with self.lock:
+                subscriptions = list(self.subscriptions.values())
+            for subscription in subscriptions:
+                data = [
+                    entity
+                    for entity in changes
+                    if any(
+                        (type_ is None or entity.get("type") == type_)
+                        and pattern.search(entity["id"])
+                        for type_, pattern in subscription["_patterns"]
+                    )
+                ]
+                for start in range(0, len(data), NOTIFICATION_SIZE):
+                    self._post(
+                        connections,
+                        subscription,
+                        data[start : start + NOTIFICATION_SIZE],
+                    )
+
+    def _post(self, connections, subscription, data) -> None:
+        url = urlsplit(subscription["notification"]["endpoint"]["uri"])
+        body = json.dumps(
+            {
+                "id": f"urn:ngsi-ld:Notification:{uuid.uuid4()}",
+                "type": "Notification",
+                "subscriptionId": subscription["id"],
+                "notifiedAt": _now(),
+                "data": data,
+            }
+        ).encode("utf-8")
+        for _ in range(2):
+            connection = connections.get(url.netloc)
+            if connection is None:
+                connection = connections[url.netloc] = http.client.HTTPConnection(
+                    url.netloc, timeout=10
+                )
+            try:
+                connection.request(
+                    "POST", url.path, body, {"Content-Type": "application/json"}
+                )
+                connection.getresponse().read()
+                with self.lock:
+                    self.notifications += 1
+                return
+            except (OSError, http.client.HTTPException):
+                # Dropped like a broker would after its retries, or reconnected
+                connection.close()
+                del connections[url.netloc]
+
+
+def _same_context(query: Optional[frozenset], entity: Optional[frozenset]) -> bool:
+    if not query or not entity:
+        return not query and not entity
+    return query <= entity
+
+
+def _problem(title: str, type_: str = "BadRequestData") -> dict:
+    return {"type": f"https://uri.etsi.org/ngsi-ld/errors/{type_}", "title": title}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, which stalls on delayed ACKs
+    disable_nagle_algorithm = True
+    broker: MockBroker
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        encoding = self.headers.get("Content-Encoding")
+        if encoding == "gzip":
+            body = gzip.decompress(body)
+        elif encoding == "deflate":
+            body = zlib.decompress(body)
+        return json.loads(body) if body else None
+
+    def _send(self, status: int, body=None, headers: Optional[dict] = None) -> None:
+        if body is None:
+            data = b""
+        elif isinstance(body, bytes):
+            data = body
+        else:
+            data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        if (
+            self.broker.gzip_responses
+            and len(data) >= 1024
+            and "gzip" in self.headers.get("Accept-Encoding", "")
+        ):
+            data = gzip.compress(data)
+            self.send_header("Content-Encoding", "gzip")
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if data:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, method: str) -> None:
+        body = self._read_body() if method in ("POST", "PATCH") else None
+        rejected = self.broker.admit()
+        if rejected is not None:
+            with self.broker.lock:
+                self.broker.rejected += 1
+            headers = {"Retry-After": "1"} if rejected == 429 else None
+            return self._send(rejected, _problem("Try again later"), headers)
+        url = urlsplit(self.path)
+        parts = [unquote(part) for part in url.path[len(API) :].strip("/").split("/")]
+        query = parse_qs(url.query)
+        if not url.path.startswith(API):
+            return self._send(404, _problem("Not found", "ResourceNotFound"))
+        if parts[0] == "entities":
+            return self._entities(method, parts[1:], query, body)
+        if parts[0] == "entityOperations" and method == "POST" and len(parts) == 2:
+            return self._batch(parts[1], body)
+        if parts[:2] == ["temporal", "entities"]:
+            return self._temporal(method, parts[2:], body)
+        if parts[0] == "subscriptions":
+            return self._subscriptions(method, parts[1:], body)
+        self._send(404, _problem("Not found", "ResourceNotFound"))
+
+    def _context(self, body=None):
+        """Contexts of a request: "@context" of the body, else the Link header"""
+        context = body.get("@context") if isinstance(body, dict) else None
+        if context is None:
+            match = re.match(r"\s*<([^>]*)>", self.headers.get("Link", ""))
+            context = match.group(1) if match else None
+        if context is None:
+            return None
+        urls = context if isinstance(context, list) else [context]
+        return frozenset(url for url in urls if isinstance(url, str)) - {CORE_CONTEXT}
+
+    def _entities(self, method, parts, query, body):
+        entities = self.broker.entities
+        lock = self.broker.lock
+        if not parts:
+            if method == "POST":
+                with lock:
+                    if body["id"] in entities:
+                        return self._send(409, _problem("Exists", "AlreadyExists"))
+                    entities[body["id"]] = json.dumps(body).encode("utf-8")
+                    self.broker.contexts[body["id"]] = self._context(body)
+                    self.broker.changed(body)
+                return self._send(
+                    201, headers={"Location": f"{API}/entities/{body['id']}"}
+                )
+            if method == "GET":
+                return self._query(query)
+        elif len(parts) == 1:
+            with lock:
+                entity = entities.get(parts[0])
+                if entity is not None and method == "DELETE":
+                    del entities[parts[0]]
+                    self.broker.contexts.pop(parts[0], None)
+            if entity is None:
+                return self._send(404, _problem("Not found", "ResourceNotFound"))
+            return self._send(200, entity) if method == "GET" else self._send(204)
+        elif parts[1] == "attrs" and method in ("POST", "PATCH", "DELETE"):
+            not_updated = []
+            with lock:
+                entity = entities.get(parts[0])
+                if entity is not None:
+                    entity = json.loads(entity)
+                    if method == "DELETE":
+                        entity.pop(parts[2], None)
+                    else:
+                        for key, value in body.items():
+                            if key == "@context":
+                                continue
+                            # Like a broker, PATCH does not create attributes
+                            if method == "PATCH" and key not in entity:
+                                not_updated.append(
+                                    {"attributeName": key, "reason": "Not found"}
+                                )
+                            else:
+                                entity[key] = value
+                    entities[parts[0]] = json.dumps(entity).encode("utf-8")
+                    self.broker.changed(entity)
+            if entity is None:
+                return self._send(404, _problem("Not found", "ResourceNotFound"))
+            if not_updated:
+                updated = [
+                    key
+                    for key in body
+                    if key != "@context"
+                    and key not in {n["attributeName"] for n in not_updated}
+                ]
+                return self._send(207, {"updated": updated, "notUpdated": not_updated})
+            return self._send(204)
+        self._send(404, _problem("Not found", "ResourceNotFound"))
+
+    def _query(self, query):
+        types = set(",".join(query.get("type", [])).split(",")) - {""}
+        id_pattern = re.compile(query.get("idPattern", [""])[0])
+        limit = int(query.get("limit", ["20"])[0])
+        offset = int(query.get("offset", ["0"])[0])
+        # Short type names only match entities created with the context of the query
+        context = self._context()
+        contexts = self.broker.contexts
+        with self.broker.lock:
+            found = [
+                entity
+                for id_, entity in self.broker.entities.items()
+                if (
+                    not types
+                    or json.loads(entity)["type"] in types
+                    and _same_context(context, contexts.get(id_))
+                )
+                and id_pattern.search(id_)
+            ]
+        headers = {}
+        if query.get("count", ["false"])[0] == "true":
+            headers["NGSILD-Results-Count"] = str(len(found))
+        page = found[offset : offset + limit]
+        self._send(200, b"[" + b",".join(page) + b"]", headers)
+
+    def _batch(self, operation, body):
+        entities = self.broker.entities
+        success, errors = [], []
+        with self.broker.lock:
+            for item in body:
+                id_ = item if operation == "delete" else item["id"]
+                if operation == "create" and id_ in entities:
+                    errors.append(
+                        {"entityId": id_, "error": _problem("Exists", "AlreadyExists")}
+                    )
+                elif operation in ("update", "delete") and id_ not in entities:
+                    errors.append(
+                        {
+                            "entityId": id_,
+                            "error": _problem("Not found", "ResourceNotFound"),
+                        }
+                    )
+                elif operation == "delete":
+                    del entities[id_]
+                    self.broker.contexts.pop(id_, None)
+                    success.append(id_)
+                else:
+                    if operation == "update":
+                        self._record_history(item)
+                        item = {**json.loads(entities[id_]), **item}
+                    else:
+                        self.broker.contexts[id_] = self._context(item)
+                    entities[id_] = json.dumps(item).encode("utf-8")
+                    self.broker.changed(item)
+                    success.append(id_)
+        if errors:
+            return self._send(207, {"success": success, "errors": errors})
+        if operation == "create":
+            return self._send(201, success)
+        self._send(204)
+
+    def _record_history(self, item):
+        """Appends the instances with observedAt, called with the lock held"""
+        created = False
+        history = self.broker.temporal.get(item["id"])
+        if history is None:
+            history = self.broker.temporal[item["id"]] = {
+                "id": item["id"],
+                "type": item["type"],
+            }
+            created = True
+        for key, value in item.items():
+            instances = value if isinstance(value, list) else [value]
+            instances = [
+                instance
+                for instance in instances
+                if isinstance(instance, dict) and "observedAt" in instance
+            ]
+            if instances:
+                history.setdefault(key, []).extend(instances)
+        return created
+
+    def _temporal(self, method, parts, body):
+        if method == "POST" and not parts:
+            with self.broker.lock:
+                created = self._record_history(body)
+            return self._send(201 if created else 204)
+        if method == "GET" and len(parts) == 1:
+            with self.broker.lock:
+                history = self.broker.temporal.get(parts[0])
+            if history is None:
+                return self._send(404, _problem("Not found", "ResourceNotFound"))
+            return self._send(200, history)
+        self._send(404, _problem("Not found", "ResourceNotFound"))
+
+    def _subscriptions(self, method, parts, body):
+        if method == "POST" and not parts:
+            body.setdefault("id", f"urn:ngsi-ld:Subscription:{uuid.uuid4()}")
+            with self.broker.lock:
+                if body["id"] in self.broker.subscriptions:
+                    return self._send(409, _problem("Exists", "AlreadyExists"))
+                self.broker.subscribe(body)
+            return self._send(
+                201, headers={"Location": f"{API}/subscriptions/{body['id']}"}
+            )
+        if method == "DELETE" and len(parts) == 1:
+            with self.broker.lock:
+                subscription = self.broker.subscriptions.pop(parts[0], None)
+            if subscription is None:
+                return self._send(404, _problem("Not found", "ResourceNotFound"))
+            return self._send(204)
+        self._send(404, _problem("Not found", "ResourceNotFound"))
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9090)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=None, help="requests/s")
+    parser.add_argument("--gzip-responses", action="store_true")
+    args = parser.parse_args()
+    broker = MockBroker(
+        args.host,
+        args.port,
+        args.latency,
+        args.error_rate,
+        args.rate_limit,
+        gzip_responses=args.gzip_responses,
+    )
+    print(f"Mock NGSI-LD broker listening on {broker.url}")
+    try:
+        broker._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
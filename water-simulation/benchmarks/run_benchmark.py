@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+
+"""End-to-end benchmark of water-simulation.py against a local mock broker.
+
+For every size a synthetic network is generated (see synthetic.py), imported
+into a fresh MockBroker and measured: wall time, entities/s, client-side request
+latency (p50/p99, from the request trace), peak RSS and CPU time of the importer
+process. Runs completely offline, so results are comparable between commits.
+
+Example:
+
+    python benchmarks/run_benchmark.py --sizes 10k,100k --latency 0.002 \\
+        --import-args "--batch-size 100 --concurrency 8 --stream"
+"""
+
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+from mockbroker import MockBroker
+from synthetic import generate, parse_size
+
+IMPORTER = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "water-simulation.py"
+)
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def read_latencies(trace_file):
+    if not os.path.exists(trace_file):
+        return []
+    with open(trace_file, "r", encoding="utf-8") as f:
+        return [json.loads(line)["elapsed_ms"] for line in f if line.strip()]
+
+
+def run(size, network, workdir, broker_options, import_args):
+    """Imports ``network`` into a fresh mock broker and returns the measurements"""
+    trace_file = os.path.join(workdir, f"trace-{size}.jsonl")
+    log_file = os.path.join(workdir, f"import-{size}.log")
+    if os.path.exists(trace_file):
+        os.remove(trace_file)
+    with MockBroker(**broker_options) as broker:
+        cmd = [
+            sys.executable,
+            IMPORTER,
+            "--endpoint",
+            broker.url,
+            "--scenario",
+            "benchmark",
+            "--journal",
+            os.path.join(workdir, f"journal-{size}.txt"),
+            "--trace-file",
+            trace_file,
+            "--trace-level",
+            "requests",
+            *import_args,
+            network,
+        ]
+        with open(log_file, "w") as log:
+            start = time.perf_counter()
+            process = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+            _, status, usage = os.wait4(process.pid, 0)
+            wall = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+        if process.returncode != 0:
+            raise RuntimeError(f"Import of {network} failed, see {log_file}")
+        entities = len(broker.entities)
+        requests, rejected = broker.requests, broker.rejected
+    latencies = read_latencies(trace_file)
+    return {
+        "size": size,
+        "entities": entities,
+        "wall_s": round(wall, 3),
+        "entities_per_s": round(entities / wall, 1),
+        "requests": requests,
+        "rejected": rejected,
+        "p50_ms": percentile(latencies, 0.50),
+        "p99_ms": percentile(latencies, 0.99),
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),
+        "cpu_s": round(usage.ru_utime + usage.ru_stime, 3),
+    }
+
+
+COLUMNS = (
+    ("size", "{}"),
+    ("entities", "{}"),
+    ("wall_s", "{:.2f}"),
+    ("entities_per_s", "{:.0f}"),
+    ("requests", "{}"),
+    ("rejected", "{}"),
+    ("p50_ms", "{:.2f}"),
+    ("p99_ms", "{:.2f}"),
+    ("peak_rss_mb", "{:.1f}"),
+    ("cpu_s", "{:.2f}"),
+)
+
+
+def print_table(results):
+    rows = [[name for name, _ in COLUMNS]]
+    for result in results:
+        rows.append(
+            [
+                "-" if result[name] is None else fmt.format(result[name])
+                for name, fmt in COLUMNS
+            ]
+        )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(COLUMNS))]
+    for row in rows:
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter, description=__doc__
+    )
+    parser.add_argument(
+        "--sizes",
+        help="Comma-separated numbers of nodes and links (default: 10k,100k,1m)",
+        type=str,
+        default="10k,100k,1m",
+    )
+    parser.add_argument(
+        "--import-args",
+        help="Additional arguments for water-simulation.py (default: none)",
+        type=str,
+        default="",
+    )
+    parser.add_argument(
+        "--workdir",
+        help="Directory for the generated networks, traces and logs, reused between runs (default: temporary)",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--latency",
+        help="Latency in seconds the mock broker adds to every request (default: 0)",
+        type=float,
+        default=0.0,
+    )
+    parser.add_argument(
+        "--error-rate",
+        help="Fraction of requests the mock broker answers with 503 (default: 0)",
+        type=float,
+        default=0.0,
+    )
+    parser.add_argument(
+        "--rate-limit",
+        help="Requests per second after which the mock broker answers with 429 (default: unlimited)",
+        type=float,
+        default=None,
+    )
+    parser.add_argument(
+        "--json",
+        help="Also write the results to this JSON file",
+        type=str,
+        default=None,
+    )
+    args = parser.parse_args()
+
+    tmp = None
+    if args.workdir is None:
+        tmp = tempfile.TemporaryDirectory(prefix="kb-benchmark-")
+        args.workdir = tmp.name
+    os.makedirs(args.workdir, exist_ok=True)
+    broker_options = {
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "rate_limit": args.rate_limit,
+        "seed": 42,
+    }
+    import_args = shlex.split(args.import_args)
+
+    results = []
+    try:
+        for size in args.sizes.split(","):
+            network = os.path.join(args.workdir, f"network-{size}.json")
+            if not os.path.exists(network):
+                print(f"Generating {network} ...", file=sys.stderr)
+                generate(network, parse_size(size))
+            print(f"Importing {size} ...", file=sys.stderr)
+            results.append(
+                run(size, network, args.workdir, broker_options, import_args)
+            )
+    finally:
+        if tmp is not None:
+            tmp.cleanup()
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {"import_args": import_args, **broker_options, "results": results},
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
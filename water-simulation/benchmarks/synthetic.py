@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+"""Generates synthetic WNTR networks by tiling copies of net1.json.
+
+Every copy gets its own node and link names (``<name>_<copy>``) and coordinates
+shifted on a grid, while curves and patterns are shared. The output is written
+element by element, so networks with millions of elements can be generated
+without holding them in memory.
+"""
+
+import argparse
+import json
+import math
+import os
+
+NET1 = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "net1.json"
+)
+HEADER_KEYS = ("version", "comment", "name", "options", "curves", "patterns")
+
+
+def parse_size(size: str) -> int:
+    """Parses element counts like "10k" or "1m" """
+    size = size.strip().lower()
+    factor = {"k": 1_000, "m": 1_000_000}.get(size[-1:], 1)
+    return int(float(size.rstrip("km")) * factor)
+
+
+def generate(path: str, elements: int, template: str = NET1) -> int:
+    """Writes a network with at least ``elements`` nodes and links to ``path``.
+
+    Returns the number of entities the importer creates from it (including the
+    curves, patterns and the network itself).
+    """
+    with open(template, "r") as f:
+        net = json.load(f)
+    per_copy = len(net["nodes"]) + len(net["links"])
+    copies = max(1, math.ceil(elements / per_copy))
+    columns = math.ceil(math.sqrt(copies))
+    xs = [node["coordinates"][0] for node in net["nodes"]]
+    ys = [node["coordinates"][1] for node in net["nodes"]]
+    width = (max(xs) - min(xs)) * 1.1 or 1.0
+    height = (max(ys) - min(ys)) * 1.1 or 1.0
+
+    def copies_of(section):
+        for copy in range(copies):
+            dx, dy = (copy % columns) * width, (copy // columns) * height
+            for element in net[section]:
+                element = dict(element, name=f"{element['name']}_{copy}")
+                if section == "nodes":
+                    x, y = element["coordinates"]
+                    element["coordinates"] = [x + dx, y + dy]
+                else:
+                    element["start_node_name"] += f"_{copy}"
+                    element["end_node_name"] += f"_{copy}"
+                yield element
+
+    with open(path, "w") as f:
+        f.write("{")
+        for key in HEADER_KEYS:
+            f.write(f"{json.dumps(key)}: {json.dumps(net[key])}, ")
+        for i, section in enumerate(("nodes", "links")):
+            f.write(f'{", " if i else ""}"{section}": [')
+            for j, element in enumerate(copies_of(section)):
+                f.write((",\n" if j else "\n") + json.dumps(element))
+            f.write("\n]")
+        f.write("}\n")
+    return copies * per_copy + len(net["curves"]) + len(net["patterns"]) + 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("size", type=str, help='number of nodes and links, e.g. "100k"')
+    parser.add_argument("output", type=str, help="output file (JSON)")
+    args = parser.parse_args()
+    entities = generate(args.output, parse_size(args.size))
+    print(f"Wrote {args.output} ({entities} entities)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+import argparse
+import re
+
+from kbscenariotools.argparse import add_default_args
+from kbscenariotools.converters import EPANET_CONVERTERS
+from kbscenariotools.endpoint import ScenarioManagerEndpoint
+from kbscenariotools.export import (
+    EXPORT_FORMATS,
+    count_entities,
+    iter_pages,
+    open_writer,
+)
+from kbscenariotools.metrics import Metrics
+from tqdm import tqdm
+
+parser = argparse.ArgumentParser(
+    formatter_class=argparse.RawTextHelpFormatter,
+    description="""
+Export helper for water management simulation data.
+
+Snapshots the NGSI-LD entities of the broker to a JSON Lines (optionally .gz) or
+Parquet file. The entities are queried per type with limit/offset paging; the
+number of entities per type is asked first (count=true), so the pages can be
+fetched in parallel. Only a few pages are held in memory at a time.
+
+""",
+)
+add_default_args(parser)
+parser.add_argument(
+    "output",
+    help="Output file, .jsonl, .jsonl.gz or .parquet",
+    type=str,
+    action="store",
+    metavar="OUTPUT",
+)
+parser.add_argument(
+    "--type",
+    help="Entity types to export, comma-separated (default: the types created by water-simulation.py)",
+    type=str,
+    action="store",
+    default=",".join(EPANET_CONVERTERS.types + ["WaterNetwork"]),
+)
+parser.add_argument(
+    "--prefix",
+    help="Only export entities imported with this prefix (see water-simulation.py, default: all)",
+    type=str,
+    action="store",
+    default="",
+)
+parser.add_argument(
+    "--format",
+    help="Output format (default: from the file extension)",
+    type=str,
+    action="store",
+    choices=EXPORT_FORMATS,
+    default=None,
+)
+parser.add_argument(
+    "--page-size",
+    help="Entities per request (limit), at most what the broker allows (default: 1000)",
+    type=int,
+    action="store",
+    default=1000,
+)
+parser.add_argument(
+    "--concurrency",
+    help="Number of pages fetched at the same time (default: 4)",
+    type=int,
+    action="store",
+    default=4,
+)
+args = parser.parse_args()
+args.pool_size = max(args.pool_size, args.concurrency)
+
+metrics = Metrics.from_args(args)
+endpoint = ScenarioManagerEndpoint.from_args(args, metrics)
+
+params = {}
+if args.prefix:
+    params["idPattern"] = f"^urn:ngsi:[^:]+:{re.escape(args.prefix)}"
+
+writer = open_writer(args.output, args.format, endpoint.serializer)
+
+counts = {}
+print("-[ Export ]-------------------------")
+for type_ in args.type.split(","):
+    counts[type_] = count_entities(endpoint, type_, params)
+    print(f"{'?' if counts[type_] is None else counts[type_]:>6} {type_}")
+known = [count for count in counts.values() if count is not None]
+total = sum(known) if len(known) == len(counts) else None
+print("------------------------------------")
+print(f"{'?' if total is None else total:>6} entities total\n")
+
+try:
+    with tqdm(total=total, unit="entities") as pbar:
+        for entities in iter_pages(
+            endpoint, counts, args.page_size, params, args.concurrency
+        ):
+            writer.write(entities)
+            pbar.update(len(entities))
+finally:
+    writer.close()
+endpoint.close()
+if metrics is not None:
+    metrics.report()
+print(f"Wrote {args.output}")
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import sys
+from datetime import datetime, timedelta
+
+from kbscenariotools.argparse import add_default_args
+from kbscenariotools.batch import BatchResult
+from kbscenariotools.converters import EPANET_CONTEXT, urn_factory
+from kbscenariotools.endpoint import ScenarioManagerEndpoint
+from kbscenariotools.idindex import IdTypeIndex
+from kbscenariotools.metrics import Metrics
+from kbscenariotools.results import (
+    RESULTS_MODES,
+    TEMPORAL_ENTITIES_PATH,
+    ResultsEncoder,
+    load_results,
+    observed_at,
+    report_times,
+)
+from kbscenariotools.serializer import context_fragment
+from kbscenariotools.uploader import ConcurrentUploader
+from tqdm import tqdm
+
+parser = argparse.ArgumentParser(
+    formatter_class=argparse.RawTextHelpFormatter,
+    description="""
+Results ingestion for water management simulation data.
+
+Uploads the time series of a WNTR simulation (node demand, head, pressure and
+quality, link flow, velocity and headloss) for the entities imported by
+water-simulation.py. The results are read from a .npz file or a directory of
+CSV files, see kbscenariotools/results.py for how to write them from WNTR.
+Every value gets an observedAt timestamp from the report_start and
+report_timestep of the network options.
+
+Modes:
+  temporal  One request per entity with all its instances, through the NGSI-LD
+            temporal API (POST /ngsi-ld/v1/temporal/entities/).
+  batch     Batch updates (entityOperations/update) of many entities, one step
+            at a time, for brokers recording the history of updates.
+
+""",
+)
+add_default_args(parser)
+parser.add_argument(
+    "network_json",
+    help="Input file from the simulation (JSON), as imported by water-simulation.py",
+    type=str,
+    action="store",
+    metavar="NETWORK_JSON",
+)
+parser.add_argument(
+    "results",
+    help="Simulation results, a .npz file or a directory of CSV files",
+    type=str,
+    action="store",
+    metavar="RESULTS",
+)
+parser.add_argument(
+    "--prefix",
+    help="Prefix for NGSI identifiers, as used for the import (default: None)",
+    type=str,
+    action="store",
+    default="",
+)
+parser.add_argument(
+    "--mode",
+    help="How the values are sent (default: temporal)",
+    type=str,
+    action="store",
+    choices=RESULTS_MODES,
+    default="temporal",
+)
+parser.add_argument(
+    "--start-date",
+    help="Day the simulation starts, YYYY-MM-DD in UTC; start_clocktime is added",
+    type=str,
+    action="store",
+    required=True,
+)
+parser.add_argument(
+    "--attributes",
+    help="Comma-separated attributes to upload, e.g. pressure,flow (default: all in the results)",
+    type=str,
+    action="store",
+    default=None,
+)
+parser.add_argument(
+    "--precision",
+    help="Decimals the values are rounded to, shortens the requests (default: all)",
+    type=int,
+    action="store",
+    default=None,
+)
+parser.add_argument(
+    "--steps-per-request",
+    help="Maximum number of steps per temporal request, 0 for all (default: 0)",
+    type=int,
+    action="store",
+    default=0,
+)
+parser.add_argument(
+    "--batch-size",
+    help="Number of entities per batch update (default: 500)",
+    type=int,
+    action="store",
+    default=500,
+)
+parser.add_argument(
+    "--concurrency",
+    help="Maximum number of requests in flight at the same time (default: 8)",
+    type=int,
+    action="store",
+    default=8,
+)
+args = parser.parse_args()
+if args.batch_size < 1:
+    parser.error("--batch-size must be at least 1")
+args.pool_size = max(args.pool_size, args.concurrency)
+
+with open(args.network_json, "r") as f:
+    data = json.load(f)
+time_options = data["options"]["time"]
+element_types = {
+    "node": IdTypeIndex.from_items(
+        (node["name"], node["node_type"]) for node in data["nodes"]
+    ),
+    "link": IdTypeIndex.from_items(
+        (link["name"], link["link_type"]) for link in data["links"]
+    ),
+}
+del data
+
+tables = load_results(args.results)
+if args.attributes:
+    selected = args.attributes.split(",")
+    tables = [table for table in tables if table.attribute in selected]
+    if not tables:
+        parser.error(f"None of the attributes {args.attributes} is in the results")
+
+try:
+    start_date = datetime.strptime(args.start_date, "%Y-%m-%d")
+except ValueError:
+    parser.error(f"--start-date {args.start_date} is not a date like 2024-05-01")
+start = start_date + timedelta(seconds=time_options.get("start_clocktime", 0.0))
+timestamps = observed_at(start, report_times(time_options, tables))
+
+make_urn = urn_factory(args.prefix)
+
+
+def resolve(kind, name):
+    type_ = element_types[kind].get(name)
+    if type_ is None:
+        raise ValueError(f"The {kind} {name} of the results is not in the network.")
+    return make_urn(name, type_), type_
+
+
+metrics = Metrics.from_args(args)
+endpoint = ScenarioManagerEndpoint.from_args(args, metrics)
+encoder = ResultsEncoder(
+    tables,
+    timestamps,
+    resolve,
+    endpoint.serializer,
+    context_fragment(EPANET_CONTEXT, endpoint.serializer),
+    args.precision,
+)
+
+print("-[ Results ]------------------------")
+for table in tables:
+    print(f"{table.values.shape[1]:6} {table.kind}s with {table.attribute}")
+print("------------------------------------")
+print(f"{encoder.steps:6} steps, {timestamps[0]} to {timestamps[-1]}")
+print(f"{len(encoder.ids):6} entities\n")
+
+
+def post_temporal(entity_id, payload):
+    status, res = endpoint.post(TEMPORAL_ENTITIES_PATH, payload, "application/ld+json")
+    if status not in (201, 204):
+        raise RuntimeError(
+            f"Got status code {status} uploading the results of {entity_id}: {res}"
+        )
+    pbar.update(1)
+
+
+def post_batches(steps):
+    # The steps of a block are sent one after the other, the last one stays
+    for entity_ids, entities in steps:
+        status, res = endpoint.batch("update", entities)
+        result = BatchResult.from_response(status, res, entity_ids)
+        if not result.ok:
+            entity_id, error = next(iter(result.errors.items()))
+            raise RuntimeError(
+                f"Batch update failed for {len(result.errors)} entities "
+                f"(status {status}), e.g. {entity_id}: {error}"
+            )
+        pbar.update(1)
+
+
+if args.mode == "temporal":
+    total = encoder.count_temporal(args.steps_per_request)
+    requests = encoder.temporal(args.steps_per_request)
+    send = post_temporal
+else:
+    total = encoder.count_batches(args.batch_size)
+    requests = ((steps,) for steps in encoder.batch(args.batch_size))
+    send = post_batches
+
+try:
+    with tqdm(total=total, unit="requests") as pbar:
+        with ConcurrentUploader(args.concurrency) as uploader:
+            for request in requests:
+                uploader.submit(send, *request)
+except RuntimeError as error:
+    sys.exit(str(error))
+finally:
+    endpoint.close()
+    if metrics is not None:
+        metrics.report()
+print("Done.")
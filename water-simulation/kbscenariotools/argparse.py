@@ -1,5 +1,9 @@
 import argparse
 
+from .endpoint import COMPRESSIONS
+from .serializer import available_serializers
+from .trace import TRACE_LEVELS
+
 
 def add_default_args(
     parser: argparse.ArgumentParser, scenario_id=False, trace_id=False
@@ -27,6 +31,131 @@ def add_default_args(
         action="store",
         default="",
     )
+    parser.add_argument(
+        "--pool-size",
+        help="Number of persistent HTTP connections kept open to the endpoint (default: 10)",
+        type=int,
+        action="store",
+        default=10,
+    )
+    parser.add_argument(
+        "--retries",
+        help="How often failed connections and 429/503 responses are retried (default: 3)",
+        type=int,
+        action="store",
+        default=3,
+    )
+    parser.add_argument(
+        "--retry-backoff",
+        help="Backoff factor in seconds between retries, doubled per attempt (default: 0.5)",
+        type=float,
+        action="store",
+        default=0.5,
+    )
+    parser.add_argument(
+        "--timeout",
+        help="Timeout in seconds per request, 0 to wait forever (default: 30)",
+        type=float,
+        action="store",
+        default=30.0,
+    )
+    parser.add_argument(
+        "--rate-limit",
+        help="Maximum requests per second sent to the endpoint (default: 0, unlimited)",
+        type=float,
+        action="store",
+        default=0.0,
+    )
+    parser.add_argument(
+        "--adaptive",
+        help="Adapt the requests in flight (up to --pool-size) to the latency and 429/5xx answers of the endpoint",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--serializer",
+        help="JSON library used for the request and response bodies, auto picks orjson or msgspec when installed (default: auto)",
+        type=str,
+        action="store",
+        choices=available_serializers(),
+        default="auto",
+    )
+    parser.add_argument(
+        "--compress",
+        help="Content-Encoding for request bodies, saving bandwidth on slow links (default: none)",
+        type=str,
+        action="store",
+        choices=COMPRESSIONS,
+        default="none",
+    )
+    parser.add_argument(
+        "--compress-min-size",
+        help="Only compress request bodies of at least this many bytes (default: 1024)",
+        type=int,
+        action="store",
+        default=1024,
+    )
+    parser.add_argument(
+        "--compress-level",
+        help="Compression level from 1 (fastest) to 9 (smallest) (default: 6)",
+        type=int,
+        action="store",
+        choices=range(1, 10),
+        metavar="{1..9}",
+        default=6,
+    )
+    parser.add_argument(
+        "--trace-file",
+        help="Write a JSON Lines debug trace of the endpoint requests to this file (default: no trace)",
+        type=str,
+        action="store",
+        default=None,
+    )
+    parser.add_argument(
+        "--trace-level",
+        help="What to trace: failed requests with bodies (errors), all requests without bodies (requests) or with bodies (all) (default: errors)",
+        type=str,
+        action="store",
+        choices=TRACE_LEVELS,
+        default="errors",
+    )
+    parser.add_argument(
+        "--trace-max-size",
+        help="Size in MB after which the trace file is rotated (default: 100)",
+        type=float,
+        action="store",
+        default=100.0,
+    )
+    parser.add_argument(
+        "--trace-backups",
+        help="Number of rotated trace files to keep (default: 5)",
+        type=int,
+        action="store",
+        default=5,
+    )
+    parser.add_argument(
+        "--trace-gzip",
+        help="Compress the trace files with gzip",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--metrics",
+        help="Print a summary of the time spent per stage and entity type at the end",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--metrics-json",
+        help="Write the stage timings and counters to this JSON file (default: none)",
+        type=str,
+        action="store",
+        default=None,
+    )
+    parser.add_argument(
+        "--metrics-prometheus",
+        help="Write the stage timings and counters to this file in the Prometheus text format, e.g. for the textfile collector or a pushgateway (default: none)",
+        type=str,
+        action="store",
+        default=None,
+    )
     if scenario_id or trace_id:
         parser.add_argument(
             "--scenario",
@@ -0,0 +1,84 @@
+import json
+from typing import Dict, List, Optional, Sequence, Union
+
+BATCH_OPERATIONS = ("create", "upsert")
+
+
+class BatchResult:
+    """Outcome of a single ``/ngsi-ld/v1/entityOperations/*`` request, per entity id"""
+
+    def __init__(
+        self,
+        status: int,
+        succeeded: List[str],
+        errors: Dict[str, str],
+        existing: Optional[List[str]] = None,
+    ):
+        self.status = status
+        self.succeeded = succeeded
+        self.errors = errors
+        # Ids of the errors which only say that the entity already exists (create)
+        self.existing = existing or []
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    @classmethod
+    def from_response(
+        cls,
+        status: int,
+        body: Optional[Union[dict, list, str]],
+        entity_ids: Sequence[str],
+    ) -> "BatchResult":
+        """Parses the broker response of a batch operation.
+
+        Brokers answer with 201 and a list of created ids (create), 204 without a body
+        (upsert/update), or 207/400 with a ``BatchOperationResult`` holding ``success``
+        and ``errors`` lists. Anything else is treated as a failure of the whole batch.
+        """
+        if isinstance(body, str):
+            try:
+                body = json.loads(body)
+            except ValueError:
+                pass
+        if isinstance(body, dict) and ("success" in body or "errors" in body):
+            errors = {
+                error["entityId"]: _error_message(error.get("error"))
+                for error in body.get("errors") or []
+            }
+            existing = [
+                error["entityId"]
+                for error in body.get("errors") or []
+                if _already_exists(error.get("error"))
+            ]
+            succeeded = [id_ for id_ in body.get("success") or [] if id_ not in errors]
+            return cls(status, succeeded, errors, existing)
+        if 200 <= status <= 299:
+            return cls(status, list(entity_ids), {})
+        message = _error_message(body) or f"HTTP {status}"
+        return cls(status, [], {id_: message for id_ in entity_ids})
+
+    def accept_existing(self) -> None:
+        """Counts the entities which already exist as succeeded, e.g. when resuming"""
+        for id_ in self.existing:
+            if self.errors.pop(id_, None) is not None:
+                self.succeeded.append(id_)
+        self.existing = []
+
+
+def _already_exists(error) -> bool:
+    if not isinstance(error, dict):
+        return False
+    return error.get("status") == 409 or str(error.get("type", "")).endswith(
+        "/AlreadyExists"
+    )
+
+
+def _error_message(error) -> str:
+    if isinstance(error, dict):
+        parts = [str(error[key]) for key in ("title", "detail") if error.get(key)]
+        if parts:
+            return ": ".join(parts)
+        return json.dumps(error)
+    return "" if error is None else str(error)
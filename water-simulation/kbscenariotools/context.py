@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+
+CONTEXT_MODES = ("inline", "link", "expanded")
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "kbscenariotools",
+    "contexts",
+)
+
+
+def link_header(url: str) -> str:
+    """The Link header referencing a JSON-LD context, for application/json bodies"""
+    return f'<{url}>; rel="http://www.w3.org/ns/json-ld#context"; type="application/ld+json"'
+
+
+class ContextCache:
+    """Local copies of remote JSON-LD context documents.
+
+    A context is downloaded once and then read from ``cache_dir``. Copies older
+    than ``max_age`` seconds are revalidated with their ETag, and when the server
+    cannot be reached the cached copy is used as it is. ``files`` maps context
+    URLs to vendored documents, which are used without any request.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        max_age: float = 86400.0,
+        files: Optional[Dict[str, str]] = None,
+        timeout: float = 10.0,
+    ):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.files = files or {}
+        self.timeout = timeout
+
+    def _path(self, url: str) -> str:
+        return os.path.join(
+            self.cache_dir, hashlib.sha1(url.encode("utf-8")).hexdigest()
+        )
+
+    def get(self, url: str, refresh: bool = False) -> Any:
+        """Returns the context document at ``url``"""
+        if url in self.files:
+            with open(self.files[url], "r", encoding="utf-8") as f:
+                return json.load(f)
+        path = self._path(url)
+        cached = os.path.exists(path + ".jsonld")
+        if cached and not refresh:
+            if time.time() - os.path.getmtime(path + ".jsonld") < self.max_age:
+                return self._read(path)
+        headers = {"Accept": "application/ld+json, application/json"}
+        if cached and os.path.exists(path + ".etag"):
+            with open(path + ".etag", "r") as f:
+                headers["If-None-Match"] = f.read().strip()
+        # Only needed on a cache miss, keeps the import of this module light
+        import requests
+
+        try:
+            response = requests.get(url, headers=headers, timeout=self.timeout)
+        except requests.RequestException:
+            if cached:
+                return self._read(path)
+            raise
+        if response.status_code == 304 and cached:
+            os.utime(path + ".jsonld")
+            return self._read(path)
+        if response.status_code != 200:
+            if cached:
+                return self._read(path)
+            raise RuntimeError(
+                f"Got status code {response.status_code} fetching context {url}."
+            )
+        document = response.json()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Written to a temporary file first, concurrent imports may read the cache
+        with open(path + ".tmp", "wb") as f:
+            f.write(response.content)
+        os.replace(path + ".tmp", path + ".jsonld")
+        if response.headers.get("ETag"):
+            with open(path + ".etag", "w") as f:
+                f.write(response.headers["ETag"])
+        return document
+
+    @staticmethod
+    def _read(path: str) -> Any:
+        with open(path + ".jsonld", "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+class ContextExpander:
+    """Expands the attribute names and types of entities to full IRIs.
+
+    Only term definitions (strings, compact IRIs and ``{"@id": ...}``) and
+    ``@vocab`` are supported, which is what the Smart Data Models contexts use.
+    Terms the context does not define are left as they are, for the broker to
+    expand with the core context. Expanded entities can be sent as plain
+    application/json without any context.
+    """
+
+    def __init__(self, terms: Dict[str, str]):
+        self.terms = terms
+
+    @classmethod
+    def load(cls, url: str, cache: ContextCache) -> "ContextExpander":
+        definitions: Dict[str, Any] = {}
+        cls._collect(cache.get(url), cache, definitions, set())
+        vocab = definitions.get("@vocab")
+        terms = {}
+        for term, definition in definitions.items():
+            if term.startswith("@"):
+                continue
+            if isinstance(definition, dict):
+                definition = definition.get("@id")
+            if not isinstance(definition, str):
+                continue
+            terms[term] = cls._resolve(definition, definitions, vocab)
+        return cls(terms)
+
+    @classmethod
+    def _collect(cls, document, cache, definitions, seen) -> None:
+        context = document.get("@context", document)
+        for item in context if isinstance(context, list) else [context]:
+            if isinstance(item, str):
+                if item not in seen:
+                    seen.add(item)
+                    cls._collect(cache.get(item), cache, definitions, seen)
+            elif isinstance(item, dict):
+                definitions.update(item)
+
+    @staticmethod
+    def _resolve(value: str, definitions: Dict[str, Any], vocab) -> str:
+        prefix, colon, suffix = value.partition(":")
+        if colon and not suffix.startswith("//"):
+            base = definitions.get(prefix)
+            if isinstance(base, dict):
+                base = base.get("@id")
+            if isinstance(base, str):
+                return base + suffix
+        if not colon and vocab:
+            return vocab + value
+        return value
+
+    def expand(self, entity: dict) -> dict:
+        terms = self.terms
+        expanded = {}
+        for key, value in entity.items():
+            if key == "@context":
+                continue
+            if key == "type":
+                value = terms.get(value, value)
+            elif key != "id":
+                key = terms.get(key, key)
+            expanded[key] = value
+        return expanded
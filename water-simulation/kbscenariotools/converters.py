@@ -0,0 +1,411 @@
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+EPANET_CONTEXT = "https://raw.githubusercontent.com/smart-data-models/dataModel.WaterDistributionManagementEPANET/master/context.jsonld"
+
+# Returned by a field converter to leave the attribute out
+SKIP = object()
+
+UrnFactory = Callable[..., str]
+Converter = Callable[[dict], dict]
+
+
+def urn_factory(prefix: str = "") -> UrnFactory:
+    """Returns ``make_urn(id, type_=None, id_type_map=None)`` for a URN prefix.
+
+    Prefix "Test" makes "urn:ngsi:Pipe:TestPipe42" from "Pipe42". Without a type,
+    it is looked up in ``id_type_map``.
+    """
+
+    def make_urn(id, type_=None, id_type_map=None):
+        if type_ is None:
+            if id_type_map is None:
+                raise ValueError("id_type_map cannot be None.")
+            type_ = id_type_map[id]
+        return f"urn:ngsi:{type_}:{prefix}{id}"
+
+    return make_urn
+
+
+class Field(NamedTuple):
+    """Maps one attribute of a WNTR element to one NGSI-LD attribute.
+
+    ``convert`` is applied to non-null values. With ``merge`` it returns a dict of
+    attributes instead of a single value. ``relationship`` marks fields holding the
+    name of another node, which are converted to its URN. A type as
+    ``relationship`` names an element of that type instead (e.g. "Pattern"),
+    after ``convert`` extracted the name. ``required`` fields raise a
+    ``ValueError`` when missing or null. Fields with an ``option`` are only
+    converted when ``compile()`` gets that option.
+    """
+
+    source: str
+    target: Optional[str] = None
+    convert: Optional[Callable[[Any], Any]] = None
+    required: bool = False
+    merge: bool = False
+    relationship: Union[bool, str] = False
+    option: Optional[str] = None
+
+
+class ConverterRegistry:
+    """Mapping tables per NGSI-LD type, compiled into one conversion function each"""
+
+    def __init__(self):
+        self._tables: Dict[str, List[Field]] = {}
+
+    def register(self, type_: str, *tables: Iterable[Field]) -> None:
+        self._tables[type_] = [field for table in tables for field in table]
+
+    @property
+    def types(self) -> List[str]:
+        return list(self._tables)
+
+    def compile(
+        self,
+        type_: str,
+        make_urn: UrnFactory,
+        id_type_map: Optional[Mapping[str, str]] = None,
+        static: Optional[Mapping[str, Any]] = None,
+        options: Iterable[str] = (),
+    ) -> Converter:
+        """Returns a function converting one WNTR element of ``type_``.
+
+        ``make_urn(name, type_=None, id_type_map=None)`` builds the URNs, the
+        ``id_type_map`` resolves the types of related nodes. ``static`` attributes
+        are the same for every element (e.g. from the network options); null
+        values are left out. ``options`` enable the optional fields (e.g.
+        ``SERIES_REFERENCES``).
+        """
+        options = frozenset(options)
+
+        def resolve(name):
+            return make_urn(name, id_type_map=id_type_map)
+
+        def typed_resolver(target_type, extract):
+            def resolve_typed(value):
+                if extract is not None:
+                    value = extract(value)
+                    if value is SKIP or value is None:
+                        return SKIP
+                return make_urn(value, target_type)
+
+            return resolve_typed
+
+        def field_converter(field):
+            if field.relationship is True:
+                return resolve
+            if field.relationship:
+                return typed_resolver(field.relationship, field.convert)
+            return field.convert
+
+        fields = tuple(
+            (
+                field.source,
+                field.target or field.source,
+                field_converter(field),
+                field.required,
+                field.merge,
+            )
+            for field in self._tables[type_]
+            if field.option is None or field.option in options
+        )
+        static_items = tuple(
+            (key, value) for key, value in (static or {}).items() if value is not None
+        )
+
+        def convert(data_in: dict) -> dict:
+            data_out = {"id": make_urn(data_in["name"], type_), "type": type_}
+            get = data_in.get
+            for source, target, conv, required, merge in fields:
+                value = get(source)
+                if value is None:
+                    if required:
+                        raise ValueError(
+                            f"{type_} {data_in['name']}: {source} must not be empty."
+                        )
+                    continue
+                if conv is not None:
+                    value = conv(value)
+                    if value is SKIP:
+                        continue
+                if merge:
+                    data_out.update(value)
+                else:
+                    data_out[target] = value
+            for key, value in static_items:
+                data_out[key] = value
+            return data_out
+
+        return convert
+
+
+def observe(data):
+    return {"value": data}
+
+
+def geojson_point(coordinates):
+    if type(coordinates) == list and len(coordinates) == 2:
+        return {"type": "Point", "coordinates": coordinates}
+    return SKIP
+
+
+def geojson_linestring(coordinates):
+    if (
+        type(coordinates) == list
+        and len(coordinates) >= 2
+        and all(type(c) == list and len(c) == 2 for c in coordinates)
+    ):
+        return {"type": "LineString", "coordinates": coordinates}
+    return SKIP
+
+
+def demand_pattern(demand_timeseries_list):
+    """Name of the pattern of the first demand category which has one.
+
+    The field emits the URN of that Pattern as ``demandPattern``; the base demands
+    and the patterns of further categories are not converted. Junctions without
+    a demand pattern get no ``demandPattern``.
+    """
+    for demand in demand_timeseries_list:
+        if demand.get("pattern_name") is not None:
+            return demand["pattern_name"]
+    return SKIP
+
+
+def upper(value):
+    return value.upper()
+
+
+# Option of the relationships from nodes and links to their patterns and curves.
+# Off by default, as they change the entities of existing imports.
+SERIES_REFERENCES = "series_references"
+
+# Keys of the nodes and links naming a pattern or a curve
+PATTERN_REFERENCES = ("head_pattern_name", "speed_pattern_name", "energy_pattern")
+CURVE_REFERENCES = ("vol_curve_name", "pump_curve_name", "headloss_curve_name")
+
+CURVE_TYPES = {
+    "HEAD": "FLOW-HEAD",
+    "EFFICIENCY": "FLOW-EFFICIENCY",
+    "HEADLOSS": "FLOW-HEADLOSS",
+    "VOLUME": "LEVEL-VOLUME",
+}
+
+
+def curve_type(value):
+    if value not in CURVE_TYPES:
+        raise ValueError(
+            f"curve_type {value} not valid. Must be one HEAD, EFFICIENCY, HEADLOSS of VOLUME"
+        )
+    return CURVE_TYPES[value]
+
+
+def data_series(points):
+    """Splits ``[[x, y], ...]`` into the xData and yData attributes"""
+    if type(points) == list and all(
+        (isinstance(p, list) and len(p) == 2) for p in points
+    ):
+        return {"xData": [p[0] for p in points], "yData": [p[1] for p in points]}
+    return SKIP
+
+
+NODE_FIELDS = (
+    Field("coordinates", "location", geojson_point),
+    Field("initial_quality", "initialQuality", observe),
+    Field("name"),
+    Field("tag"),
+)
+
+LINK_FIELDS = (
+    Field("start_node_name", "startsAt", relationship=True),
+    Field("end_node_name", "endsAt", relationship=True),
+    Field("initial_status", "initialStatus", upper, required=True),
+    # Only set by the spatial stage (see spatial.locate())
+    Field("coordinates", "location", geojson_linestring),
+    Field("name"),
+    Field("tag"),
+    # Fields which should go to simulation metadata
+    #   - initial_setting (except for valves)
+)
+
+DOCUMENT_FIELDS = (
+    Field("dataProvider"),
+    Field("dateCreated"),
+    Field("dateModified"),
+    Field("description"),
+    Field("source"),
+)
+
+EPANET_CONVERTERS = ConverterRegistry()
+EPANET_CONVERTERS.register(
+    "Junction",
+    NODE_FIELDS,
+    [
+        Field("elevation"),
+        Field("emitter_coefficient", "emitterCoefficient"),
+        Field(
+            "demand_timeseries_list",
+            "demandPattern",
+            demand_pattern,
+            relationship="Pattern",
+            option=SERIES_REFERENCES,
+        ),
+        # Fields which should go to simulation metadata
+        #   - minimum_pressure
+        #   - pressure_exponent
+        #   - required_pressure
+    ],
+)
+EPANET_CONVERTERS.register(
+    "Reservoir",
+    NODE_FIELDS,
+    [
+        Field("base_head", "reservoirHead"),
+        Field(
+            "head_pattern_name",
+            "headPattern",
+            relationship="Pattern",
+            option=SERIES_REFERENCES,
+        ),
+    ],
+)
+EPANET_CONVERTERS.register(
+    "Tank",
+    NODE_FIELDS,
+    [
+        Field("bulk_coeff", "bulkReactionCoefficient"),
+        Field("diameter", "nominalDiameter"),
+        Field("elevation"),
+        Field("init_level", "initial_level"),
+        Field("initial_quality", "initialQuality"),
+        Field("max_level", "maxLevel"),
+        Field("min_level", "minLevel"),
+        Field("min_vol", "minVolume"),
+        Field("mixing_fraction", "mixingFraction"),
+        Field(
+            "vol_curve_name",
+            "volumeCurve",
+            relationship="Curve",
+            option=SERIES_REFERENCES,
+        ),
+        # Fields which should go to simulation metadata
+        #   - overflow (boolean)
+        # Ignored fields:
+        #   - mixing_model (quality related, irrelevant for us)
+    ],
+)
+EPANET_CONVERTERS.register(
+    "Pipe",
+    LINK_FIELDS,
+    [
+        Field("bulk_coeff", "bulkCoeff"),
+        Field("diameter"),
+        Field("length"),
+        Field("minor_loss", "minorLoss"),
+        Field("roughness"),
+        Field("wall_coeff", "wallCoeff"),
+        # Ignored Fields:
+        #   - check_valve (missing equivalent in the SMD)
+    ],
+)
+EPANET_CONVERTERS.register(
+    "Pump",
+    LINK_FIELDS,
+    [
+        Field("base_speed", "speed"),
+        Field("energy_price", "energyPrice"),
+        Field(
+            "pump_curve_name",
+            "pumpCurve",
+            relationship="Curve",
+            option=SERIES_REFERENCES,
+        ),
+        Field(
+            "speed_pattern_name",
+            "speedPattern",
+            relationship="Pattern",
+            option=SERIES_REFERENCES,
+        ),
+        Field(
+            "energy_pattern",
+            "energyPattern",
+            relationship="Pattern",
+            option=SERIES_REFERENCES,
+        ),
+        # Ignored Fields:
+        #   - efficiency (can be computed using effiCurve)
+        #   - pump_type (distinction between HeadPump and PowerPump. We only use HeadPump, as PowerPumps are a simplification)
+        #   - power (parameter related to PowerPumps, so we can ignore it when assuming HeadPumps)
+    ],
+)
+EPANET_CONVERTERS.register(
+    "Valve",
+    LINK_FIELDS,
+    [
+        Field("valve_type", "valveType"),
+        Field("diameter"),
+        Field("minor_loss", "minorLoss"),
+        Field("initial_setting", "setting"),
+        Field(
+            "headloss_curve_name",
+            "headlossCurve",
+            relationship="Curve",
+            option=SERIES_REFERENCES,
+        ),
+    ],
+)
+EPANET_CONVERTERS.register(
+    "Curve",
+    [
+        Field("curve_type", "curveType", curve_type, required=True),
+        *DOCUMENT_FIELDS,
+        Field("points", convert=data_series, merge=True),
+    ],
+)
+EPANET_CONVERTERS.register(
+    "Pattern",
+    [
+        Field("multipliers"),
+        *DOCUMENT_FIELDS,
+        # timeStep and startTime are static attributes from the network options
+    ],
+)
+
+
+def pattern_static(options: dict) -> Dict[str, Any]:
+    """Attributes every Pattern gets from the time options of the network"""
+    time = options["time"]
+    # Both in seconds, as in the WNTR options; startTime is the offset of the
+    # patterns from the start of the simulation, not a point in time
+    return {
+        "timeStep": time.get("pattern_timestep"),
+        "startTime": time.get("pattern_start"),
+    }
+
+
+def iter_network_elements(data: dict) -> Iterator[Tuple[str, dict]]:
+    """Yields ``(type, element)`` for a parsed WNTR network, in the import order"""
+    for type_ in ("Junction", "Reservoir", "Tank"):
+        for node in data["nodes"]:
+            if node["node_type"] == type_:
+                yield type_, node
+    for type_ in ("Pipe", "Pump", "Valve"):
+        for link in data["links"]:
+            if link["link_type"] == type_:
+                yield type_, link
+    for curve in data["curves"]:
+        yield "Curve", curve
+    for pattern in data["patterns"]:
+        yield "Pattern", pattern
@@ -1,52 +1,393 @@
-import json
+import time
+import zlib
 from argparse import Namespace
-from typing import Optional, Tuple
+from typing import Any, Iterator, List, Mapping, NamedTuple, Optional, Tuple, Union
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
+from urllib3.exceptions import ReadTimeoutError
+from urllib3.util.retry import Retry
 
-EndpointResponse = Tuple[int, Optional[dict]]
+from .metrics import Metrics
+from .serializer import Serializer, get_serializer
+from .streaming import iter_array
+from .throttle import AdaptiveLimiter, parse_retry_after
+from .trace import TraceWriter
+
+EndpointResponse = Tuple[int, Optional[Union[dict, list, str]]]
+
+
+RETRY_STATUS_CODES = (429, 503)
+# Methods which may be sent again after a read timeout
+IDEMPOTENT_METHODS = frozenset(("DELETE", "GET", "HEAD", "OPTIONS", "PUT", "TRACE"))
+
+COMPRESSIONS = ("none", "gzip", "deflate")
+# zlib window bits selecting the gzip and the zlib ("deflate" in HTTP) container
+_WBITS = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+
+
+class _Retry(Retry):
+    """Retry which gives up on read timeouts of non-idempotent requests.
+
+    After a read timeout the broker may still be processing the request, so a
+    POST or PATCH sent again could create or change an entity twice. Connections
+    closed or reset without an answer (e.g. a stale keep-alive connection) are
+    retried for all methods, as the broker did not process the request then.
+    """
+
+    def increment(
+        self,
+        method=None,
+        url=None,
+        response=None,
+        error=None,
+        _pool=None,
+        _stacktrace=None,
+    ):
+        if (
+            isinstance(error, ReadTimeoutError)
+            and method is not None
+            and method.upper() not in IDEMPOTENT_METHODS
+        ):
+            raise error.with_traceback(_stacktrace)
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+
+class StreamedResponse(NamedTuple):
+    """Response of ``get_stream()``, iterate the body to the end or close it"""
+
+    status: int
+    headers: Mapping[str, str]
+    body: Union[Iterator[Any], str]
 
 
 class ScenarioManagerEndpoint:
     def __init__(
-        self, endpoint: str, user: Optional[str] = None, password: Optional[str] = None
+        self,
+        endpoint: str,
+        user: Optional[str] = None,
+        password: Optional[str] = None,
+        pool_size: int = 10,
+        retries: int = 3,
+        retry_backoff: float = 0.5,
+        timeout: Optional[float] = 30.0,
+        tracer: Optional[TraceWriter] = None,
+        metrics: Optional[Metrics] = None,
+        serializer: Optional[Serializer] = None,
+        compression: str = "none",
+        compress_min_size: int = 1024,
+        compress_level: int = 6,
+        limiter: Optional[AdaptiveLimiter] = None,
     ):
         self._auth = None
         if user is not None and password is not None:
             self._auth = HTTPBasicAuth(user, password)
         self._endpoint = endpoint if not endpoint.endswith("/") else endpoint[:-1]
+        self._timeout = timeout
+        self._tracer = tracer
+        self.metrics = metrics
+        self.serializer = serializer or get_serializer()
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression {compression!r}.")
+        self._compression = None if compression == "none" else compression
+        self._compress_min_size = compress_min_size
+        self._compress_level = compress_level
+        self.limiter = limiter
+        self._retries = retries
+        self._retry_backoff = retry_backoff
+        self._session = self._create_session(pool_size, retries, retry_backoff)
+
+    def _create_session(
+        self, pool_size: int, retries: int, retry_backoff: float
+    ) -> requests.Session:
+        # Connection errors (refused, reset) and 429/503 answers are retried with an
+        # exponential backoff, honoring Retry-After. These retries apply to all
+        # methods, as the broker has not processed a request it answered with 429
+        # or 503. Read timeouts are only retried for idempotent methods.
+        # With a limiter, _send() retries the answers itself, so that the limiter
+        # sees them.
+        retry = _Retry(
+            total=retries,
+            backoff_factor=retry_backoff,
+            status_forcelist=RETRY_STATUS_CODES if self.limiter is None else (),
+            allowed_methods=None,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+        )
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def close(self) -> None:
+        self._session.close()
+        if self._tracer is not None:
+            self._tracer.close()
+
+    def __enter__(self) -> "ScenarioManagerEndpoint":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def _compress(self, payload: Optional[bytes], headers: dict) -> Optional[bytes]:
+        if (
+            self._compression is None
+            or payload is None
+            or len(payload) < self._compress_min_size
+        ):
+            return payload
+        compressor = zlib.compressobj(
+            self._compress_level, zlib.DEFLATED, _WBITS[self._compression]
+        )
+        headers["Content-Encoding"] = self._compression
+        return compressor.compress(payload) + compressor.flush()
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        payload: Optional[bytes],
+        headers: dict,
+        stream: bool = False,
+    ) -> requests.Response:
+        limiter = self.limiter
+        if limiter is None:
+            return self._session.request(
+                method,
+                url,
+                data=payload,
+                headers=headers,
+                auth=self._auth,
+                timeout=self._timeout,
+                stream=stream,
+            )
+        attempt = 0
+        while True:
+            limiter.acquire()
+            start = time.perf_counter()
+            try:
+                response = self._session.request(
+                    method,
+                    url,
+                    data=payload,
+                    headers=headers,
+                    auth=self._auth,
+                    timeout=self._timeout,
+                    stream=stream,
+                )
+            except requests.RequestException:
+                limiter.release(time.perf_counter() - start, None)
+                raise
+            status = response.status_code
+            retry_after = None
+            if status in RETRY_STATUS_CODES:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            limiter.release(time.perf_counter() - start, status, retry_after)
+            if status not in RETRY_STATUS_CODES or attempt >= self._retries:
+                return response
+            response.close()
+            if self.metrics is not None:
+                self.metrics.count("retries")
+            if retry_after is None:
+                time.sleep(self._retry_backoff * 2**attempt)
+            attempt += 1
 
     def request(
-        self, method, path: str, data: dict = None, content_type: str = None
+        self,
+        method,
+        path: str,
+        data: Union[dict, list, bytes] = None,
+        content_type: str = None,
+        headers: Optional[Mapping[str, str]] = None,
     ) -> EndpointResponse:
         if not path.startswith("/"):
             path = "/" + path
         headers = {
             "Content-Type": content_type,
+            **(headers or {}),
         }
-        response = requests.request(
-            method,
-            f"{self._endpoint}{path}",
-            data=json.dumps(data),
-            headers=headers,
-            auth=self._auth,
+        url = f"{self._endpoint}{path}"
+        metrics = self.metrics
+        start = time.perf_counter()
+        payload = (
+            data
+            if data is None or isinstance(data, bytes)
+            else self.serializer.dumps(data)
         )
+        if metrics is not None:
+            serialized = time.perf_counter()
+            metrics.observe("serialize", method, serialized - start)
+            size = 0 if payload is None else len(payload)
+        payload = self._compress(payload, headers)
+        if metrics is not None:
+            sent = time.perf_counter()
+            if "Content-Encoding" in headers:
+                metrics.observe("compress", method, sent - serialized)
+                metrics.count("bytes_saved", size - len(payload))
+        response = self._send(method, url, payload, headers)
         status = response.status_code
+        if metrics is not None:
+            self._record(metrics, method, sent, payload, response)
         if 200 <= status <= 299:
-            return status, response.json()
-        return status, response.text
+            body = self.serializer.loads(response.content) if response.content else None
+        else:
+            body = response.text
+        if self._tracer is not None:
+            self._tracer.trace(
+                method, url, status, time.perf_counter() - start, data, body
+            )
+        return status, body
 
-    def get(self, path: str = "/") -> EndpointResponse:
-        return self.request(method="GET", path=path)
+    def get_stream(
+        self, path: str, headers: Optional[Mapping[str, str]] = None
+    ) -> StreamedResponse:
+        """GETs a JSON array, decoding the elements while the response arrives.
+
+        Unlike ``get()``, large (e.g. paged entity) responses are never held in
+        memory as a whole. Error responses have their text as the body.
+        """
+        if not path.startswith("/"):
+            path = "/" + path
+        url = f"{self._endpoint}{path}"
+        start = time.perf_counter()
+        response = self._send("GET", url, None, dict(headers or {}), stream=True)
+        status = response.status_code
+        if self.metrics is not None:
+            self._record(self.metrics, "GET", start, None, response, streamed=True)
+        if 200 <= status <= 299:
+            body = self._iter_response(response)
+        else:
+            body = response.text
+            response.close()
+        if self._tracer is not None:
+            self._tracer.trace(
+                "GET",
+                url,
+                status,
+                time.perf_counter() - start,
+                None,
+                None if 200 <= status <= 299 else body,
+            )
+        return StreamedResponse(status, response.headers, body)
+
+    @staticmethod
+    def _iter_response(response: requests.Response) -> Iterator[Any]:
+        try:
+            if response.headers.get("Content-Length") != "0":
+                # Content-Encoding (gzip, deflate) is decoded while reading
+                response.raw.decode_content = True
+                yield from iter_array(response.raw)
+        finally:
+            response.close()
+
+    @staticmethod
+    def _record(
+        metrics: Metrics,
+        method: str,
+        sent: float,
+        payload,
+        response,
+        streamed: bool = False,
+    ) -> None:
+        metrics.observe("http", method, time.perf_counter() - sent)
+        # Time until the response headers arrived (of the last attempt)
+        metrics.observe("server", method, response.elapsed.total_seconds())
+        metrics.count("requests")
+        if not (200 <= response.status_code <= 299):
+            metrics.count("errors")
+        retries = getattr(response.raw, "retries", None)
+        if retries is not None and retries.history:
+            metrics.count("retries", len(retries.history))
+        if payload is not None:
+            metrics.count("bytes_sent", len(payload))
+        if not streamed:
+            metrics.count("bytes_received", len(response.content))
+
+    def get(
+        self, path: str = "/", headers: Optional[Mapping[str, str]] = None
+    ) -> EndpointResponse:
+        return self.request(method="GET", path=path, headers=headers)
 
     def post(
-        self, path: str, data: dict, content_type: str = "application/json"
+        self,
+        path: str,
+        data: Union[dict, list, bytes],
+        content_type: str = "application/json",
+        headers: Optional[Mapping[str, str]] = None,
+    ) -> EndpointResponse:
+        return self.request(
+            method="POST",
+            path=path,
+            data=data,
+            content_type=content_type,
+            headers=headers,
+        )
+
+    def patch(
+        self,
+        path: str,
+        data: dict,
+        content_type: str = "application/json",
+        headers: Optional[Mapping[str, str]] = None,
     ) -> EndpointResponse:
         return self.request(
-            method="POST", path=path, data=data, content_type=content_type
+            method="PATCH",
+            path=path,
+            data=data,
+            content_type=content_type,
+            headers=headers,
+        )
+
+    def delete(
+        self, path: str, headers: Optional[Mapping[str, str]] = None
+    ) -> EndpointResponse:
+        return self.request(method="DELETE", path=path, headers=headers)
+
+    def batch(
+        self,
+        operation: str,
+        entities: List[Union[dict, bytes]],
+        content_type: str = "application/ld+json",
+        headers: Optional[Mapping[str, str]] = None,
+    ) -> EndpointResponse:
+        """Sends entities to the NGSI-LD batch endpoint (create, upsert, update, delete).
+
+        The entities are either dicts or already serialized JSON objects (bytes).
+        ``headers`` (e.g. a context Link) apply to the whole batch.
+        """
+        data = (
+            b"["
+            + b",".join(
+                entity if isinstance(entity, bytes) else self.serializer.dumps(entity)
+                for entity in entities
+            )
+            + b"]"
+        )
+        return self.post(
+            f"/ngsi-ld/v1/entityOperations/{operation}", data, content_type, headers
         )
 
     @classmethod
-    def from_args(cls, args: Namespace) -> "ScenarioManagerEndpoint":
-        return cls(endpoint=args.endpoint, user=args.user, password=args.password)
+    def from_args(
+        cls, args: Namespace, metrics: Optional[Metrics] = None
+    ) -> "ScenarioManagerEndpoint":
+        return cls(
+            endpoint=args.endpoint,
+            user=args.user,
+            password=args.password,
+            pool_size=args.pool_size,
+            retries=args.retries,
+            retry_backoff=args.retry_backoff,
+            timeout=args.timeout if args.timeout > 0 else None,
+            tracer=TraceWriter.from_args(args),
+            metrics=metrics,
+            serializer=get_serializer(args.serializer),
+            compression=args.compress,
+            compress_min_size=args.compress_min_size,
+            compress_level=args.compress_level,
+            limiter=AdaptiveLimiter.from_args(args),
+        )
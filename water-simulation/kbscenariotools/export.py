@@ -0,0 +1,192 @@
+import gzip
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    IO,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+)
+from urllib.parse import urlencode
+
+from .context import link_header
+from .converters import EPANET_CONTEXT
+from .endpoint import ScenarioManagerEndpoint
+from .serializer import Serializer, get_serializer
+
+ENTITIES_PATH = "/ngsi-ld/v1/entities"
+EXPORT_FORMATS = ("jsonl", "parquet")
+# The types are short names of the EPANET context, which the broker expands with
+# the context of the query (the core context without a Link header)
+QUERY_HEADERS = {"Link": link_header(EPANET_CONTEXT)}
+
+
+class Page(NamedTuple):
+    type: str
+    offset: int
+    limit: int
+
+
+def _query(type_: str, params: Dict[str, str], **paging) -> str:
+    return f"{ENTITIES_PATH}?{urlencode({'type': type_, **params, **paging})}"
+
+
+def count_entities(
+    endpoint: ScenarioManagerEndpoint,
+    type_: str,
+    params: Dict[str, str],
+    headers: Mapping[str, str] = QUERY_HEADERS,
+) -> Optional[int]:
+    """Number of matching entities from ``count=true``, None if the broker omits it"""
+    status, response_headers, body = endpoint.get_stream(
+        _query(type_, params, limit=0, count="true"), headers
+    )
+    if not (200 <= status <= 299):
+        raise RuntimeError(f"Got status code {status} counting {type_}: {body}")
+    for _ in body:
+        pass
+    count = response_headers.get("NGSILD-Results-Count")
+    return None if count is None else int(count)
+
+
+def fetch_page(
+    endpoint: ScenarioManagerEndpoint,
+    page: Page,
+    params: Dict[str, str],
+    headers: Mapping[str, str] = QUERY_HEADERS,
+) -> List[dict]:
+    status, body = endpoint.get(
+        _query(page.type, params, limit=page.limit, offset=page.offset), headers
+    )
+    if not (200 <= status <= 299):
+        raise RuntimeError(
+            f"Got status code {status} fetching {page.type} at {page.offset}: {body}"
+        )
+    return body or []
+
+
+def iter_pages(
+    endpoint: ScenarioManagerEndpoint,
+    counts: Dict[str, Optional[int]],
+    page_size: int,
+    params: Dict[str, str],
+    concurrency: int = 4,
+    headers: Mapping[str, str] = QUERY_HEADERS,
+) -> Iterator[List[dict]]:
+    """Yields the pages of every type in order, fetching ``concurrency`` at a time.
+
+    The pages of types with a known count are fetched in parallel, with at most
+    two pages per thread waiting to be consumed. Types without a count are read
+    page by page until a short page. Offset paging is only consistent if the
+    entities do not change during the export.
+    """
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for type_, count in counts.items():
+            if count is None:
+                offset = 0
+                while True:
+                    entities = fetch_page(
+                        endpoint, Page(type_, offset, page_size), params, headers
+                    )
+                    if entities:
+                        yield entities
+                    if len(entities) < page_size:
+                        break
+                    offset += page_size
+                continue
+            pending = deque()
+            try:
+                for offset in range(0, count, page_size):
+                    page = Page(type_, offset, page_size)
+                    pending.append(
+                        executor.submit(fetch_page, endpoint, page, params, headers)
+                    )
+                    while len(pending) >= 2 * concurrency:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+
+class JsonLinesWriter:
+    """One entity per line, gzip-compressed if the path ends with .gz"""
+
+    def __init__(self, path: str, serializer: Optional[Serializer] = None):
+        self._dumps = (serializer or get_serializer()).dumps
+        self._file: IO[bytes] = (
+            gzip.open(path, "wb") if path.endswith(".gz") else open(path, "wb")
+        )
+
+    def write(self, entities: Iterable[dict]) -> None:
+        dumps = self._dumps
+        self._file.write(b"".join(dumps(entity) + b"\n" for entity in entities))
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetWriter:
+    """Entities as rows of id, type and the JSON-encoded entity (needs pyarrow).
+
+    The attributes differ per type, so the entity is kept as one JSON column
+    rather than a column per attribute. Rows are written in row groups of
+    ``row_group_size``.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        serializer: Optional[Serializer] = None,
+        row_group_size: int = 50000,
+    ):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet export needs pyarrow (pip install pyarrow).")
+        self._pa = pa
+        self._dumps = (serializer or get_serializer()).dumps
+        self._schema = pa.schema(
+            [("id", pa.string()), ("type", pa.string()), ("entity", pa.string())]
+        )
+        self._writer = pq.ParquetWriter(path, self._schema, compression="zstd")
+        self._row_group_size = row_group_size
+        self._rows: List[dict] = []
+
+    def write(self, entities: Iterable[dict]) -> None:
+        self._rows.extend(entities)
+        if len(self._rows) >= self._row_group_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._rows:
+            return
+        dumps = self._dumps
+        columns = {
+            "id": [entity["id"] for entity in self._rows],
+            "type": [entity["type"] for entity in self._rows],
+            "entity": [dumps(entity).decode("utf-8") for entity in self._rows],
+        }
+        self._writer.write_table(
+            self._pa.Table.from_pydict(columns, schema=self._schema)
+        )
+        self._rows.clear()
+
+    def close(self) -> None:
+        self._flush()
+        self._writer.close()
+
+
+def open_writer(path: str, format: Optional[str] = None, serializer=None):
+    """Returns the writer for ``format``, by default from the file extension"""
+    if format is None:
+        format = "parquet" if path.endswith(".parquet") else "jsonl"
+    if format == "parquet":
+        return ParquetWriter(path, serializer)
+    return JsonLinesWriter(path, serializer)
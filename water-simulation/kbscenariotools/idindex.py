@@ -0,0 +1,213 @@
+import mmap
+import struct
+import zlib
+from array import array
+from enum import IntEnum
+from typing import Iterable, Optional, Tuple, Union
+
+_MAGIC = b"KBIDX002"
+_HEADER = struct.Struct("<8sQQQ")
+
+
+class ElementType(IntEnum):
+    """EPANET node and link types, stored as one byte per element in the index"""
+
+    Junction = 1
+    Reservoir = 2
+    Tank = 3
+    Pipe = 4
+    Pump = 5
+    Valve = 6
+
+
+_TYPE_NAMES = {type_.value: type_.name for type_ in ElementType}
+# Looking up an IntEnum member by name is several times slower than a dict
+_TYPE_CODES = {type_.name: type_.value for type_ in ElementType}
+
+
+class IdTypeIndex:
+    """Compact, read-mostly mapping from element names to their EPANET type.
+
+    Names are stored UTF-8 encoded in one contiguous buffer with an offset array,
+    the types as one-byte ``ElementType`` codes and the CRC-32 of every name in
+    another array. ``freeze()`` builds an open-addressing hash table of entry
+    numbers (at most half full), so a lookup hashes the name once and compares
+    one or two stored names. No per-entry Python objects are kept or created
+    for the table. ``spill()`` moves the index into a file which is
+    memory-mapped, so it can exceed the RAM and be shared with other processes
+    via ``IdTypeIndex.open()``; CRC-32 does not depend on the process, unlike
+    ``hash()``.
+
+    The index behaves like the ``{name: type}`` dict it replaces: ``index[name]``
+    returns the type name (of the last entry added with that name) and raises
+    ``KeyError`` for unknown names.
+    """
+
+    def __init__(self):
+        self._blob: Union[bytearray, mmap.mmap] = bytearray()
+        self._blob_start = 0
+        self._offsets: Union[array, memoryview] = array("Q", [0])
+        self._codes: Union[array, memoryview] = array("B")
+        self._hashes: Union[array, memoryview] = array("I")
+        self._table: Union[array, memoryview] = array("I", [0])
+        self._mask = 0
+        self._frozen = True
+        self._mmap: Optional[mmap.mmap] = None
+        self._file = None
+
+    @classmethod
+    def from_items(cls, items: Iterable[Tuple[str, str]]) -> "IdTypeIndex":
+        index = cls()
+        for name, type_ in items:
+            index.add(name, type_)
+        index.freeze()
+        return index
+
+    def add(self, name: str, type_: str) -> None:
+        if self._mmap is not None:
+            raise RuntimeError("A spilled index is read-only.")
+        key = name.encode("utf-8")
+        self._blob += key
+        self._offsets.append(len(self._blob))
+        self._codes.append(_TYPE_CODES[type_])
+        self._hashes.append(zlib.crc32(key))
+        self._frozen = False
+
+    def freeze(self) -> None:
+        """Builds the hash table, called automatically before the first lookup"""
+        if self._frozen:
+            return
+        blob, offsets, hashes = self._blob, self._offsets, self._hashes
+        size = 8
+        while size < 2 * len(hashes):
+            size *= 2
+        mask = size - 1
+        # Entry numbers plus one, zero marks an empty slot
+        table = array("I", bytes(4 * size))
+        for entry, hash_ in enumerate(hashes):
+            slot = hash_ & mask
+            while True:
+                found = table[slot]
+                if not found:
+                    break
+                found -= 1
+                if (
+                    hashes[found] == hash_
+                    and blob[offsets[found] : offsets[found + 1]]
+                    == blob[offsets[entry] : offsets[entry + 1]]
+                ):
+                    # A name added again replaces the earlier entry, like in a dict
+                    break
+                slot = (slot + 1) & mask
+            table[slot] = entry + 1
+        self._table, self._mask = table, mask
+        self._frozen = True
+
+    def spill(self, path: str) -> None:
+        """Writes the index to ``path`` and continues with the memory-mapped file"""
+        self.freeze()
+        with open(path, "wb") as f:
+            f.write(
+                _HEADER.pack(
+                    _MAGIC, len(self._codes), len(self._blob), len(self._table)
+                )
+            )
+            # Ordered by item size, so every array stays aligned; written from
+            # their buffers, without copies
+            for data in (self._offsets, self._table, self._hashes, self._codes):
+                f.write(data)
+            f.write(self._blob)
+        self.close()
+        self._map(path)
+
+    @classmethod
+    def open(cls, path: str) -> "IdTypeIndex":
+        """Opens an index previously written with ``spill()`` (read-only)"""
+        index = cls()
+        index._map(path)
+        return index
+
+    def _map(self, path: str) -> None:
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, blob_size, table_size = _HEADER.unpack_from(self._mmap)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not an id index file.")
+        view = memoryview(self._mmap)
+        start = _HEADER.size
+        end = start + (count + 1) * 8
+        self._offsets = view[start:end].cast("Q")
+        start, end = end, end + table_size * 4
+        self._table = view[start:end].cast("I")
+        start, end = end, end + count * 4
+        self._hashes = view[start:end].cast("I")
+        self._codes = view[end : end + count]
+        self._mask = table_size - 1
+        self._blob = self._mmap
+        self._blob_start = end + count
+        self._frozen = True
+
+    def close(self) -> None:
+        if self._mmap is None:
+            return
+        # The memoryviews have to be released before the mmap can be closed
+        for view in (self._offsets, self._table, self._hashes, self._codes):
+            view.release()
+        self._mmap.close()
+        self._file.close()
+        self._mmap = self._file = None
+        self._blob, self._blob_start = bytearray(), 0
+        self._offsets, self._codes = array("Q", [0]), array("B")
+        self._hashes, self._table, self._mask = array("I"), array("I", [0]), 0
+
+    def _find(self, name: str) -> int:
+        if not self._frozen:
+            self.freeze()
+        key = name.encode("utf-8")
+        hash_ = zlib.crc32(key)
+        table, hashes, mask = self._table, self._hashes, self._mask
+        slot = hash_ & mask
+        entry = table[slot]
+        while entry:
+            entry -= 1
+            if hashes[entry] == hash_:
+                offsets, start = self._offsets, self._blob_start
+                if (
+                    self._blob[start + offsets[entry] : start + offsets[entry + 1]]
+                    == key
+                ):
+                    return entry
+            slot = (slot + 1) & mask
+            entry = table[slot]
+        return -1
+
+    def type_code(self, name: str) -> ElementType:
+        position = self._find(name)
+        if position < 0:
+            raise KeyError(name)
+        return ElementType(self._codes[position])
+
+    def __getitem__(self, name: str) -> str:
+        position = self._find(name)
+        if position < 0:
+            raise KeyError(name)
+        return _TYPE_NAMES[self._codes[position]]
+
+    def get(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        position = self._find(name)
+        return default if position < 0 else _TYPE_NAMES[self._codes[position]]
+
+    def __contains__(self, name: str) -> bool:
+        return self._find(name) >= 0
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def nbytes(self) -> int:
+        """Size of the index data (in RAM or in the mapped file)"""
+        return (
+            self._offsets[-1]
+            + len(self._offsets) * 8
+            + (len(self._table) + len(self._hashes)) * 4
+            + len(self._codes)
+        )
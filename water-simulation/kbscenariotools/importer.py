@@ -0,0 +1,827 @@
+"""Import of WNTR networks into a scenario, as a function callable in-process.
+
+``import_network(source, endpoint, options)`` does what water-simulation.py does
+from the command line, and can be called many times from one process (e.g. a
+long-lived worker) with its own endpoint, options and state per call. The
+modules of optional stages (numpy for the series and spatial stages, the process
+pool, the thread pool, the manifest) are imported when an import uses them.
+
+    with ScenarioManagerEndpoint("http://broker:1026/") as endpoint:
+        report = import_network(
+            "net1.json", endpoint, ImportOptions("S1", prefix="S1-", batch_size=500)
+        )
+
+The network is checked before anything is uploaded (see validation.py), so links
+to unknown nodes or references to missing patterns fail the import up front.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import ExitStack
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+from urllib.parse import quote
+
+from .batch import BATCH_OPERATIONS, BatchResult
+from .context import (
+    CONTEXT_MODES,
+    DEFAULT_CACHE_DIR,
+    ContextCache,
+    ContextExpander,
+    link_header,
+)
+from .converters import (
+    EPANET_CONTEXT,
+    EPANET_CONVERTERS,
+    SERIES_REFERENCES,
+    pattern_static,
+    urn_factory,
+)
+from .idindex import IdTypeIndex
+from .journal import UploadJournal
+from .metrics import Metrics
+from .serializer import EncodedEntity, context_fragment, splice
+from .validation import LINK_TYPES, NODE_TYPES, NetworkValidator, validate_network
+
+if TYPE_CHECKING:
+    from .endpoint import ScenarioManagerEndpoint
+
+STREAMED_SECTIONS = ("curves", "patterns", "nodes", "links")
+
+Model = Union[dict, EncodedEntity]
+Progress = Callable[..., None]
+
+
+class ImportOptions(NamedTuple):
+    """How a network is imported, the options of water-simulation.py"""
+
+    scenario: str
+    network_name: str = "WaterNetwork1"
+    network_chunk_size: int = 0
+    prefix: str = ""
+    batch_size: int = 0
+    batch_operation: str = "create"
+    stream: bool = False
+    index_file: Optional[str] = None
+    incremental: bool = False
+    manifest: str = "import-manifest.sqlite"
+    delete_missing: bool = False
+    # Without a journal file, confirmations are kept in memory (no --resume)
+    journal: Optional[str] = None
+    resume: bool = False
+    workers: int = 1
+    concurrency: int = 1
+    context_mode: str = "inline"
+    context_file: Optional[str] = None
+    context_cache: str = DEFAULT_CACHE_DIR
+    context_refresh: bool = False
+    crs: Optional[str] = None
+    tile_zoom: int = 0
+    tiles: Optional[str] = None
+    series_references: bool = False
+    dedup_series: bool = False
+    series_precision: Optional[int] = None
+    validate: bool = True
+
+    @classmethod
+    def from_args(cls, args) -> "ImportOptions":
+        """The options of parsed command line arguments with the same names"""
+        return cls(
+            **{
+                field: getattr(args, field)
+                for field in cls._fields
+                if hasattr(args, field)
+            }
+        )
+
+
+class ImportReport(NamedTuple):
+    """Outcome of an import.
+
+    ``counts`` are the elements per type, ``models`` the models handled (also the
+    skipped and unchanged ones) and ``stats`` the upload counters.
+    """
+
+    network_id: Optional[str]
+    counts: Dict[str, int]
+    models: int
+    stats: Dict[str, int]
+    elapsed: float
+
+
+class UploadError(RuntimeError):
+    """The broker rejected a request; ``details`` holds the bodies involved"""
+
+    def __init__(self, message: str, details: str = ""):
+        super().__init__(message)
+        self.details = details
+
+
+def _response_details(method, path, entity_id, res, body=None) -> str:
+    lines = [f"{method} {path} failed for {entity_id}"]
+    if body is not None:
+        lines.append("Request Body:")
+        if isinstance(body, bytes):
+            lines.append(body.decode("utf-8"))
+        else:
+            lines.append(json.dumps(body, indent=2))
+    lines.append("Response Body:")
+    lines.append(str(res))
+    return "\n".join(lines)
+
+
+def entity_path(entity_id: str) -> str:
+    return f"/ngsi-ld/v1/entities/{quote(entity_id, safe=':')}"
+
+
+def model_id(data: Model) -> str:
+    return data.id if isinstance(data, EncodedEntity) else data["id"]
+
+
+def model_type(data: Model) -> str:
+    return data["type"] if isinstance(data, dict) else data.id.split(":")[2]
+
+
+class NetworkImport:
+    """One import of a network (a WNTR JSON file or its parsed dict) into a scenario.
+
+    ``prepare()`` reads and checks the network and counts the models, so a caller
+    can show them before ``run()`` uploads. A parsed network is left as it is, the
+    series and spatial stages work on copies. ``progress(count, **counters)`` is called
+    for every confirmed model, with the counters (e.g. batches=1) which changed;
+    the totals are in ``stats``. The endpoint is not closed.
+    """
+
+    def __init__(
+        self,
+        source: Union[str, dict],
+        endpoint: "ScenarioManagerEndpoint",
+        options: ImportOptions,
+        metrics: Optional[Metrics] = None,
+        progress: Optional[Progress] = None,
+    ):
+        self.source = source
+        self.endpoint = endpoint
+        self.options = options
+        self.metrics = metrics
+        self.progress = progress
+        self.dedup = options.dedup_series or options.series_precision is not None
+        # Without the relationships nothing would point to the series kept by dedup
+        self.converter_options = (
+            (SERIES_REFERENCES,) if options.series_references or self.dedup else ()
+        )
+        self.tile_zoom = options.tile_zoom
+        self.selected_tiles = None
+        if options.tiles:
+            from .spatial import parse_tiles
+
+            self.tile_zoom, self.selected_tiles = parse_tiles(options.tiles)
+        self.spatial = bool(options.crs or self.tile_zoom)
+        self._check_options()
+        self.make_urn = urn_factory(options.prefix)
+        self.counts: Dict[str, int] = {}
+        self.series_counts: Optional[Tuple[int, int]] = None
+        self.sub_networks = 0
+        self.tiles: Optional[int] = None
+        self.total: Optional[int] = None
+        self.models = 0
+        self.stats = {
+            "batches": 0,
+            "failed": 0,
+            "unchanged": 0,
+            "updated": 0,
+            "deleted": 0,
+        }
+        self.journal: Optional[UploadJournal] = None
+        self._prepared = False
+        self._lock = threading.Lock()
+        self._pending: List[EncodedEntity] = []
+        self._uploader = None
+        self._manifest = None
+        self._workers = None
+        self._index_dir = None
+        self.index_file = options.index_file
+
+    def _check_options(self) -> None:
+        options = self.options
+        if options.stream:
+            if not isinstance(self.source, str):
+                raise ValueError("--stream reads the network from a file")
+            if self.dedup:
+                raise ValueError("--dedup-series needs the whole network, not --stream")
+            if self.spatial:
+                raise ValueError(
+                    "--crs, --tile-zoom and --tiles need the whole network, not --stream"
+                )
+        if self.tile_zoom and not options.crs:
+            # Tiles are computed from WGS84 positions, projected coordinates would
+            # silently end up in the wrong tiles
+            raise ValueError(
+                "--tile-zoom and --tiles need the --crs of the coordinates "
+                "(EPSG:4326 for WGS84)"
+            )
+        if self.selected_tiles and options.delete_missing:
+            raise ValueError(
+                "--delete-missing would delete the entities outside of --tiles"
+            )
+        if options.workers > 1 and options.incremental:
+            raise ValueError(
+                "--incremental needs the entities in the main process, use --workers 1"
+            )
+        if options.resume and options.journal is None:
+            raise ValueError("--resume needs a --journal")
+        if options.batch_operation not in BATCH_OPERATIONS:
+            raise ValueError(f"Unknown batch operation {options.batch_operation}")
+        if options.context_mode not in CONTEXT_MODES:
+            raise ValueError(f"Unknown context mode {options.context_mode}")
+
+    def prepare(self) -> None:
+        """Reads and checks the network, computes the counts and opens the journal.
+
+        With several workers their processes are forked here, before ``run()``
+        starts the upload threads; call it before starting threads of your own.
+        """
+        if self._prepared:
+            return
+        options = self.options
+        metrics = self.metrics
+        self.node_id_type_map = IdTypeIndex()
+        self.tile_groups = None
+        if options.stream:
+            # Nodes, curves and patterns are converted while reading, only the node
+            # id to type map (needed for the link relationships) and the header are
+            # kept.
+            self.data = {}
+            if options.validate:
+                self._validate_stream()
+        else:
+            if isinstance(self.source, dict):
+                data = self.source
+            else:
+                with open(self.source, "r") as f:
+                    if metrics is None:
+                        data = json.load(f)
+                    else:
+                        with metrics.timer("parse", "file"):
+                            data = json.load(f)
+            if options.validate:
+                validate_network(data)
+            self.data = data
+            self._prepare_elements()
+        self.journal = UploadJournal(
+            options.journal,
+            f"scenario={options.scenario} prefix={options.prefix} "
+            f"network={options.network_name}",
+            resume=options.resume,
+        )
+        self._setup_context()
+        if options.workers > 1:
+            self._start_workers()
+        self._prepared = True
+
+    def _start_workers(self) -> None:
+        from .parallel import start_workers
+
+        options = self.options
+        if not self.index_file:
+            # The workers share the node index through a memory-mapped file
+            import tempfile
+
+            self._index_dir = tempfile.TemporaryDirectory()
+            self.index_file = os.path.join(self._index_dir.name, "nodes.idx")
+        self._workers = start_workers(
+            options.workers,
+            options.prefix,
+            self.index_file,
+            EPANET_CONTEXT if options.context_mode == "inline" else None,
+            serializer=self.endpoint.serializer.name,
+            expander=self.expander,
+            converter_options=self.converter_options,
+        )
+
+    def _validate_stream(self) -> None:
+        from .streaming import iter_sections
+
+        validator = NetworkValidator()
+        for key, value in iter_sections(self.source, STREAMED_SECTIONS):
+            validator.add(key, value)
+        validator.check()
+
+    def _prepare_elements(self) -> None:
+        options = self.options
+        data = self.data
+        nodes, links = data["nodes"], data["links"]
+        if self.dedup or self.spatial:
+            # References and coordinates are rewritten, not in the caller's network
+            nodes = [_element_copy(node) for node in nodes]
+            links = [_element_copy(link) for link in links]
+        elements = {
+            type_: [node for node in nodes if node["node_type"] == type_]
+            for type_ in NODE_TYPES
+        }
+        for type_ in LINK_TYPES:
+            elements[type_] = [link for link in links if link["link_type"] == type_]
+        elements["Curve"] = list(data["curves"])
+        elements["Pattern"] = list(data["patterns"])
+        self.node_id_type_map = IdTypeIndex.from_items(
+            (node["name"], node["node_type"]) for node in nodes
+        )
+
+        if self.dedup:
+            from .series import deduplicate, rewrite_references
+
+            self.series_counts = (len(elements["Pattern"]), len(elements["Curve"]))
+            elements["Pattern"], pattern_names = deduplicate(
+                elements["Pattern"], "multipliers", precision=options.series_precision
+            )
+            elements["Curve"], curve_names = deduplicate(
+                elements["Curve"],
+                "points",
+                "curve_type",
+                precision=options.series_precision,
+            )
+            rewrite_references(nodes, links, pattern_names, curve_names)
+
+        if self.spatial:
+            from .spatial import locate
+
+            if self.metrics is None:
+                locate(nodes, links, options.crs)
+            else:
+                with self.metrics.timer("spatial", "locate"):
+                    locate(nodes, links, options.crs)
+        if self.tile_zoom:
+            from .spatial import group_by_tile, iter_grouped
+
+            self.tile_groups = group_by_tile(
+                [
+                    (type_, element)
+                    for type_ in NODE_TYPES + LINK_TYPES
+                    for element in elements[type_]
+                ],
+                self.tile_zoom,
+            )
+            self.tiles = len([key for key in self.tile_groups if key is not None])
+            if self.selected_tiles:
+                # Only the district is imported, the counts are of its elements
+                selected = list(iter_grouped(self.tile_groups, self.selected_tiles))
+                for type_ in NODE_TYPES + LINK_TYPES:
+                    elements[type_] = [
+                        element for name, element in selected if name == type_
+                    ]
+                elements["Curve"], elements["Pattern"] = [], []
+                self.tiles = len(self.selected_tiles & set(self.tile_groups))
+        self.elements = elements
+
+        self.counts = {type_: len(items) for type_, items in elements.items()}
+        total = sum(self.counts.values())
+        if not self.selected_tiles:
+            total += 1
+            size = options.network_chunk_size
+            if size > 0:
+                members = total - 1
+                while members > size:
+                    members = -(-members // size)
+                    self.sub_networks += members
+                total += self.sub_networks
+        self.total = total
+
+    def run(self) -> ImportReport:
+        """Uploads the network, returns the report; raises UploadError on failures"""
+        self.prepare()
+        started = time.perf_counter()
+        options = self.options
+        # Closed in reverse order, the upload threads are joined first
+        with ExitStack() as stack:
+            stack.callback(self.journal.close)
+            if self._index_dir is not None:
+                stack.enter_context(self._index_dir)
+            if self._workers is not None:
+                stack.enter_context(self._workers)
+            index_file = self.index_file
+            if options.incremental:
+                from .manifest import ImportManifest
+
+                self._manifest = ImportManifest(
+                    options.manifest, options.scenario, options.prefix
+                )
+                stack.callback(self._manifest.close)
+            if options.concurrency > 1:
+                from .uploader import ConcurrentUploader
+
+                self._uploader = stack.enter_context(
+                    ConcurrentUploader(options.concurrency)
+                )
+            if index_file and not options.stream:
+                self.node_id_type_map.spill(index_file)
+            network_id = self._upload(index_file)
+        return ImportReport(
+            network_id,
+            dict(self.counts),
+            self.models,
+            dict(self.stats),
+            time.perf_counter() - started,
+        )
+
+    def _setup_context(self) -> None:
+        options = self.options
+        context = EPANET_CONTEXT
+        self.context_fragment = None
+        self.context_headers = None
+        self.content_type = "application/json"
+        # Attribute names in URLs (DELETE .../attrs/{name}) need the context as Link
+        self.attribute_headers = {"Link": link_header(context)}
+        self.expander = None
+        if options.context_mode == "inline":
+            self.context_fragment = context_fragment(context, self.endpoint.serializer)
+            self.content_type = "application/ld+json"
+        elif options.context_mode == "link":
+            self.context_headers = self.attribute_headers
+        else:
+            context_cache = ContextCache(
+                options.context_cache,
+                files={context: options.context_file} if options.context_file else None,
+            )
+            if options.context_refresh:
+                context_cache.get(context, refresh=True)
+            self.expander = ContextExpander.load(context, context_cache)
+            self.attribute_headers = None
+
+    def _upload(self, index_file: Optional[str]) -> Optional[str]:
+        options = self.options
+        metrics = self.metrics
+        elements = (
+            self._iter_streamed_elements(index_file)
+            if options.stream
+            else self._iter_elements()
+        )
+        if metrics is not None and options.stream:
+            elements = metrics.timed(elements, "parse", "stream")
+        if options.workers > 1:
+            from .parallel import convert_parallel
+
+            models = convert_parallel(
+                elements,
+                self._workers,
+                options.workers,
+                self._static_attributes,
+                metrics=metrics,
+            )
+        else:
+            models = self._convert_elements(elements)
+
+        composed_of = []
+        counts = self.counts if options.stream else None
+        for model in models:
+            composed_of.append(model_id(model))
+            if counts is not None:
+                type_ = model_type(model)
+                counts[type_] = counts.get(type_, 0) + 1
+            self.upload_model(model)
+
+        # All members have to be stored before the network referencing them is created
+        self._flush_models()
+        if self._uploader is not None:
+            self._uploader.drain()
+
+        if options.resume:
+            # Members confirmed by the interrupted run are only known from the journal
+            networks = self.make_urn("", "WaterNetwork")
+            composed_of = [
+                urn for urn in self.journal.urns() if not urn.startswith(networks)
+            ]
+        network_id = None
+        if not self.selected_tiles:
+            network_id = self._compose_network(composed_of)
+
+        if self._manifest is not None and options.delete_missing:
+            for entity_id in self._manifest.missing():
+                self._dispatch(self._delete_model, entity_id)
+        if self._uploader is not None:
+            self._uploader.join()
+        return network_id
+
+    def _dispatch(self, fn, *fn_args) -> None:
+        if self._uploader is None:
+            fn(*fn_args)
+        else:
+            self._uploader.submit(fn, *fn_args)
+
+    def _update_progress(self, count: int, **counters) -> None:
+        with self._lock:
+            self.models += count
+            for key, value in counters.items():
+                self.stats[key] = self.stats.get(key, 0) + value
+            if self.progress is not None:
+                self.progress(count, **counters)
+
+    def _check_response(self, method, path, entity_id, status, res, body=None):
+        if 200 <= status <= 299:
+            return
+        raise UploadError(
+            f"Got status code {status} while posting {entity_id}.",
+            _response_details(method, path, entity_id, res, body),
+        )
+
+    def _confirm_models(self, entity_ids, changed=True) -> None:
+        for entity_id in entity_ids:
+            if self._manifest is not None and changed:
+                self._manifest.confirm(entity_id)
+            self.journal.record(entity_id)
+
+    def _encode_model(self, data: dict) -> EncodedEntity:
+        """Serializes an entity dict once, with the @context spliced in (inline mode)"""
+        dumps = self.endpoint.serializer.dumps
+        if self.metrics is None:
+            payload = dumps(data)
+        else:
+            with self.metrics.timer("serialize", data["type"]):
+                payload = dumps(data)
+        if self.context_fragment is not None:
+            payload = splice(payload, self.context_fragment)
+        return EncodedEntity(data["id"], payload)
+
+    def upload_model(self, data: Model) -> None:
+        """Uploads an entity dict or an entity already serialized by convert_parallel()"""
+        if self.expander is not None and isinstance(data, dict):
+            data = self.expander.expand(data)
+        if model_id(data) in self.journal:
+            if self._manifest is not None:
+                # Still part of the network, so --delete-missing keeps it
+                if self._manifest.diff(data).action != "unchanged":
+                    self._manifest.confirm(data["id"])
+            self._update_progress(1, skipped=1)
+            return
+        if self._manifest is not None:
+            change = self._manifest.diff(data)
+            if change.action == "unchanged":
+                self._confirm_models([data["id"]], changed=False)
+                self._update_progress(1, unchanged=1)
+                return
+            if change.action == "update":
+                self._dispatch(self._patch_model, data, change)
+                return
+        if isinstance(data, dict):
+            data = self._encode_model(data)
+        if self.options.batch_size > 0:
+            self._pending.append(data)
+            if len(self._pending) >= self.options.batch_size:
+                self._flush_models()
+            return
+        self._dispatch(self._post_model, data)
+
+    def _post_model(self, data: EncodedEntity) -> None:
+        path = "/ngsi-ld/v1/entities/"
+        body = data.payload
+        post = self.endpoint.post
+        if self.metrics is None:
+            status, res = post(path, body, self.content_type, self.context_headers)
+        else:
+            with self.metrics.timer("upload", model_type(data)):
+                status, res = post(path, body, self.content_type, self.context_headers)
+        if not (status == 409 and self.options.resume):
+            # When resuming, entities created after the last journal flush already exist
+            self._check_response("POST", path, model_id(data), status, res, body)
+        self._confirm_models([model_id(data)])
+        self._update_progress(1)
+
+    def _patch_model(self, data: dict, change) -> None:
+        """Sends the changed attributes of an entity and deletes the removed ones.
+
+        PATCH only updates attributes the entity already has, new ones are
+        appended with POST. A 207 answer lists attributes the broker did not
+        store, which must not be confirmed in the manifest.
+        """
+        path = entity_path(data["id"]) + "/attrs"
+        for method, keys in (("POST", change.added), ("PATCH", change.changed)):
+            if not keys:
+                continue
+            attrs = {key: data[key] for key in keys}
+            if self.context_fragment is not None:
+                attrs["@context"] = EPANET_CONTEXT
+            send = self.endpoint.post if method == "POST" else self.endpoint.patch
+            status, res = send(path, attrs, self.content_type, self.context_headers)
+            if status == 207:
+                raise UploadError(
+                    f"Got status code 207 while updating {data['id']}, "
+                    "not all attributes were stored.",
+                    _response_details(method, path, data["id"], res, attrs),
+                )
+            self._check_response(method, path, data["id"], status, res, attrs)
+        for key in change.removed:
+            status, res = self.endpoint.delete(
+                f"{path}/{quote(key, safe='')}", self.attribute_headers
+            )
+            self._check_response("DELETE", f"{path}/{key}", data["id"], status, res)
+        self._confirm_models([data["id"]])
+        self._update_progress(1, updated=1)
+
+    def _delete_model(self, entity_id: str) -> None:
+        path = entity_path(entity_id)
+        status, res = self.endpoint.delete(path)
+        if status != 404:
+            self._check_response("DELETE", path, entity_id, status, res)
+        self._manifest.forget(entity_id)
+        self._update_progress(0, deleted=1)
+
+    def _flush_models(self) -> None:
+        if not self._pending:
+            return
+        entities = list(self._pending)
+        self._pending.clear()
+        self._dispatch(self._post_batch, entities)
+
+    def _post_batch(self, entities: List[EncodedEntity]) -> None:
+        operation = self.options.batch_operation
+        payloads = [entity.payload for entity in entities]
+        if self.metrics is None:
+            status, res = self.endpoint.batch(
+                operation, payloads, self.content_type, self.context_headers
+            )
+        else:
+            with self.metrics.timer("upload", "batch"):
+                status, res = self.endpoint.batch(
+                    operation, payloads, self.content_type, self.context_headers
+                )
+        result = BatchResult.from_response(status, res, [model_id(e) for e in entities])
+        if self.options.resume:
+            # Entities created after the last journal flush already exist
+            result.accept_existing()
+        self._confirm_models(result.succeeded)
+        self._update_progress(len(entities), batches=1, failed=len(result.errors))
+        if not result.ok:
+            details = [f"Batch {operation} failed for {len(result.errors)} entities:"]
+            for entity_id, error in result.errors.items():
+                details.append(f"  {entity_id}: {error}")
+            raise UploadError(
+                f"Got status code {status} while posting a batch of {len(entities)} entities.",
+                "\n".join(details),
+            )
+
+    def _compose_network(self, members: List[str]) -> str:
+        """Uploads the WaterNetwork entity, split into sub-networks with network_chunk_size.
+
+        Every sub-network lists at most network_chunk_size members, and the levels
+        are nested until the top-level network does too. Each level is stored before
+        the one referencing it. The members are sorted first, so an import resumed
+        from the journal splits them the same way.
+        """
+        name = self.options.network_name
+        size = self.options.network_chunk_size
+        if size > 0:
+            members = sorted(members)
+        level = 0
+        while size > 0 and len(members) > size:
+            level += 1
+            parts = []
+            for start in range(0, len(members), size):
+                part_name = f"{name}-{level}-{start // size + 1}"
+                part = {
+                    "id": self.make_urn(part_name, "WaterNetwork"),
+                    "type": "WaterNetwork",
+                    "isComposedOf": members[start : start + size],
+                    "name": part_name,
+                }
+                parts.append(part["id"])
+                self.upload_model(part)
+            self._flush_models()
+            if self._uploader is not None:
+                self._uploader.drain()
+            members = parts
+        network = {
+            "id": self.make_urn(name, "WaterNetwork"),
+            "type": "WaterNetwork",
+            "isComposedOf": members,
+            "description": self.data["name"] + "\n\n" + self.data["comment"],
+            "name": name,
+        }
+        self.upload_model(network)
+        self._flush_models()
+        if self._uploader is not None:
+            self._uploader.drain()
+        return network["id"]
+
+    def _iter_elements(self) -> Iterator[Tuple[str, dict]]:
+        if self.tile_groups is not None:
+            from .spatial import iter_grouped
+
+            yield from iter_grouped(self.tile_groups, self.selected_tiles)
+            if self.selected_tiles:
+                return
+            for type_ in ("Curve", "Pattern"):
+                for element in self.elements[type_]:
+                    yield type_, element
+            return
+        for type_, elements in self.elements.items():
+            for element in elements:
+                yield type_, element
+
+    def _iter_streamed_elements(
+        self, index_file: Optional[str]
+    ) -> Iterator[Tuple[str, dict]]:
+        """Yields the elements in file order while the input is read.
+
+        Links need the types of their nodes and patterns need the time options. WNTR
+        writes both in that order, but when a file has them the other way around
+        (e.g. with sorted keys), those sections are read in a second pass over the
+        file.
+        """
+        from .streaming import iter_sections
+
+        data = self.data
+        node_id_type_map = self.node_id_type_map
+        spilled = False
+        deferred = set()
+        for pass_ in range(2):
+            for key, value in iter_sections(self.source, STREAMED_SECTIONS):
+                if pass_ == 1 and key not in deferred:
+                    continue
+                if key == "nodes":
+                    node_id_type_map.add(value["name"], value["node_type"])
+                    yield value["node_type"], value
+                elif key == "links":
+                    if not node_id_type_map:
+                        deferred.add(key)
+                        continue
+                    if index_file and not spilled:
+                        node_id_type_map.spill(index_file)
+                        spilled = True
+                    yield value["link_type"], value
+                elif key == "curves":
+                    yield "Curve", value
+                elif key == "patterns":
+                    if "options" not in data:
+                        deferred.add(key)
+                        continue
+                    yield "Pattern", value
+                elif pass_ == 0:
+                    data[key] = value
+            if not deferred:
+                break
+
+    def _static_attributes(self, type_: str) -> Optional[Dict[str, Any]]:
+        if type_ == "Pattern":
+            return pattern_static(self.data["options"])
+        return None
+
+    def _convert_elements(self, elements) -> Iterator[dict]:
+        converters = {}
+        metrics = self.metrics
+        for type_, element in elements:
+            convert = converters.get(type_)
+            if convert is None:
+                # Compiled on first use, the options are only known by then when streaming
+                convert = converters[type_] = EPANET_CONVERTERS.compile(
+                    type_,
+                    self.make_urn,
+                    self.node_id_type_map,
+                    self._static_attributes(type_),
+                    self.converter_options,
+                )
+                if metrics is not None:
+                    convert = converters[type_] = _timed_converter(
+                        convert, type_, metrics
+                    )
+            yield convert(element)
+
+
+def _element_copy(element: dict) -> dict:
+    """Copy of a node or link, with its own demands (their patterns are rewritten)"""
+    element = dict(element)
+    demands = element.get("demand_timeseries_list")
+    if demands:
+        element["demand_timeseries_list"] = [
+            dict(demand) if isinstance(demand, dict) else demand for demand in demands
+        ]
+    return element
+
+
+def _timed_converter(convert, type_, metrics):
+    def timed(element):
+        with metrics.timer("convert", type_):
+            return convert(element)
+
+    return timed
+
+
+def import_network(
+    source: Union[str, dict],
+    endpoint: "ScenarioManagerEndpoint",
+    options: ImportOptions,
+    metrics: Optional[Metrics] = None,
+    progress: Optional[Progress] = None,
+) -> ImportReport:
+    """Imports a WNTR network (file path or parsed dict), see NetworkImport"""
+    return NetworkImport(source, endpoint, options, metrics, progress).run()
@@ -0,0 +1,95 @@
+import os
+import threading
+from typing import Iterator, List, Optional, Set
+
+_HEADER_PREFIX = "# "
+
+
+class UploadJournal:
+    """Append-only file of the URNs the broker confirmed, one per line.
+
+    Confirmations are buffered and written every ``flush_every`` entries, so
+    journaling costs one write per batch instead of one per entity. The first line
+    identifies the import (e.g. scenario and network), and reopening the journal
+    with ``resume=True`` fails if it belongs to another import. Safe to use from
+    the upload worker threads. Without a ``path`` the URNs are only kept in memory,
+    for imports which are never resumed.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str],
+        header: str,
+        resume: bool = False,
+        flush_every: int = 1000,
+    ):
+        self.path = path
+        self._lock = threading.Lock()
+        self._buffer: List[str] = []
+        self._flush_every = flush_every
+        self._confirmed: Set[str] = set()
+        self._file = None
+        if path is None:
+            return
+        if resume and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                found = f.readline().rstrip("\n")
+                if found != _HEADER_PREFIX + header:
+                    raise ValueError(
+                        f"Journal {path} belongs to another import ({found[2:]!r})."
+                    )
+                self._confirmed.update(line.rstrip("\n") for line in f if line != "\n")
+            self._file = open(path, "a", encoding="utf-8")
+        else:
+            self._file = open(path, "w", encoding="utf-8")
+            self._file.write(_HEADER_PREFIX + header + "\n")
+            self._file.flush()
+
+    def __contains__(self, urn: str) -> bool:
+        return urn in self._confirmed
+
+    def __len__(self) -> int:
+        return len(self._confirmed)
+
+    def record(self, urn: str) -> None:
+        with self._lock:
+            if urn in self._confirmed:
+                return
+            self._confirmed.add(urn)
+            self._buffer.append(urn)
+            if len(self._buffer) >= self._flush_every:
+                self._flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._file is None:
+            self._buffer.clear()
+            return
+        if not self._buffer:
+            return
+        self._file.write("\n".join(self._buffer) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._buffer.clear()
+
+    def urns(self) -> Iterator[str]:
+        """All confirmed URNs in the order they were journaled"""
+        if self.path is None:
+            yield from list(self._confirmed)
+            return
+        self.flush()
+        with open(self.path, "r", encoding="utf-8") as f:
+            f.readline()
+            for line in f:
+                if line != "\n":
+                    yield line.rstrip("\n")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is None or self._file.closed:
+                return
+            self._flush()
+            self._file.close()
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, NamedTuple
+
+# Keys which identify an entity instead of being attributes
+_ENTITY_KEYS = ("id", "type", "@context")
+
+
+class EntityChange(NamedTuple):
+    """Difference between an entity and the version recorded by the last import"""
+
+    action: str  # "create", "update" or "unchanged"
+    # Attributes recorded before whose value changed (PATCH) ...
+    changed: List[str]
+    removed: List[str]
+    # ... and attributes which are new since the last import (append, POST)
+    added: List[str]
+
+
+def attribute_digests(entity: dict) -> Dict[str, str]:
+    return {
+        key: hashlib.sha1(
+            json.dumps(value, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        ).hexdigest()
+        for key, value in entity.items()
+        if key not in _ENTITY_KEYS
+    }
+
+
+def _compare(previous: Dict[str, str], digests: Dict[str, str]) -> EntityChange:
+    changed = [
+        key
+        for key, digest in digests.items()
+        if key in previous and previous[key] != digest
+    ]
+    added = [key for key in digests if key not in previous]
+    removed = [key for key in previous if key not in digests]
+    if not changed and not removed and not added:
+        return EntityChange("unchanged", [], [], [])
+    return EntityChange("update", changed, removed, added)
+
+
+class ImportManifest:
+    """Local record of the content hashes of imported entities, per attribute.
+
+    Entries are keyed by scenario, URN prefix and URN, so one manifest file can
+    serve several scenarios. ``diff()`` compares an entity with the last confirmed
+    upload and marks it as seen in this run, ``confirm()`` records it once the
+    broker accepted it. URNs which were not seen are returned by ``missing()``.
+    Safe to use from the upload worker threads.
+    """
+
+    def __init__(self, path: str, scenario: str, prefix: str, commit_every: int = 1000):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS entities (
+                scenario TEXT NOT NULL,
+                prefix TEXT NOT NULL,
+                urn TEXT NOT NULL,
+                attributes TEXT NOT NULL,
+                seen INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (scenario, prefix, urn)
+            )""")
+        self._key = (scenario, prefix)
+        self._db.execute(
+            "UPDATE entities SET seen = 0 WHERE scenario = ? AND prefix = ?", self._key
+        )
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Dict[str, str]] = {}
+        self._commit_every = commit_every
+        self._uncommitted = 0
+
+    def diff(self, entity: dict) -> EntityChange:
+        urn = entity["id"]
+        digests = attribute_digests(entity)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT attributes FROM entities WHERE scenario = ? AND prefix = ? AND urn = ?",
+                (*self._key, urn),
+            ).fetchone()
+            if row is None:
+                change = EntityChange("create", [], [], list(digests))
+            else:
+                self._db.execute(
+                    "UPDATE entities SET seen = 1 WHERE scenario = ? AND prefix = ? AND urn = ?",
+                    (*self._key, urn),
+                )
+                change = _compare(json.loads(row[0]), digests)
+            if change.action != "unchanged":
+                self._pending[urn] = digests
+        return change
+
+    def confirm(self, urn: str) -> None:
+        """Records the entity passed to ``diff()`` as successfully uploaded"""
+        with self._lock:
+            digests = self._pending.pop(urn)
+            self._db.execute(
+                "INSERT OR REPLACE INTO entities (scenario, prefix, urn, attributes, seen)"
+                " VALUES (?, ?, ?, ?, 1)",
+                (*self._key, urn, json.dumps(digests, separators=(",", ":"))),
+            )
+            self._count_write()
+
+    def missing(self) -> Iterator[str]:
+        """URNs recorded by previous imports which were not part of this one"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT urn FROM entities WHERE scenario = ? AND prefix = ? AND seen = 0",
+                self._key,
+            ).fetchall()
+        for (urn,) in rows:
+            yield urn
+
+    def forget(self, urn: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM entities WHERE scenario = ? AND prefix = ? AND urn = ?",
+                (*self._key, urn),
+            )
+            self._count_write()
+
+    def _count_write(self) -> None:
+        self._uncommitted += 1
+        if self._uncommitted >= self._commit_every:
+            self._db.commit()
+            self._uncommitted = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.commit()
+            self._db.close()
@@ -0,0 +1,224 @@
+import json
+import os
+import threading
+import time
+from argparse import Namespace
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Upper bounds in seconds, like the Prometheus default buckets but starting at 10µs
+BUCKETS = (
+    0.00001,
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    float("inf"),
+)
+
+
+class Histogram:
+    """Count, sum and maximum of durations, and their distribution over ``BUCKETS``"""
+
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float, n: int = 1) -> None:
+        self.counts[bisect_left(BUCKETS, seconds)] += n
+        self.count += n
+        self.sum += seconds * n
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (the maximum for +Inf)"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip(map(str, BUCKETS), self.counts)),
+        }
+
+
+class Metrics:
+    """Timers and counters of the import stages.
+
+    Durations are kept as histograms per stage (parse, convert, serialize, http,
+    server, upload) and label (entity type or HTTP method), counters count e.g.
+    requests, retries and bytes sent. Code paths only call into this class when
+    metrics are enabled (``Metrics.from_args()`` returns None otherwise), so there
+    is no overhead without them.
+    """
+
+    def __init__(
+        self,
+        summary: bool = True,
+        json_file: Optional[str] = None,
+        prometheus_file: Optional[str] = None,
+    ):
+        self.summary = summary
+        self.json_file = json_file
+        self.prometheus_file = prometheus_file
+        self._histograms: Dict[Tuple[str, str], Histogram] = {}
+        self._counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    @classmethod
+    def from_args(cls, args: Namespace) -> Optional["Metrics"]:
+        if not (args.metrics or args.metrics_json or args.metrics_prometheus):
+            return None
+        return cls(args.metrics, args.metrics_json, args.metrics_prometheus)
+
+    def observe(self, stage: str, label: str, seconds: float, n: int = 1) -> None:
+        """Records ``n`` durations of ``seconds`` each"""
+        with self._lock:
+            histogram = self._histograms.get((stage, label))
+            if histogram is None:
+                histogram = self._histograms[(stage, label)] = Histogram()
+            histogram.observe(seconds, n)
+
+    def count(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    @contextmanager
+    def timer(self, stage: str, label: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, label, time.perf_counter() - start)
+
+    def timed(self, iterable: Iterable[T], stage: str, label: str) -> Iterator[T]:
+        """Iterates over ``iterable``, recording the time each item takes to produce"""
+        iterator = iter(iterable)
+        clock = time.perf_counter
+        while True:
+            start = clock()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.observe(stage, label, clock() - start)
+            yield item
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            stages: Dict[str, Dict[str, dict]] = {}
+            for (stage, label), histogram in sorted(self._histograms.items()):
+                stages.setdefault(stage, {})[label] = histogram.to_dict()
+            return {
+                "elapsed": time.perf_counter() - self._start,
+                "counters": dict(sorted(self._counters.items())),
+                "stages": stages,
+            }
+
+    def format_summary(self) -> str:
+        data = self.to_dict()
+        rows: List[List[str]] = [
+            ["stage", "label", "count", "total s", "mean ms", "p50 ms", "p99 ms"]
+        ]
+        for stage, labels in data["stages"].items():
+            for label, h in labels.items():
+                rows.append(
+                    [
+                        stage,
+                        label,
+                        str(h["count"]),
+                        f"{h['sum']:.3f}",
+                        f"{h['sum'] / h['count'] * 1000:.3f}",
+                        f"{h['p50'] * 1000:.3f}",
+                        f"{h['p99'] * 1000:.3f}",
+                    ]
+                )
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        lines = ["-[ Metrics ]------------------------"]
+        for row in rows:
+            lines.append(
+                "  ".join(
+                    cell.ljust(width) if i < 2 else cell.rjust(width)
+                    for i, (cell, width) in enumerate(zip(row, widths))
+                )
+            )
+        for name, value in data["counters"].items():
+            lines.append(f"{value:12g} {name}")
+        lines.append(f"{data['elapsed']:12.3f} seconds total")
+        return "\n".join(lines)
+
+    def format_prometheus(self, prefix: str = "kb_import") -> str:
+        """The metrics in the Prometheus text format.
+
+        Suitable for the node exporter textfile collector or a POST to a
+        pushgateway (``curl --data-binary @file <gateway>/metrics/job/<job>``).
+        """
+        data = self.to_dict()
+        lines = [
+            f"# HELP {prefix}_stage_seconds Duration of the import stages",
+            f"# TYPE {prefix}_stage_seconds histogram",
+        ]
+        for stage, labels in data["stages"].items():
+            for label, h in labels.items():
+                selector = f'stage="{stage}",label="{label}"'
+                cumulative = 0
+                for bound, count in h["buckets"].items():
+                    cumulative += count
+                    le = "+Inf" if bound == "inf" else bound
+                    lines.append(
+                        f'{prefix}_stage_seconds_bucket{{{selector},le="{le}"}} {cumulative}'
+                    )
+                lines.append(f"{prefix}_stage_seconds_sum{{{selector}}} {h['sum']}")
+                lines.append(f"{prefix}_stage_seconds_count{{{selector}}} {h['count']}")
+        for name, value in data["counters"].items():
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        lines.append(f"# TYPE {prefix}_elapsed_seconds gauge")
+        lines.append(f"{prefix}_elapsed_seconds {data['elapsed']}")
+        return "\n".join(lines) + "\n"
+
+    def report(self) -> None:
+        """Prints the summary and writes the metrics files, as configured"""
+        if self.summary:
+            print(self.format_summary())
+        if self.json_file:
+            with open(self.json_file, "w") as f:
+                json.dump(self.to_dict(), f, indent=2)
+        if self.prometheus_file:
+            # Written atomically, as the textfile collector may read it any time
+            tmp = self.prometheus_file + ".tmp"
+            with open(tmp, "w") as f:
+                f.write(self.format_prometheus())
+            os.replace(tmp, self.prometheus_file)
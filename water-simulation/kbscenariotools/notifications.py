@@ -0,0 +1,294 @@
+"""Receiver for NGSI-LD notifications, used as the endpoint of subscriptions.
+
+A small HTTP/1.1 server on asyncio (keep-alive, Content-Length and chunked
+bodies) accepting notification POSTs. Every notification is appended to a JSON
+Lines file in batches, with the time it was received, and its delivery latency
+(from ``notifiedAt``) and end-to-end latency (from the latest ``modifiedAt`` or
+``observedAt`` of its entities) are recorded.
+"""
+
+import asyncio
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+from .endpoint import ScenarioManagerEndpoint
+from .metrics import Histogram, Metrics
+from .serializer import Serializer, get_serializer
+
+NOTIFY_PATH = "/notify"
+SUBSCRIPTIONS_PATH = "/ngsi-ld/v1/subscriptions/"
+TIMESTAMP_KEYS = ("modifiedAt", "observedAt")
+
+_NO_CONTENT = b"HTTP/1.1 204 No Content\r\nContent-Length: 0\r\n\r\n"
+_NOT_FOUND = b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n"
+_BAD_REQUEST = (
+    b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+)
+
+
+def parse_timestamp(value: Any) -> Optional[float]:
+    """Seconds since the epoch of an ISO 8601 timestamp, None if it is not one"""
+    if not isinstance(value, str):
+        return None
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def latest_change(entity: dict) -> Optional[float]:
+    """The latest modifiedAt or observedAt of an entity and its attributes"""
+    latest = None
+    candidates = [entity]
+    for value in entity.values():
+        if isinstance(value, dict):
+            candidates.append(value)
+        elif isinstance(value, list):
+            candidates.extend(v for v in value if isinstance(v, dict))
+    for candidate in candidates:
+        for key in TIMESTAMP_KEYS:
+            timestamp = parse_timestamp(candidate.get(key))
+            if timestamp is not None and (latest is None or timestamp > latest):
+                latest = timestamp
+    return latest
+
+
+def subscription(
+    types: Sequence[str],
+    notify_url: str,
+    context: Optional[str] = None,
+    id_pattern: Optional[str] = None,
+    watched_attributes: Optional[Sequence[str]] = None,
+    subscription_id: Optional[str] = None,
+) -> dict:
+    """A subscription to changes of entities of ``types``, notifying ``notify_url``.
+
+    The notifications carry the system attributes, for the end-to-end latency.
+    """
+    entities = [{"type": type_} for type_ in types]
+    if id_pattern:
+        for entity in entities:
+            entity["idPattern"] = id_pattern
+    data = {
+        "id": subscription_id or f"urn:ngsi-ld:Subscription:sink-{uuid.uuid4()}",
+        "type": "Subscription",
+        "entities": entities,
+        "notification": {
+            "endpoint": {"uri": notify_url, "accept": "application/json"},
+            "format": "normalized",
+            "sysAttrs": True,
+        },
+    }
+    if watched_attributes:
+        data["watchedAttributes"] = list(watched_attributes)
+    if context:
+        data["@context"] = context
+    return data
+
+
+def create_subscription(endpoint: ScenarioManagerEndpoint, data: dict) -> str:
+    """Creates the subscription at the broker, returns its id"""
+    status, res = endpoint.post(SUBSCRIPTIONS_PATH, data, "application/ld+json")
+    if status != 201:
+        raise RuntimeError(
+            f"Got status code {status} creating the subscription {data['id']}: {res}"
+        )
+    return data["id"]
+
+
+def delete_subscription(
+    endpoint: ScenarioManagerEndpoint, subscription_id: str
+) -> None:
+    status, res = endpoint.delete(f"{SUBSCRIPTIONS_PATH}{subscription_id}")
+    if status not in (204, 404):
+        raise RuntimeError(
+            f"Got status code {status} deleting the subscription {subscription_id}: {res}"
+        )
+
+
+class JsonLinesSink:
+    """Appends lines to a file in batches, written off the event loop"""
+
+    def __init__(self, path: str, flush_size: int = 1000):
+        self.path = path
+        self.flush_size = flush_size
+        self._file = open(path, "ab")
+        self._lines: List[bytes] = []
+        self._writing: Optional[asyncio.Future] = None
+
+    def add(self, line: bytes) -> None:
+        self._lines.append(line)
+        if len(self._lines) >= self.flush_size and self._writing is None:
+            self._writing = asyncio.ensure_future(self._write())
+
+    async def _write(self) -> None:
+        try:
+            while self._lines:
+                lines, self._lines = self._lines, []
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self._file.write, b"".join(lines)
+                )
+        finally:
+            self._writing = None
+
+    async def flush(self) -> None:
+        """Writes the pending lines; one write at a time, so the order is kept"""
+        while self._writing is not None:
+            await self._writing
+        if self._lines:
+            self._writing = asyncio.ensure_future(self._write())
+            await self._writing
+        await asyncio.get_running_loop().run_in_executor(None, self._file.flush)
+
+    async def close(self) -> None:
+        await self.flush()
+        self._file.close()
+
+
+class NotificationReceiver:
+    """Accepts notification POSTs on ``path`` and records them.
+
+    Counters (notifications, entities, notification_bytes) and the latencies
+    (stage "notification", labels "delivery" and "end_to_end") go to
+    ``metrics``. ``interval`` holds the latencies since the last call of
+    ``take_interval()``, for periodic reports.
+    """
+
+    def __init__(
+        self,
+        metrics: Metrics,
+        sink: Optional[JsonLinesSink] = None,
+        path: str = NOTIFY_PATH,
+        serializer: Optional[Serializer] = None,
+    ):
+        self.metrics = metrics
+        self.sink = sink
+        self.path = path.encode("ascii")
+        self.serializer = serializer or get_serializer()
+        self.notifications = 0
+        self.entities = 0
+        self.interval: Dict[str, Histogram] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+    async def start(self, host: str, port: int) -> None:
+        self._server = await asyncio.start_server(self._serve, host, port, backlog=1024)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        # Idle keep-alive connections end with EOF, when their transport is closed
+        for writer in self._connections.values():
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        if self.sink is not None:
+            await self.sink.close()
+
+    def take_interval(self) -> Dict[str, Histogram]:
+        interval, self.interval = self.interval, {}
+        return interval
+
+    async def _serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self._connections[asyncio.current_task()] = writer
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                request_line, _, header_block = head.partition(b"\r\n")
+                method, _, rest = request_line.partition(b" ")
+                target = rest.partition(b" ")[0]
+                headers = {}
+                for line in header_block.split(b"\r\n"):
+                    name, _, value = line.partition(b":")
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+                try:
+                    body = await self._read_body(reader, headers)
+                except (ValueError, asyncio.IncompleteReadError):
+                    writer.write(_BAD_REQUEST)
+                    break
+                received = time.time()
+                if method == b"POST" and target.split(b"?")[0] == self.path:
+                    self._record(body, received)
+                    writer.write(_NO_CONTENT)
+                else:
+                    writer.write(_NOT_FOUND)
+                await writer.drain()
+                if headers.get(b"connection", b"").lower() == b"close":
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            del self._connections[asyncio.current_task()]
+            writer.close()
+
+    @staticmethod
+    async def _read_body(reader: asyncio.StreamReader, headers: dict) -> bytes:
+        if headers.get(b"transfer-encoding", b"").lower() == b"chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if size == 0:
+                    # Trailers, if any, end with an empty line
+                    while await reader.readuntil(b"\r\n") != b"\r\n":
+                        pass
+                    return b"".join(chunks)
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+        length = int(headers.get(b"content-length", b"0"))
+        return await reader.readexactly(length) if length else b""
+
+    def _observe(self, label: str, seconds: float, n: int = 1) -> None:
+        # Clocks of the broker and this host are not synchronized perfectly
+        seconds = max(seconds, 0.0)
+        self.metrics.observe("notification", label, seconds, n)
+        histogram = self.interval.get(label)
+        if histogram is None:
+            histogram = self.interval[label] = Histogram()
+        histogram.observe(seconds, n)
+
+    def _record(self, body: bytes, received: float) -> None:
+        self.metrics.count("notification_bytes", len(body))
+        try:
+            notification = self.serializer.loads(body)
+        except ValueError:
+            self.metrics.count("invalid_notifications")
+            return
+        if not isinstance(notification, dict):
+            self.metrics.count("invalid_notifications")
+            return
+        entities = notification.get("data") or []
+        self.notifications += 1
+        self.entities += len(entities)
+        self.metrics.count("notifications")
+        self.metrics.count("entities", len(entities))
+        notified_at = parse_timestamp(notification.get("notifiedAt"))
+        if notified_at is not None:
+            self._observe("delivery", received - notified_at)
+        for entity in entities:
+            if isinstance(entity, dict):
+                changed = latest_change(entity)
+                if changed is not None:
+                    self._observe("end_to_end", received - changed)
+        if self.sink is not None:
+            # Raw newlines in JSON are whitespace, strings have them escaped
+            timestamp = datetime.fromtimestamp(received, timezone.utc).isoformat()
+            self.sink.add(
+                b'{"receivedAt":"'
+                + timestamp.replace("+00:00", "Z").encode("ascii")
+                + b'","notification":'
+                + body.replace(b"\r", b" ").replace(b"\n", b" ")
+                + b"}\n"
+            )
@@ -0,0 +1,186 @@
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby, islice
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from .context import ContextExpander
+from .converters import EPANET_CONVERTERS, urn_factory
+from .idindex import IdTypeIndex
+from .metrics import Metrics
+from .serializer import EncodedEntity, context_fragment, get_serializer, splice
+
+Element = Tuple[str, dict]
+
+
+class _LazyIndex:
+    """Opens the spilled node index on first use, i.e. with the first link chunk"""
+
+    def __init__(self, path: str):
+        self._path = path
+        self._index: Optional[IdTypeIndex] = None
+
+    def __getitem__(self, name: str) -> str:
+        if self._index is None:
+            self._index = IdTypeIndex.open(self._path)
+        return self._index[name]
+
+
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(
+    prefix: str,
+    index_path: str,
+    context: Optional[str],
+    serializer: str,
+    expander: Optional[ContextExpander],
+    converter_options: Tuple[str, ...],
+) -> None:
+    _worker["make_urn"] = urn_factory(prefix)
+    _worker["converter_options"] = converter_options
+    _worker["expander"] = expander
+    _worker["index"] = _LazyIndex(index_path)
+    _worker["dumps"] = get_serializer(serializer).dumps
+    _worker["context"] = (
+        None
+        if context is None
+        else context_fragment(context, get_serializer(serializer))
+    )
+    _worker["converters"] = {}
+
+
+def _convert_chunk(
+    type_: str, static: Optional[dict], elements: List[dict]
+) -> Tuple[List[Tuple[str, bytes]], float, float]:
+    """Returns the encoded entities and the time spent converting and serializing"""
+    converters = _worker["converters"]
+    convert = converters.get(type_)
+    if convert is None:
+        convert = converters[type_] = EPANET_CONVERTERS.compile(
+            type_,
+            _worker["make_urn"],
+            _worker["index"],
+            static,
+            _worker["converter_options"],
+        )
+    context = _worker["context"]
+    dumps = _worker["dumps"]
+    expander = _worker["expander"]
+    clock = time.perf_counter
+    results = []
+    converting = serializing = 0.0
+    for element in elements:
+        start = clock()
+        entity = convert(element)
+        if expander is not None:
+            entity = expander.expand(entity)
+        converted = clock()
+        payload = dumps(entity)
+        if context is not None:
+            payload = splice(payload, context)
+        results.append((entity["id"], payload))
+        converting += converted - start
+        serializing += clock() - converted
+    return results, converting, serializing
+
+
+def _chunks(elements: Iterable[Element], chunk_size: int) -> Iterator[Tuple[str, list]]:
+    for type_, group in groupby(elements, key=lambda element: element[0]):
+        group = (element for _, element in group)
+        while True:
+            chunk = list(islice(group, chunk_size))
+            if not chunk:
+                break
+            yield type_, chunk
+
+
+def start_workers(
+    workers: int,
+    prefix: str,
+    index_path: str,
+    context: Optional[str] = None,
+    serializer: str = "auto",
+    expander: Optional[ContextExpander] = None,
+    converter_options: Tuple[str, ...] = (),
+) -> ProcessPoolExecutor:
+    """Starts the process pool for ``convert_parallel()``.
+
+    The workers are forked right away, so call it before any threads are started
+    (e.g. the upload threads): a forked child only inherits the calling thread,
+    and locks held by the others at that moment would never be released. Forked
+    workers, unlike spawned ones, do not re-run the importing script. The node
+    index is not pickled: the workers open the memory-mapped file at
+    ``index_path`` read-only, which therefore has to be complete before the first
+    link is converted. The entities are encoded with the named ``serializer``
+    and get the ``context`` spliced in, or are expanded with the ``expander``.
+    ``converter_options`` enable optional fields of the converters.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    mp_context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=mp_context,
+        initializer=_init_worker,
+        initargs=(prefix, index_path, context, serializer, expander, converter_options),
+    )
+    try:
+        # With fork all workers are started by the first task, which also raises
+        # if they could not be initialized
+        executor.submit(os.getpid).result()
+    except BaseException:
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    return executor
+
+
+def convert_parallel(
+    elements: Iterable[Element],
+    executor: ProcessPoolExecutor,
+    workers: int,
+    static: Callable[[str], Optional[dict]],
+    chunk_size: int = 500,
+    metrics: Optional[Metrics] = None,
+) -> Iterator[EncodedEntity]:
+    """Converts ``(type, element)`` pairs on a process pool, keeping the input order.
+
+    ``executor`` is a pool of ``workers`` processes from ``start_workers()``.
+    Consecutive elements of one type are sent to the workers in chunks.
+    ``static(type)`` returns the static attributes of a type (see
+    ``ConverterRegistry.compile``). At most two chunks per worker are in flight,
+    so a slow consumer (the upload) holds back the conversion. The worker timings
+    are recorded in ``metrics`` as the mean per element and chunk.
+    """
+
+    def results(future, type_):
+        entities, converting, serializing = future.result()
+        if metrics is not None and entities:
+            metrics.observe("convert", type_, converting / len(entities), len(entities))
+            metrics.observe(
+                "serialize", type_, serializing / len(entities), len(entities)
+            )
+        return (EncodedEntity(*r) for r in entities)
+
+    pending = deque()
+    try:
+        for type_, chunk in _chunks(elements, chunk_size):
+            future = executor.submit(_convert_chunk, type_, static(type_), chunk)
+            pending.append((future, type_))
+            while len(pending) >= 2 * workers:
+                yield from results(*pending.popleft())
+        while pending:
+            yield from results(*pending.popleft())
+    finally:
+        for future, _ in pending:
+            future.cancel()
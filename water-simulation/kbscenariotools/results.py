@@ -0,0 +1,304 @@
+"""Simulation results (time series per node and link) for the NGSI-LD temporal API.
+
+WNTR results are handled as arrays of shape (steps, elements), one per attribute,
+read from a .npz file or from a directory of CSV files. Both are written from
+``wntr.sim.EpanetSimulator(wn).run_sim()`` results:
+
+    np.savez(
+        "results.npz",
+        time=results.node["pressure"].index.to_numpy(),
+        node_names=results.node["pressure"].columns.to_numpy(str),
+        link_names=results.link["flowrate"].columns.to_numpy(str),
+        **{f"node_{name}": frame.to_numpy() for name, frame in results.node.items()},
+        **{f"link_{name}": frame.to_numpy() for name, frame in results.link.items()},
+    )
+
+    for kind, frames in (("node", results.node), ("link", results.link)):
+        for name, frame in frames.items():
+            frame.to_csv(f"results/{kind}_{name}.csv")
+
+The attribute instances are encoded to JSON with vectorized string operations, a
+block of elements at a time, instead of building a dict per value. With orjson
+installed, the values of a block are formatted by a single call.
+"""
+
+import csv
+import os
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError("Results ingestion needs numpy (pip install numpy).")
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from .serializer import Serializer
+
+# (kind, WNTR result name) -> NGSI-LD attribute
+RESULT_ATTRIBUTES = {
+    ("node", "demand"): "demand",
+    ("node", "head"): "head",
+    ("node", "pressure"): "pressure",
+    ("node", "quality"): "quality",
+    ("link", "flowrate"): "flow",
+    ("link", "velocity"): "velocity",
+    ("link", "headloss"): "headloss",
+}
+RESULTS_MODES = ("temporal", "batch")
+TEMPORAL_ENTITIES_PATH = "/ngsi-ld/v1/temporal/entities/"
+
+
+class ResultTable(NamedTuple):
+    kind: str
+    attribute: str
+    names: List[str]
+    times: Optional["np.ndarray"]
+    values: "np.ndarray"
+
+
+def load_results(path: str) -> List[ResultTable]:
+    """Reads the known result attributes from a .npz file or a CSV directory"""
+    if os.path.isdir(path):
+        tables = _load_csv_dir(path)
+    else:
+        tables = _load_npz(path)
+    if not tables:
+        raise ValueError(f"No known result attributes found in {path}.")
+    steps = {table.values.shape[0] for table in tables}
+    if len(steps) > 1:
+        raise ValueError(f"The results in {path} differ in the number of steps.")
+    return tables
+
+
+def _load_npz(path: str) -> List[ResultTable]:
+    tables = []
+    with np.load(path, allow_pickle=False) as archive:
+        times = archive["time"].astype(np.float64) if "time" in archive else None
+        for (kind, name), attribute in RESULT_ATTRIBUTES.items():
+            key = f"{kind}_{name}"
+            if key not in archive:
+                continue
+            values = np.atleast_2d(archive[key].astype(np.float64))
+            names = [str(n) for n in archive[f"{kind}_names"]]
+            if values.shape[1] != len(names):
+                raise ValueError(
+                    f"{key} has {values.shape[1]} columns, not {len(names)}."
+                )
+            tables.append(ResultTable(kind, attribute, names, times, values))
+    return tables
+
+
+def _load_csv_dir(path: str) -> List[ResultTable]:
+    tables = []
+    for (kind, name), attribute in RESULT_ATTRIBUTES.items():
+        file = os.path.join(path, f"{kind}_{name}.csv")
+        if not os.path.exists(file):
+            continue
+        with open(file, "r", newline="") as f:
+            header = next(csv.reader(f))
+        # The first column is the time index, as written by DataFrame.to_csv()
+        data = np.loadtxt(file, delimiter=",", skiprows=1, ndmin=2, dtype=np.float64)
+        tables.append(ResultTable(kind, attribute, header[1:], data[:, 0], data[:, 1:]))
+    return tables
+
+
+def report_times(time_options: dict, tables: List[ResultTable]) -> "np.ndarray":
+    """Seconds since the simulation start of every reported step.
+
+    Computed from ``report_start`` and ``report_timestep`` of the network options,
+    and checked against the time index of the results when they have one.
+    """
+    steps = tables[0].values.shape[0]
+    seconds = time_options.get("report_start", 0.0) + time_options[
+        "report_timestep"
+    ] * np.arange(steps, dtype=np.float64)
+    for table in tables:
+        if table.times is not None and not np.allclose(table.times, seconds):
+            raise ValueError(
+                f"The times of the {table.kind} {table.attribute} results do not match "
+                "report_start and report_timestep of the network."
+            )
+    return seconds
+
+
+def observed_at(start: datetime, seconds: "np.ndarray") -> "np.ndarray":
+    """ISO 8601 UTC timestamps for offsets in seconds from ``start`` (naive UTC)"""
+    unit = "s" if np.all(seconds == np.round(seconds)) else "ms"
+    offsets = np.round(seconds * (1 if unit == "s" else 1000)).astype(
+        f"timedelta64[{unit}]"
+    )
+    times = np.datetime64(start, unit) + offsets
+    return np.char.add(np.datetime_as_string(times, unit=unit), "Z")
+
+
+def format_values(values: "np.ndarray") -> "np.ndarray":
+    """The shortest representations of float values, as a bytes array"""
+    if orjson is None:
+        return values.astype("S32")
+    encoded = orjson.dumps(
+        np.ascontiguousarray(values), option=orjson.OPT_SERIALIZE_NUMPY
+    )
+    # "[[a,b],[c,d]]" of a 2-dimensional array
+    tokens = encoded[2:-2].replace(b"],[", b",").split(b",")
+    return np.array(tokens).reshape(values.shape)
+
+
+def encode_instances(
+    values: "np.ndarray", timestamps: "np.ndarray", precision: Optional[int] = None
+) -> List[List[bytes]]:
+    """JSON attribute instances of a (steps, elements) block, per element.
+
+    Returns one list of encoded instances per element (column), with b"" for the
+    NaN and infinite values, which have no JSON representation.
+    """
+    if precision is not None:
+        values = np.round(values, precision)
+    head = np.char.add(b'{"type":"Property","value":', format_values(values))
+    tail = np.char.add(
+        np.char.add(b',"observedAt":"', np.char.encode(timestamps, "ascii")), b'"}'
+    )
+    instances = np.char.add(head, tail[:, None])
+    instances[~np.isfinite(values)] = b""
+    return instances.T.tolist()
+
+
+class ResultsEncoder:
+    """Encodes the results of a simulation as NGSI-LD payloads.
+
+    ``resolve(kind, name)`` returns the URN and type of an element. The results
+    of one kind are merged per element, so every payload carries all its
+    attributes. ``fragment`` (see ``context_fragment()``) is spliced into every
+    encoded entity.
+    """
+
+    def __init__(
+        self,
+        tables: List[ResultTable],
+        timestamps: "np.ndarray",
+        resolve: Callable[[str, str], Tuple[str, str]],
+        serializer: Serializer,
+        fragment: Optional[bytes] = None,
+        precision: Optional[int] = None,
+    ):
+        self.timestamps = timestamps
+        self.precision = precision
+        self._fragment = b"," + fragment + b"}" if fragment else b"}"
+        self.ids: List[str] = []
+        self._heads: List[bytes] = []
+        self._blocks: List[Tuple[int, Dict[str, "np.ndarray"]]] = []
+        for kind in ("node", "link"):
+            kind_tables = [table for table in tables if table.kind == kind]
+            if not kind_tables:
+                continue
+            names = list(dict.fromkeys(n for t in kind_tables for n in t.names))
+            columns = {}
+            for table in kind_tables:
+                if table.names == names:
+                    columns[table.attribute] = table.values
+                    continue
+                # Aligned to the merged names, elements missing in a table are NaN
+                index = {name: i for i, name in enumerate(table.names)}
+                order = np.array([index.get(name, -1) for name in names])
+                aligned = table.values[:, order]
+                aligned[:, order < 0] = np.nan
+                columns[table.attribute] = aligned
+            self._blocks.append((len(self.ids), columns))
+            for name in names:
+                urn, type_ = resolve(kind, name)
+                self.ids.append(urn)
+                self._heads.append(
+                    b'{"id":'
+                    + serializer.dumps(urn)
+                    + b',"type":'
+                    + serializer.dumps(type_)
+                )
+
+    @property
+    def steps(self) -> int:
+        return len(self.timestamps)
+
+    def count_temporal(self, steps_per_request: int = 0) -> int:
+        """Number of payloads ``temporal()`` yields at most"""
+        return len(self.ids) * -(-self.steps // (steps_per_request or self.steps))
+
+    def count_batches(self, batch_size: int) -> int:
+        """Number of batches ``batch()`` yields at most"""
+        return self.steps * sum(
+            -(-next(iter(columns.values())).shape[1] // batch_size)
+            for _, columns in self._blocks
+        )
+
+    def _iter_chunks(
+        self, chunk_size: int
+    ) -> Iterator[Tuple[int, Dict[bytes, List[List[bytes]]]]]:
+        for offset, columns in self._blocks:
+            elements = next(iter(columns.values())).shape[1]
+            for start in range(0, elements, chunk_size):
+                yield offset + start, {
+                    f',"{attribute}":'.encode("utf-8"): encode_instances(
+                        values[:, start : start + chunk_size],
+                        self.timestamps,
+                        self.precision,
+                    )
+                    for attribute, values in columns.items()
+                }
+
+    def temporal(
+        self, steps_per_request: int = 0, chunk_size: int = 1000
+    ) -> Iterator[Tuple[str, bytes]]:
+        """Yields (id, payload) for the temporal API, all instances of an entity.
+
+        With ``steps_per_request`` the instances of an entity are split over
+        several payloads of at most that many steps each, in time order.
+        """
+        steps = self.steps
+        step = steps_per_request or steps
+        for offset, chunk in self._iter_chunks(chunk_size):
+            count = len(next(iter(chunk.values())))
+            for j in range(count):
+                head = self._heads[offset + j]
+                for first in range(0, steps, step):
+                    attributes = [head]
+                    for key, instances in chunk.items():
+                        encoded = b",".join(
+                            filter(None, instances[j][first : first + step])
+                        )
+                        if encoded:
+                            attributes += (key, b"[", encoded, b"]")
+                    if len(attributes) > 1:
+                        attributes.append(self._fragment)
+                        yield self.ids[offset + j], b"".join(attributes)
+
+    def batch(
+        self, batch_size: int
+    ) -> Iterator[Iterator[Tuple[List[str], List[bytes]]]]:
+        """Yields per block of ``batch_size`` entities its batch updates.
+
+        The updates of a block, (ids, entities) with one value per attribute, are
+        yielded step by step in time order. They have to be sent in that order, so
+        the entities end up with the values of the last step.
+        """
+        for offset, chunk in self._iter_chunks(batch_size):
+            yield self._iter_steps(offset, chunk)
+
+    def _iter_steps(
+        self, offset: int, chunk: Dict[bytes, List[List[bytes]]]
+    ) -> Iterator[Tuple[List[str], List[bytes]]]:
+        count = len(next(iter(chunk.values())))
+        for step in range(self.steps):
+            ids, entities = [], []
+            for j in range(count):
+                attributes = [self._heads[offset + j]]
+                for key, instances in chunk.items():
+                    if instances[j][step]:
+                        attributes += (key, instances[j][step])
+                if len(attributes) > 1:
+                    attributes.append(self._fragment)
+                    ids.append(self.ids[offset + j])
+                    entities.append(b"".join(attributes))
+            if entities:
+                yield ids, entities
@@ -0,0 +1,72 @@
+import json
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - optional dependency
+    msgspec = None
+
+
+class Serializer(NamedTuple):
+    """Compact JSON encoding to UTF-8 bytes and decoding from bytes or str"""
+
+    name: str
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[Any], Any]
+
+
+class EncodedEntity(NamedTuple):
+    """An entity converted and serialized once, ready to be sent"""
+
+    id: str
+    payload: bytes
+
+
+def _json_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+SERIALIZERS: Dict[str, Serializer] = {
+    "json": Serializer("json", _json_dumps, json.loads)
+}
+if msgspec is not None:
+    SERIALIZERS["msgspec"] = Serializer(
+        "msgspec", msgspec.json.encode, msgspec.json.decode
+    )
+if orjson is not None:
+    SERIALIZERS["orjson"] = Serializer("orjson", orjson.dumps, orjson.loads)
+
+# Fastest first
+SERIALIZER_NAMES = ("auto", "orjson", "msgspec", "json")
+
+
+def available_serializers() -> Tuple[str, ...]:
+    """The names accepted by get_serializer(), i.e. of the installed libraries"""
+    return tuple(n for n in SERIALIZER_NAMES if n == "auto" or n in SERIALIZERS)
+
+
+def get_serializer(name: Optional[str] = "auto") -> Serializer:
+    """Returns the named serializer, or with "auto" the fastest one installed"""
+    if name is None or name == "auto":
+        return next(SERIALIZERS[n] for n in SERIALIZER_NAMES[1:] if n in SERIALIZERS)
+    if name not in SERIALIZERS:
+        raise ValueError(f"Serializer {name!r} is not available (not installed?).")
+    return SERIALIZERS[name]
+
+
+def context_fragment(context: Any, serializer: Optional[Serializer] = None) -> bytes:
+    """The ``"@context"`` member, encoded once to be spliced into every entity"""
+    dumps = (serializer or get_serializer()).dumps
+    return b'"@context":' + dumps(context)
+
+
+def splice(payload: bytes, fragment: bytes) -> bytes:
+    """Adds an encoded member (see ``context_fragment()``) to an encoded object"""
+    if payload == b"{}":
+        return b"{" + fragment + b"}"
+    return payload[:-1] + b"," + fragment + b"}"
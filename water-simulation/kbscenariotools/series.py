@@ -0,0 +1,116 @@
+"""Deduplication of the pattern and curve series of a network.
+
+Utility models often hold thousands of identical demand patterns. The series are
+handled as NumPy arrays: optionally quantized (rounded), hashed, and only the
+first element of every distinct series is kept. References of the nodes and
+links are rewritten to that element, so they all point to one shared entity.
+"""
+
+import hashlib
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError("Series deduplication needs numpy (pip install numpy).")
+
+from .converters import CURVE_REFERENCES, PATTERN_REFERENCES
+
+
+class DedupResult(NamedTuple):
+    elements: List[dict]
+    canonical: Dict[str, str]
+
+
+def quantize(values: "np.ndarray", precision: Optional[int] = None) -> "np.ndarray":
+    """Rounds to ``precision`` decimals; -0.0 becomes 0.0, so both hash equally"""
+    if precision is not None:
+        values = np.round(values, precision)
+    return values + 0.0
+
+
+def deduplicate(
+    elements: Sequence[dict],
+    key: str,
+    tag_key: Optional[str] = None,
+    precision: Optional[int] = None,
+) -> DedupResult:
+    """Keeps the first element of every distinct ``key`` series.
+
+    Series of the same shape (and ``tag_key`` value, e.g. the curve type) are
+    stacked into one array, quantized and hashed row by row. ``canonical`` maps
+    every name to the name of the element kept for its series. With a
+    ``precision``, the kept elements are copies carrying the rounded series.
+    Series which are not numeric arrays are kept as they are.
+    """
+    groups: Dict[Tuple, List[int]] = {}
+    arrays: List[Optional["np.ndarray"]] = []
+    for i, element in enumerate(elements):
+        try:
+            array = np.asarray(element.get(key), dtype=np.float64)
+        except (TypeError, ValueError):
+            array = None
+        if array is None or array.ndim == 0 or array.size == 0:
+            arrays.append(None)
+            continue
+        arrays.append(array)
+        tag = element.get(tag_key) if tag_key else None
+        groups.setdefault((tag, array.shape), []).append(i)
+
+    digests: List[Optional[bytes]] = [None] * len(elements)
+    quantized: List[Optional["np.ndarray"]] = [None] * len(elements)
+    for (tag, shape), indices in groups.items():
+        stacked = quantize(np.stack([arrays[i] for i in indices]), precision)
+        header = f"{tag}|{shape}|".encode("utf-8")
+        for i, row in zip(indices, stacked):
+            digests[i] = hashlib.blake2b(
+                header + row.tobytes(), digest_size=16
+            ).digest()
+            quantized[i] = row
+
+    kept: List[dict] = []
+    canonical: Dict[str, str] = {}
+    first: Dict[bytes, str] = {}
+    for element, digest, row in zip(elements, digests, quantized):
+        name = element["name"]
+        if digest is None:
+            kept.append(element)
+            canonical[name] = name
+            continue
+        if digest in first:
+            canonical[name] = first[digest]
+            continue
+        first[digest] = canonical[name] = name
+        if precision is not None:
+            element = {**element, key: row.tolist()}
+        kept.append(element)
+    return DedupResult(kept, canonical)
+
+
+def rewrite_references(
+    nodes: Sequence[dict],
+    links: Sequence[dict],
+    patterns: Dict[str, str],
+    curves: Dict[str, str],
+) -> int:
+    """Points the references of nodes and links to the kept patterns and curves.
+
+    Returns the number of references changed.
+    """
+    changed = 0
+
+    def rewrite(holder, key, canonical):
+        nonlocal changed
+        name = holder.get(key)
+        if name is not None and canonical.get(name, name) != name:
+            holder[key] = canonical[name]
+            changed += 1
+
+    for element in (*nodes, *links):
+        for key in PATTERN_REFERENCES:
+            rewrite(element, key, patterns)
+        for key in CURVE_REFERENCES:
+            rewrite(element, key, curves)
+        for demand in element.get("demand_timeseries_list") or []:
+            rewrite(demand, "pattern_name", patterns)
+    return changed
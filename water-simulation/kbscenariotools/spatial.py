@@ -0,0 +1,162 @@
+"""Reprojection of network coordinates to WGS84 and grouping by map tile.
+
+Tiles are the web map tiles (z/x/y) of the WGS84 positions: at zoom z the world
+is split into 2^z x 2^z tiles, e.g. zoom 14 tiles are about 2.4 km wide at the
+equator.
+"""
+
+import math
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError("The spatial stage needs numpy (pip install numpy).")
+
+WGS84_NAMES = ("EPSG:4326", "WGS84", "OGC:CRS84")
+WEB_MERCATOR_NAMES = ("EPSG:3857", "EPSG:900913", "EPSG:3785")
+EARTH_RADIUS = 6378137.0
+# About 1 cm, enough for pipes and keeps the payloads short
+DECIMALS = 7
+
+
+def _is_point(value) -> bool:
+    return (
+        isinstance(value, list)
+        and len(value) == 2
+        and all(isinstance(v, (int, float)) for v in value)
+    )
+
+
+def reproject(
+    x: "np.ndarray", y: "np.ndarray", crs: Optional[str]
+) -> Tuple["np.ndarray", "np.ndarray"]:
+    """Longitudes and latitudes of coordinates in ``crs`` (e.g. "EPSG:32633").
+
+    WGS84 and Web Mercator are converted with NumPy, other systems need pyproj.
+    """
+    if not crs or crs.upper() in WGS84_NAMES:
+        return x, y
+    if crs.upper() in WEB_MERCATOR_NAMES:
+        lon = np.degrees(x / EARTH_RADIUS)
+        lat = np.degrees(2 * np.arctan(np.exp(y / EARTH_RADIUS)) - math.pi / 2)
+        return lon, lat
+    try:
+        from pyproj import Transformer
+    except ImportError:
+        raise ImportError(f"Reprojecting from {crs} needs pyproj (pip install pyproj).")
+    transformer = Transformer.from_crs(crs, "EPSG:4326", always_xy=True)
+    return transformer.transform(x, y)
+
+
+def locate(nodes: List[dict], links: List[dict], crs: Optional[str] = None) -> None:
+    """Converts the coordinates of the elements to WGS84, in place.
+
+    The ``coordinates`` of the nodes and the ``vertices`` of the links are
+    reprojected together in one pass. The links get ``coordinates`` too: their
+    start node, vertices and end node, for a LineString. Elements without valid
+    coordinates are left as they are.
+    """
+    points = [
+        node["coordinates"] for node in nodes if _is_point(node.get("coordinates"))
+    ]
+    vertex_lists = [
+        [v for v in link.get("vertices") or [] if _is_point(v)] for link in links
+    ]
+    for vertices in vertex_lists:
+        points.extend(vertices)
+    if not points:
+        return
+    xy = np.asarray(points, dtype=np.float64)
+    lon, lat = reproject(xy[:, 0], xy[:, 1], crs)
+    if crs and crs.upper() not in WGS84_NAMES:
+        lon, lat = np.round(lon, DECIMALS), np.round(lat, DECIMALS)
+    positions = iter(np.column_stack((lon, lat)).tolist())
+
+    located = {}
+    for node in nodes:
+        if _is_point(node.get("coordinates")):
+            node["coordinates"] = located[node["name"]] = next(positions)
+    for link, vertices in zip(links, vertex_lists):
+        vertices = [next(positions) for _ in vertices]
+        start = located.get(link.get("start_node_name"))
+        end = located.get(link.get("end_node_name"))
+        if start is not None and end is not None:
+            link["coordinates"] = [start] + vertices + [end]
+
+
+def tile_indices(
+    lon: "np.ndarray", lat: "np.ndarray", zoom: int
+) -> Tuple["np.ndarray", "np.ndarray"]:
+    """Column and row of the web map tiles at ``zoom`` holding the positions"""
+    n = 1 << zoom
+    lat = np.radians(np.clip(lat, -85.0511, 85.0511))
+    x = np.floor((lon + 180.0) / 360.0 * n)
+    y = np.floor((1.0 - np.arcsinh(np.tan(lat)) / math.pi) / 2.0 * n)
+    return np.clip(x, 0, n - 1).astype(int), np.clip(y, 0, n - 1).astype(int)
+
+
+def parse_tiles(value: str) -> Tuple[int, Set[str]]:
+    """Parses "14/8580/5738,14/8581/5738" into the zoom and the set of tiles"""
+    tiles = set()
+    zooms = set()
+    for key in value.split(","):
+        parts = key.strip().split("/")
+        if len(parts) != 3 or not all(part.isdigit() for part in parts):
+            raise ValueError(f"Tile {key!r} is not in the form z/x/y.")
+        zooms.add(int(parts[0]))
+        tiles.add("/".join(str(int(part)) for part in parts))
+    if len(zooms) > 1:
+        raise ValueError("All tiles must have the same zoom level.")
+    return zooms.pop(), tiles
+
+
+def group_by_tile(
+    elements: Sequence[Tuple[str, dict]], zoom: int
+) -> Dict[Optional[str], List[Tuple[str, dict]]]:
+    """Groups (type, element) pairs by the tile ("z/x/y") of their coordinates.
+
+    Links are placed in the tile of their start node. The groups are ordered
+    by tile column and row; elements without coordinates come last, under None.
+    The order of the elements within a group is kept.
+    """
+    first_points = []
+    located = []
+    for i, (_, element) in enumerate(elements):
+        coordinates = element.get("coordinates")
+        if _is_point(coordinates):
+            first_points.append(coordinates)
+        elif (
+            isinstance(coordinates, list) and coordinates and _is_point(coordinates[0])
+        ):
+            first_points.append(coordinates[0])
+        else:
+            continue
+        located.append(i)
+    keys: List[Optional[Tuple[int, int]]] = [None] * len(elements)
+    if first_points:
+        lonlat = np.asarray(first_points, dtype=np.float64)
+        xs, ys = tile_indices(lonlat[:, 0], lonlat[:, 1], zoom)
+        for i, x, y in zip(located, xs.tolist(), ys.tolist()):
+            keys[i] = (x, y)
+    groups: Dict[Optional[Tuple[int, int]], List[Tuple[str, dict]]] = {}
+    for key, item in zip(keys, elements):
+        groups.setdefault(key, []).append(item)
+    ordered = sorted((key for key in groups if key is not None))
+    result: Dict[Optional[str], List[Tuple[str, dict]]] = {
+        f"{zoom}/{x}/{y}": groups[(x, y)] for x, y in ordered
+    }
+    if None in groups:
+        result[None] = groups[None]
+    return result
+
+
+def iter_grouped(
+    groups: Dict[Optional[str], List[Tuple[str, dict]]],
+    tiles: Optional[Iterable[str]] = None,
+):
+    """Yields the (type, element) pairs of the groups, of ``tiles`` only if given"""
+    selected = None if tiles is None else set(tiles)
+    for key, items in groups.items():
+        if selected is None or key in selected:
+            yield from items
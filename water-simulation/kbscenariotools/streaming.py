@@ -0,0 +1,150 @@
+import io
+import json
+import re
+from typing import IO, Any, Collection, Iterator, Tuple, Union
+
+try:
+    import ijson
+except ImportError:  # pragma: no cover - optional dependency
+    ijson = None
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class JsonScanner:
+    """Minimal incremental JSON reader on top of ``json.JSONDecoder.raw_decode``.
+
+    It only keeps a chunk of the input in memory and decodes one value at a time,
+    which is enough to walk the top-level object of a WNTR export and yield the
+    elements of its arrays one by one. Used when ``ijson`` is not installed.
+    """
+
+    def __init__(self, f: IO[str], chunk_size: int = 1 << 20):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        data = self._f.read(self._chunk_size)
+        if not data:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos :] + data
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf) or not self._fill():
+                return self._buf[self._pos : self._pos + 1]
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} but found {found!r} in JSON input.")
+        self._pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number at the end of the buffer might continue in the next chunk
+            if end == len(self._buf) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def iter_object(self) -> Iterator[str]:
+        """Yields the keys of an object, the caller has to consume each value"""
+        self.expect("{")
+        first = True
+        while self.peek() != "}":
+            if not first:
+                self.expect(",")
+            key = self.value()
+            self.expect(":")
+            yield key
+            first = False
+        self.expect("}")
+
+    def iter_array(self) -> Iterator[Any]:
+        self.expect("[")
+        first = True
+        while self.peek() != "]":
+            if not first:
+                self.expect(",")
+            yield self.value()
+            first = False
+        self.expect("]")
+
+
+def iter_sections(
+    source: Union[str, IO], sections: Collection[str]
+) -> Iterator[Tuple[str, Any]]:
+    """Reads a JSON object incrementally in a single pass, in file order.
+
+    For every top-level key listed in ``sections`` (which must hold arrays), one
+    ``(key, element)`` tuple is yielded per array element. All other top-level
+    values are yielded whole as ``(key, value)``.
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            yield from iter_sections(f, sections)
+        return
+    if ijson is not None:
+        yield from _iter_sections_ijson(source, sections)
+        return
+    if not isinstance(source, io.TextIOBase):
+        source = io.TextIOWrapper(source, encoding="utf-8")
+    scanner = JsonScanner(source)
+    for key in scanner.iter_object():
+        if key in sections:
+            for element in scanner.iter_array():
+                yield key, element
+        else:
+            yield key, scanner.value()
+
+
+def iter_array(source: IO) -> Iterator[Any]:
+    """Yields the elements of a top-level JSON array while it is read"""
+    if ijson is not None:
+        yield from ijson.items(source, "item", use_float=True)
+        return
+    if not isinstance(source, io.TextIOBase):
+        source = io.TextIOWrapper(source, encoding="utf-8")
+    yield from JsonScanner(source).iter_array()
+
+
+def _iter_sections_ijson(f: IO, sections: Collection[str]) -> Iterator[Tuple[str, Any]]:
+    key = None
+    builder = None
+    depth = 0
+    for prefix, event, value in ijson.parse(f, use_float=True):
+        if builder is None:
+            if prefix == "" and event == "map_key":
+                key = value
+                continue
+            if prefix == key and key in sections:
+                continue  # start_array / end_array of a streamed section
+            if prefix not in (key, f"{key}.item"):
+                continue
+            builder = ijson.ObjectBuilder()
+        builder.event(event, value)
+        if event in ("start_map", "start_array"):
+            depth += 1
+        elif event in ("end_map", "end_array"):
+            depth -= 1
+        if depth == 0:
+            yield key, builder.value
+            builder = None
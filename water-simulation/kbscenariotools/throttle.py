@@ -0,0 +1,142 @@
+import threading
+import time
+from argparse import Namespace
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delay seconds or HTTP date)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Allows ``rate`` acquisitions per second on average, bursts of up to ``burst``"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self._capacity = burst or max(1.0, rate)
+        self._tokens = self._capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self._capacity, self._tokens + (now - self._last) * self.rate
+                )
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveLimiter:
+    """Limits the requests in flight and per second, adapting to the broker.
+
+    The concurrency limit follows AIMD: it grows while requests succeed (slow
+    start doubles it per round trip until the first congestion, then it grows by
+    one per round trip) and is multiplied by ``backoff_ratio`` on congestion, at
+    most once per round trip. Congestion is a 429 or 5xx answer, a connection
+    error, or a latency above ``latency_tolerance`` times the lowest recent one.
+    A Retry-After pauses all requests. ``rate`` caps the requests per second with
+    a token bucket. Without ``adaptive`` the limit stays at ``max_concurrency``.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        rate: Optional[float] = None,
+        adaptive: bool = True,
+        min_concurrency: int = 1,
+        latency_tolerance: float = 3.0,
+        backoff_ratio: float = 0.5,
+    ):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min(min_concurrency, max_concurrency)
+        self.adaptive = adaptive
+        self.limit = float(self.min_concurrency if adaptive else max_concurrency)
+        self._bucket = TokenBucket(rate) if rate else None
+        self._latency_tolerance = latency_tolerance
+        self._backoff_ratio = backoff_ratio
+        self._slow_start = adaptive
+        self._min_latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self._resume_at = 0.0
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        # Completed requests per second, measured over intervals of >= 1s
+        self.rate = 0.0
+        self._rate_start = time.monotonic()
+        self._rate_count = 0
+
+    @classmethod
+    def from_args(cls, args: Namespace) -> Optional["AdaptiveLimiter"]:
+        if not (args.adaptive or args.rate_limit):
+            return None
+        return cls(args.pool_size, args.rate_limit or None, args.adaptive)
+
+    def acquire(self) -> None:
+        """Waits for a free slot (and token), call ``release()`` when done"""
+        with self._condition:
+            while True:
+                pause = self._resume_at - time.monotonic()
+                if pause <= 0 and self._in_flight < int(self.limit):
+                    break
+                self._condition.wait(pause if pause > 0 else None)
+            self._in_flight += 1
+        if self._bucket is not None:
+            self._bucket.acquire()
+
+    def release(
+        self,
+        latency: float,
+        status: Optional[int],
+        retry_after: Optional[float] = None,
+    ) -> None:
+        """Reports a finished request; ``status`` is None for a connection error"""
+        with self._condition:
+            self._in_flight -= 1
+            now = time.monotonic()
+            self._rate_count += 1
+            if now - self._rate_start >= 1.0:
+                self.rate = self._rate_count / (now - self._rate_start)
+                self._rate_start, self._rate_count = now, 0
+            if retry_after:
+                self._resume_at = max(self._resume_at, now + retry_after)
+            if self.adaptive:
+                self._adapt(now, latency, status)
+            self._condition.notify_all()
+
+    def _adapt(self, now: float, latency: float, status: Optional[int]) -> None:
+        failed = status is None or status == 429 or status >= 500
+        if not failed:
+            # The lowest latency slowly forgets old values, as the load changes
+            if self._min_latency is None or latency < self._min_latency:
+                self._min_latency = latency
+            else:
+                self._min_latency *= 1.001
+        if failed or latency > self._latency_tolerance * self._min_latency:
+            if now - self._last_decrease >= latency:
+                self._slow_start = False
+                self._last_decrease = now
+                self.limit = max(
+                    float(self.min_concurrency), self.limit * self._backoff_ratio
+                )
+        elif self._in_flight + 1 >= int(self.limit):
+            # Only grow when the limit is actually used
+            step = 1.0 if self._slow_start else 1.0 / self.limit
+            self.limit = min(float(self.max_concurrency), self.limit + step)
@@ -0,0 +1,146 @@
+import atexit
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+from argparse import Namespace
+from typing import IO, Any, List, Optional
+
+# off: nothing, errors: failed requests with bodies, requests: every request
+# without bodies, all: every request with request and response bodies
+TRACE_LEVELS = ("off", "errors", "requests", "all")
+
+_STOP = object()
+
+
+class TraceWriter:
+    """Debug trace of the endpoint requests, written as compact JSON Lines.
+
+    ``trace()`` only puts the record on a bounded queue; a background thread
+    serializes the records and writes everything queued in one batch with a
+    single flush. When the file exceeds ``max_bytes`` it is rotated to
+    ``<path>.1`` ... ``<path>.<backups>``. With ``compress`` the files are
+    gzip-compressed (the rotation size then refers to the compressed size).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        level: str = "errors",
+        max_bytes: int = 100 * 2**20,
+        backups: int = 5,
+        compress: bool = False,
+        queue_size: int = 10000,
+    ):
+        if level not in TRACE_LEVELS:
+            raise ValueError(f"Unknown trace level {level!r}.")
+        self.path = path
+        self.level = level
+        self._max_bytes = max_bytes
+        self._backups = backups
+        self._compress = compress
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self._raw: Optional[IO[bytes]] = None
+        self._file: Optional[IO[bytes]] = None
+        self._open()
+        self._thread = threading.Thread(
+            target=self._run, name="trace-writer", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    @classmethod
+    def from_args(cls, args: Namespace) -> Optional["TraceWriter"]:
+        if not args.trace_file or args.trace_level == "off":
+            return None
+        return cls(
+            args.trace_file,
+            level=args.trace_level,
+            max_bytes=int(args.trace_max_size * 2**20),
+            backups=args.trace_backups,
+            compress=args.trace_gzip,
+        )
+
+    def trace(
+        self,
+        method: str,
+        url: str,
+        status: int,
+        elapsed: float,
+        request_body: Any = None,
+        response_body: Any = None,
+    ) -> None:
+        failed = not (200 <= status <= 299)
+        if self.level == "errors" and not failed:
+            return
+        record = {
+            "ts": time.time(),
+            "method": method,
+            "url": url,
+            "status": status,
+            "elapsed_ms": round(elapsed * 1000, 3),
+        }
+        if self.level == "all" or failed:
+            if isinstance(request_body, bytes):
+                request_body = request_body.decode("utf-8", "replace")
+            record["request"] = request_body
+            record["response"] = response_body
+        self._queue.put(record)
+
+    def _open(self) -> None:
+        self._raw = open(self.path, "ab")
+        self._file = (
+            gzip.GzipFile(fileobj=self._raw, mode="ab") if self._compress else self._raw
+        )
+
+    def _close_file(self) -> None:
+        if self._file is not self._raw:
+            self._file.close()
+        self._raw.close()
+
+    def _rotate(self) -> None:
+        self._close_file()
+        for i in range(self._backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self._backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def _write(self, records: List[dict]) -> None:
+        lines = [
+            json.dumps(record, separators=(",", ":"), default=str) for record in records
+        ]
+        self._file.write(("\n".join(lines) + "\n").encode("utf-8"))
+        self._file.flush()
+        if self._raw.tell() >= self._max_bytes:
+            self._rotate()
+
+    def _run(self) -> None:
+        while True:
+            record = self._queue.get()
+            records = []
+            stop = False
+            while record is not _STOP:
+                records.append(record)
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            else:
+                stop = True
+            if records:
+                self._write(records)
+            if stop:
+                self._close_file()
+                return
+
+    def close(self) -> None:
+        """Writes all queued records and closes the file"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
@@ -0,0 +1,65 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+
+class ConcurrentUploader:
+    """Runs upload jobs on a thread pool with a bounded number of requests in flight.
+
+    ``submit()`` blocks as long as ``concurrency`` jobs are running, so the producer
+    never converts more entities than the broker can take (backpressure). The first
+    exception raised by a job stops the uploader: every later call to ``submit()`` or
+    ``join()`` re-raises it in the calling thread.
+    """
+
+    def __init__(self, concurrency: int):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1.")
+        self.concurrency = concurrency
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self._error: Optional[BaseException] = None
+
+    def submit(self, fn: Callable, *args) -> None:
+        self.raise_for_error()
+        self._slots.acquire()
+        if self._error is not None:
+            self._slots.release()
+            self.raise_for_error()
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._done)
+
+    def _done(self, future: Future) -> None:
+        error = future.exception()
+        if error is not None:
+            with self._lock:
+                if self._error is None:
+                    self._error = error
+        self._slots.release()
+
+    def raise_for_error(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def drain(self) -> None:
+        """Waits until no job is in flight and re-raises the first failure, if any"""
+        for _ in range(self.concurrency):
+            self._slots.acquire()
+        for _ in range(self.concurrency):
+            self._slots.release()
+        self.raise_for_error()
+
+    def join(self) -> None:
+        """Waits for all submitted jobs and re-raises the first failure, if any"""
+        self._executor.shutdown(wait=True)
+        self.raise_for_error()
+
+    def __enter__(self) -> "ConcurrentUploader":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.join()
+        else:
+            self._executor.shutdown(wait=True, cancel_futures=True)
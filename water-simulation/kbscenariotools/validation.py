@@ -0,0 +1,139 @@
+"""Pre-flight checks of a WNTR network, before any entity is uploaded.
+
+Problems the converters would only hit halfway through an upload (links to
+unknown nodes, references to missing patterns or curves, duplicate or missing
+names, unknown types) are collected in one pass over the elements.
+"""
+
+from typing import Dict, List, Optional, Set, Tuple
+
+from .converters import CURVE_REFERENCES, CURVE_TYPES, PATTERN_REFERENCES
+
+NODE_TYPES = ("Junction", "Reservoir", "Tank")
+LINK_TYPES = ("Pipe", "Pump", "Valve")
+
+
+class NetworkValidationError(ValueError):
+    """The network has problems which would fail the import, see ``problems``"""
+
+    def __init__(self, problems: List[str], shown: int = 20):
+        self.problems = problems
+        lines = problems[:shown]
+        if len(problems) > shown:
+            lines.append(f"... and {len(problems) - shown} more")
+        super().__init__(
+            f"The network has {len(problems)} problems:\n  " + "\n  ".join(lines)
+        )
+
+
+class NetworkValidator:
+    """Checks the elements of a network, added section by section.
+
+    The sections may come in any order (e.g. while streaming a file): references
+    are resolved by ``problems()`` once all elements were added. Only the names
+    are kept, not the elements.
+    """
+
+    def __init__(self):
+        self._names: Dict[str, Set[str]] = {
+            "nodes": set(),
+            "links": set(),
+            "curves": set(),
+            "patterns": set(),
+        }
+        self._problems: List[str] = []
+        # Node references of links added before the node, resolved at the end
+        self._pending: List[Tuple[str, str, str]] = []
+        self._references: Dict[Tuple[str, str], str] = {}
+
+    def _name(self, section: str, label: str, element: dict) -> Optional[str]:
+        name = element.get("name")
+        if name is None or name == "":
+            self._problems.append(f"A {label} has no name.")
+            return None
+        names = self._names[section]
+        if name in names:
+            self._problems.append(f"The {label} name {name} is used twice.")
+        names.add(name)
+        return name
+
+    def _reference(self, section: str, name: Optional[str], referrer: str) -> None:
+        if name is not None:
+            self._references.setdefault((section, name), referrer)
+
+    def add(self, section: str, element: dict) -> None:
+        """Checks an element of ``section`` ("nodes", "links", "curves", "patterns")"""
+        if section == "nodes":
+            type_ = element.get("node_type")
+            name = self._name(section, type_ or "node", element)
+            if type_ not in NODE_TYPES:
+                self._problems.append(f"The node {name} has the unknown type {type_}.")
+            referrer = f"{type_} {name}"
+            for key in PATTERN_REFERENCES:
+                self._reference("patterns", element.get(key), referrer)
+            self._reference("curves", element.get("vol_curve_name"), referrer)
+            for demand in element.get("demand_timeseries_list") or []:
+                self._reference("patterns", demand.get("pattern_name"), referrer)
+        elif section == "links":
+            type_ = element.get("link_type")
+            name = self._name(section, type_ or "link", element)
+            if type_ not in LINK_TYPES:
+                self._problems.append(f"The link {name} has the unknown type {type_}.")
+            referrer = f"{type_} {name}"
+            if element.get("initial_status") is None:
+                self._problems.append(f"{referrer} has no initial_status.")
+            for key in ("start_node_name", "end_node_name"):
+                node = element.get(key)
+                if node is None:
+                    self._problems.append(f"{referrer} has no {key}.")
+                elif node not in self._names["nodes"]:
+                    self._pending.append((referrer, key, node))
+            for key in PATTERN_REFERENCES:
+                self._reference("patterns", element.get(key), referrer)
+            for key in CURVE_REFERENCES:
+                self._reference("curves", element.get(key), referrer)
+        elif section == "curves":
+            name = self._name(section, "curve", element)
+            if element.get("curve_type") not in CURVE_TYPES:
+                self._problems.append(
+                    f"The curve {name} has the unknown type {element.get('curve_type')}."
+                )
+        elif section == "patterns":
+            self._name(section, "pattern", element)
+
+    def add_network(self, data: dict) -> None:
+        """Checks all elements of a parsed network"""
+        for section in ("nodes", "links", "curves", "patterns"):
+            if section not in data:
+                self._problems.append(f"The network has no {section}.")
+                continue
+            for element in data[section]:
+                self.add(section, element)
+        if "options" not in data:
+            self._problems.append("The network has no options.")
+
+    def problems(self) -> List[str]:
+        problems = list(self._problems)
+        nodes = self._names["nodes"]
+        for referrer, key, node in self._pending:
+            if node not in nodes:
+                problems.append(f"{referrer}: {key} {node} is not a node.")
+        for (section, name), referrer in self._references.items():
+            if name not in self._names[section]:
+                problems.append(
+                    f"{referrer} references the missing {section[:-1]} {name}."
+                )
+        return problems
+
+    def check(self) -> None:
+        """Raises a ``NetworkValidationError`` listing the problems, if any"""
+        problems = self.problems()
+        if problems:
+            raise NetworkValidationError(problems)
+
+
+def validate_network(data: dict) -> None:
+    """Checks a parsed network, raises a ``NetworkValidationError`` on problems"""
+    validator = NetworkValidator()
+    validator.add_network(data)
+    validator.check()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+
+import argparse
+import asyncio
+import re
+import signal
+import socket
+import sys
+import time
+
+from kbscenariotools.argparse import add_default_args
+from kbscenariotools.converters import EPANET_CONTEXT
+from kbscenariotools.endpoint import ScenarioManagerEndpoint
+from kbscenariotools.metrics import Metrics
+from kbscenariotools.notifications import (
+    NOTIFY_PATH,
+    JsonLinesSink,
+    NotificationReceiver,
+    create_subscription,
+    delete_subscription,
+    subscription,
+)
+
+parser = argparse.ArgumentParser(
+    formatter_class=argparse.RawTextHelpFormatter,
+    description="""
+Notification sink for NGSI-LD subscriptions.
+
+Receives the notifications of the broker, e.g. while water-simulation.py imports a
+network, to measure how fast the broker fans out changes. Subscriptions to the
+given entity types are created before and deleted after. Every notification is
+appended to a JSON Lines file with the time it was received:
+
+{"receivedAt": "...", "notification": {"id": ..., "notifiedAt": ..., "data": [...]}}
+
+Reported are the notifications and entities per second, the delivery latency
+(notifiedAt to receipt) and the end-to-end latency (latest modifiedAt or
+observedAt of an entity to receipt). Both need the clocks of the broker and this
+host to be synchronized.
+
+""",
+)
+add_default_args(parser)
+parser.add_argument(
+    "--listen",
+    help="Address the sink listens on (default: 0.0.0.0)",
+    type=str,
+    action="store",
+    default="0.0.0.0",
+)
+parser.add_argument(
+    "--port",
+    help="Port the sink listens on (default: 8666)",
+    type=int,
+    action="store",
+    default=8666,
+)
+parser.add_argument(
+    "--notify-url",
+    help=f"URL the broker sends the notifications to (default: http://<hostname>:<port>{NOTIFY_PATH})",
+    type=str,
+    action="store",
+    default=None,
+)
+parser.add_argument(
+    "--type",
+    help="Comma-separated entity types to subscribe to, e.g. Junction,Pipe (default: none, only receive)",
+    type=str,
+    action="store",
+    default="",
+)
+parser.add_argument(
+    "--prefix",
+    help="Only entities with ids starting with this prefix, as used for the import (default: None)",
+    type=str,
+    action="store",
+    default="",
+)
+parser.add_argument(
+    "--watched-attributes",
+    help="Comma-separated attributes whose changes are notified (default: all)",
+    type=str,
+    action="store",
+    default=None,
+)
+parser.add_argument(
+    "--output",
+    help="JSON Lines file the notifications are appended to, empty to not write them (default: notifications.jsonl)",
+    type=str,
+    action="store",
+    default="notifications.jsonl",
+)
+parser.add_argument(
+    "--flush-size",
+    help="Number of notifications written to the output at once (default: 1000)",
+    type=int,
+    action="store",
+    default=1000,
+)
+parser.add_argument(
+    "--flush-interval",
+    help="Seconds after which pending notifications are written anyway (default: 1.0)",
+    type=float,
+    action="store",
+    default=1.0,
+)
+parser.add_argument(
+    "--duration",
+    help="Seconds to run, 0 to run until interrupted (default: 0)",
+    type=float,
+    action="store",
+    default=0.0,
+)
+parser.add_argument(
+    "--report-interval",
+    help="Seconds between the throughput and latency reports, 0 for none (default: 5)",
+    type=float,
+    action="store",
+    default=5.0,
+)
+parser.add_argument(
+    "--keep-subscriptions",
+    help="Do not delete the subscriptions when the sink stops",
+    action="store_true",
+)
+args = parser.parse_args()
+if args.flush_size < 1:
+    parser.error("--flush-size must be at least 1")
+
+types = [type_ for type_ in args.type.split(",") if type_]
+notify_url = args.notify_url or f"http://{socket.getfqdn()}:{args.port}{NOTIFY_PATH}"
+id_pattern = f"^urn:ngsi:[^:]+:{re.escape(args.prefix)}" if args.prefix else None
+watched = args.watched_attributes.split(",") if args.watched_attributes else None
+
+# The receiver always records, --metrics only decides about the final summary
+metrics = Metrics(args.metrics, args.metrics_json, args.metrics_prometheus)
+endpoint = ScenarioManagerEndpoint.from_args(args)
+
+
+def format_latency(name, histogram):
+    if histogram is None or not histogram.count:
+        return f"{name} -"
+    return (
+        f"{name} p50 {histogram.quantile(0.5) * 1000:.0f} ms"
+        f" p99 {histogram.quantile(0.99) * 1000:.0f} ms"
+    )
+
+
+async def report(receiver, stop):
+    last, notifications, entities = time.perf_counter(), 0, 0
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), args.report_interval)
+        except asyncio.TimeoutError:
+            pass
+        now = time.perf_counter()
+        elapsed = max(now - last, 1e-9)
+        interval = receiver.take_interval()
+        print(
+            f"{(receiver.notifications - notifications) / elapsed:8.1f} notifications/s"
+            f" {(receiver.entities - entities) / elapsed:9.1f} entities/s  "
+            + format_latency("delivery", interval.get("delivery"))
+            + "  "
+            + format_latency("end-to-end", interval.get("end_to_end")),
+            flush=True,
+        )
+        last, notifications, entities = now, receiver.notifications, receiver.entities
+
+
+async def flush(sink, stop):
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), args.flush_interval)
+        except asyncio.TimeoutError:
+            await sink.flush()
+
+
+async def main():
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    sink = JsonLinesSink(args.output, args.flush_size) if args.output else None
+    receiver = NotificationReceiver(metrics, sink, serializer=endpoint.serializer)
+    # Listening before subscribing, the broker may notify right away
+    await receiver.start(args.listen, args.port)
+    print(f"Listening on {args.listen}:{args.port}, notifications to {notify_url}")
+
+    subscriptions = []
+    tasks = []
+    try:
+        for type_ in types:
+            data = subscription(
+                [type_], notify_url, EPANET_CONTEXT, id_pattern, watched
+            )
+            subscriptions.append(
+                await loop.run_in_executor(None, create_subscription, endpoint, data)
+            )
+            print(f"Subscribed to {type_}: {data['id']}")
+        if args.report_interval > 0:
+            tasks.append(asyncio.ensure_future(report(receiver, stop)))
+        if sink is not None and args.flush_interval > 0:
+            tasks.append(asyncio.ensure_future(flush(sink, stop)))
+        if args.duration > 0:
+            loop.call_later(args.duration, stop.set)
+        await stop.wait()
+    finally:
+        stop.set()
+        await asyncio.gather(*tasks)
+        await receiver.stop()
+        if not args.keep_subscriptions:
+            for subscription_id in subscriptions:
+                await loop.run_in_executor(
+                    None, delete_subscription, endpoint, subscription_id
+                )
+    return receiver
+
+
+started = time.perf_counter()
+try:
+    receiver = asyncio.run(main())
+except RuntimeError as error:
+    sys.exit(str(error))
+finally:
+    endpoint.close()
+elapsed = time.perf_counter() - started
+print(
+    f"\n{receiver.notifications} notifications with {receiver.entities} entities"
+    f" in {elapsed:.1f} s ({receiver.notifications / elapsed:.1f} notifications/s)"
+)
+metrics.report()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import sys
+import threading
+from itertools import zip_longest
+
+from kbscenariotools.argparse import add_default_args
+from kbscenariotools.batch import BATCH_OPERATIONS, BatchResult
+from kbscenariotools.converters import (
+    EPANET_CONTEXT,
+    EPANET_CONVERTERS,
+    iter_network_elements,
+    pattern_static,
+    urn_factory,
+)
+from kbscenariotools.endpoint import ScenarioManagerEndpoint
+from kbscenariotools.idindex import IdTypeIndex
+from kbscenariotools.metrics import Metrics
+from kbscenariotools.serializer import context_fragment, splice
+from kbscenariotools.uploader import ConcurrentUploader
+from kbscenariotools.validation import validate_network
+from tqdm import tqdm
+
+parser = argparse.ArgumentParser(
+    formatter_class=argparse.RawTextHelpFormatter,
+    description="""
+Seeds many scenarios with the same water networks.
+
+Every network file (the WNTR JSON export water-simulation.py takes) is parsed and
+converted once. The prepared entities are then uploaded for every scenario of the
+scenarios file, with the URN prefix of the scenario, sharing one connection pool.
+The scenarios file is a list like sample_scenarios.json:
+
+[
+    {"scenario": {"name": "S1", ...}, "traces": [ ... ]},
+    ...
+]
+
+""",
+)
+add_default_args(parser)
+parser.add_argument(
+    "scenarios_json",
+    help="Scenarios file (JSON)",
+    type=str,
+    action="store",
+    metavar="SCENARIOS_JSON",
+)
+parser.add_argument(
+    "networks",
+    help="Input files from the simulation (JSON)",
+    type=str,
+    nargs="+",
+    metavar="NETWORK_JSON",
+)
+parser.add_argument(
+    "--scenarios",
+    help="Comma-separated names of the scenarios to seed (default: all)",
+    type=str,
+    action="store",
+    default=None,
+)
+parser.add_argument(
+    "--prefix",
+    help='Prefix for NGSI identifiers, {scenario} and {network} are replaced. Networks sharing element names need\ndifferent prefixes (default: "{scenario}-{network}-")',
+    type=str,
+    action="store",
+    default="{scenario}-{network}-",
+)
+parser.add_argument(
+    "--network-name",
+    help='Name of the WaterNetwork to create, {scenario} and {network} are replaced (default: "{network}")',
+    type=str,
+    action="store",
+    default="{network}",
+)
+parser.add_argument(
+    "--batch-size",
+    help="Number of entities sent per NGSI-LD batch request (default: 100)",
+    type=int,
+    action="store",
+    default=100,
+)
+parser.add_argument(
+    "--batch-operation",
+    help="Batch operation (default: create)",
+    type=str,
+    action="store",
+    choices=BATCH_OPERATIONS,
+    default="create",
+)
+parser.add_argument(
+    "--concurrency",
+    help="Maximum number of requests in flight at the same time, over all scenarios (default: 8)",
+    type=int,
+    action="store",
+    default=8,
+)
+parser.add_argument(
+    "--no-validate",
+    help="Skip the check of the networks (e.g. links to unknown nodes) before the upload",
+    dest="validate",
+    action="store_false",
+)
+args = parser.parse_args()
+if args.batch_size < 1:
+    parser.error("--batch-size must be at least 1")
+args.pool_size = max(args.pool_size, args.concurrency)
+
+metrics = Metrics.from_args(args)
+endpoint = ScenarioManagerEndpoint.from_args(args, metrics)
+dumps = endpoint.serializer.dumps
+CONTEXT_FRAGMENT = context_fragment(EPANET_CONTEXT, endpoint.serializer)
+
+# Placeholder for the URN prefix of the scenario. Every network is converted and
+# encoded once, with this prefix; rendering a payload for a scenario is then a
+# bytes replace of the encoded placeholder, instead of converting the network
+# again. The placeholder must not occur anywhere else in the payloads, or other
+# values would be replaced too: the ASCII unit separator is a control character
+# no network uses, and networks holding its escape are rejected (see
+# PreparedNetwork).
+PREFIX_PLACEHOLDER = "\x1f"
+PREFIX_PLACEHOLDER_BYTES = dumps(PREFIX_PLACEHOLDER)[1:-1]
+make_template_urn = urn_factory(PREFIX_PLACEHOLDER)
+
+
+class PreparedNetwork:
+    """The entities of a network, converted and encoded with the placeholder prefix"""
+
+    def __init__(self, path):
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        with open(path, "r") as f:
+            text = f.read()
+        # Also matches an escaped backslash followed by "u001f", which is encoded
+        # as a string ending in the placeholder bytes too
+        escape = PREFIX_PLACEHOLDER_BYTES.decode("ascii")
+        if escape in text.lower():
+            raise ValueError(
+                f"{path} contains {escape}, which is the placeholder of the prefix."
+            )
+        data = json.loads(text)
+        if args.validate:
+            validate_network(data)
+        self.description = data["name"] + "\n\n" + data["comment"]
+        node_id_type_map = IdTypeIndex.from_items(
+            (node["name"], node["node_type"]) for node in data["nodes"]
+        )
+        converters = {}
+        self.ids = []
+        self.payloads = []
+        for type_, element in iter_network_elements(data):
+            convert = converters.get(type_)
+            if convert is None:
+                convert = converters[type_] = EPANET_CONVERTERS.compile(
+                    type_,
+                    make_template_urn,
+                    node_id_type_map,
+                    pattern_static(data["options"]) if type_ == "Pattern" else None,
+                )
+            entity = convert(element)
+            self.ids.append(entity["id"])
+            self.payloads.append(splice(dumps(entity), CONTEXT_FRAGMENT))
+
+
+class ImportJob:
+    """One network imported into one scenario"""
+
+    def __init__(self, scenario, network, position):
+        self.scenario = scenario
+        self.network = network
+        names = {"scenario": scenario, "network": network.name}
+        self.prefix = args.prefix.format(**names)
+        self.network_name = args.network_name.format(**names)
+        self._prefix_bytes = dumps(self.prefix)[1:-1]
+        # An empty network is sent by a task of its own, without members
+        self._remaining = max(-(-len(network.payloads) // args.batch_size), 1)
+        self._lock = threading.Lock()
+        self.error = None
+        self.pbar = tqdm(
+            total=len(network.payloads) + 1,
+            desc=f"{scenario} {network.name}",
+            unit="models",
+            position=position,
+        )
+
+    def render(self, payload):
+        return payload.replace(PREFIX_PLACEHOLDER_BYTES, self._prefix_bytes)
+
+    def iter_batches(self):
+        if not self.network.payloads:
+            yield self, 0, 0
+        for start in range(0, len(self.network.payloads), args.batch_size):
+            yield self, start, start + args.batch_size
+
+    def network_payload(self):
+        network = {
+            "id": make_template_urn(self.network_name, "WaterNetwork"),
+            "type": "WaterNetwork",
+            "isComposedOf": self.network.ids,
+            "description": self.network.description,
+            "name": self.network_name,
+        }
+        return self.render(splice(dumps(network), CONTEXT_FRAGMENT))
+
+    def batch_done(self):
+        """Returns True for the last member batch, the network can be sent then"""
+        with self._lock:
+            self._remaining -= 1
+            return self._remaining == 0
+
+
+def send(job, payloads, entity_ids):
+    status, res = endpoint.batch(args.batch_operation, payloads)
+    result = BatchResult.from_response(status, res, entity_ids)
+    if not result.ok:
+        entity_id, error = next(iter(result.errors.items()))
+        raise RuntimeError(
+            f"Batch {args.batch_operation} failed for {len(result.errors)} entities "
+            f"(status {status}), e.g. {entity_id}: {error}"
+        )
+    job.pbar.update(len(payloads))
+
+
+def post_batch(job, start, end):
+    if job.error is not None:
+        return
+    network = job.network
+    try:
+        if start < end:
+            send(
+                job,
+                [job.render(payload) for payload in network.payloads[start:end]],
+                [
+                    id_.replace(PREFIX_PLACEHOLDER, job.prefix)
+                    for id_ in network.ids[start:end]
+                ],
+            )
+        # All members have to be stored before the network referencing them
+        if job.batch_done():
+            send(
+                job,
+                [job.network_payload()],
+                [urn_factory(job.prefix)(job.network_name, "WaterNetwork")],
+            )
+    except Exception as error:
+        job.error = error
+
+
+with open(args.scenarios_json, "r") as f:
+    scenarios = [entry["scenario"]["name"] for entry in json.load(f)]
+if args.scenarios:
+    selected = args.scenarios.split(",")
+    unknown = set(selected) - set(scenarios)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    scenarios = [scenario for scenario in scenarios if scenario in selected]
+
+print(f"Preparing {len(args.networks)} networks")
+try:
+    networks = [PreparedNetwork(path) for path in args.networks]
+except ValueError as error:
+    sys.exit(str(error))
+for network in networks:
+    print(f"{len(network.payloads) + 1:6} models in {network.name}")
+print(f"Seeding {len(scenarios)} scenarios\n")
+
+jobs = [
+    ImportJob(scenario, network, position)
+    for position, (scenario, network) in enumerate(
+        (scenario, network) for scenario in scenarios for network in networks
+    )
+]
+with ConcurrentUploader(args.concurrency) as uploader:
+    # Round robin, so all scenarios progress at the same time
+    for batches in zip_longest(*(job.iter_batches() for job in jobs)):
+        for batch in batches:
+            if batch is not None:
+                uploader.submit(post_batch, *batch)
+for job in jobs:
+    job.pbar.close()
+endpoint.close()
+
+print("\n-[ Seed Results ]-------------------")
+failed = 0
+for job in jobs:
+    if job.error is None:
+        print(f"{job.scenario:>12} {job.network.name}: {job.pbar.n} models")
+    else:
+        failed += 1
+        print(f"{job.scenario:>12} {job.network.name}: FAILED, {job.error}")
+if metrics is not None:
+    metrics.report()
+if failed:
+    sys.exit(f"{failed} of {len(jobs)} imports failed.")
+print("Done.")
@@ -0,0 +1,26 @@
+import argparse
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kbscenariotools import serializer  # noqa: E402
+from kbscenariotools.argparse import add_default_args  # noqa: E402
+
+
+def make_parser():
+    parser = argparse.ArgumentParser()
+    add_default_args(parser)
+    return parser
+
+
+def test_serializer_choices_are_the_installed_ones(monkeypatch):
+    monkeypatch.setattr(
+        serializer, "SERIALIZERS", {"json": serializer.SERIALIZERS["json"]}
+    )
+    parser = make_parser()
+    assert parser.parse_args(["--serializer", "json"]).serializer == "json"
+    with pytest.raises(SystemExit):
+        parser.parse_args(["--serializer", "orjson"])
@@ -0,0 +1,37 @@
+import json
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+from mockbroker import MockBroker  # noqa: E402
+
+from kbscenariotools.endpoint import ScenarioManagerEndpoint  # noqa: E402
+from kbscenariotools.importer import ImportOptions, import_network  # noqa: E402
+
+NET1 = os.path.join(ROOT, "net1.json")
+# The entities the importer sent for net1.json before the converter tables
+BASELINE = os.path.join(HERE, "data", "net1-entities.json")
+
+
+@pytest.fixture(scope="module")
+def baseline():
+    with open(BASELINE) as f:
+        return {entity["id"]: entity for entity in json.load(f)}
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{}, {"batch_size": 10}, {"workers": 2}],
+    ids=["single", "batch", "parallel"],
+)
+def test_net1_entities_match_the_baseline(baseline, options):
+    with MockBroker() as broker:
+        with ScenarioManagerEndpoint(broker.url, retries=0) as endpoint:
+            import_network(NET1, endpoint, ImportOptions("test", **options))
+        imported = {urn: json.loads(entity) for urn, entity in broker.entities.items()}
+    assert imported == baseline
@@ -0,0 +1,90 @@
+import json
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+from mockbroker import MockBroker  # noqa: E402
+
+from kbscenariotools.batch import BatchResult  # noqa: E402
+from kbscenariotools.endpoint import ScenarioManagerEndpoint  # noqa: E402
+from kbscenariotools.importer import (  # noqa: E402
+    ImportOptions,
+    UploadError,
+    import_network,
+)
+
+NET1 = os.path.join(ROOT, "net1.json")
+IDS = ["urn:ngsi:Junction:1", "urn:ngsi:Junction:2", "urn:ngsi:Junction:3"]
+EXISTS = {
+    "type": "https://uri.etsi.org/ngsi-ld/errors/AlreadyExists",
+    "title": "Exists",
+}
+
+
+@pytest.fixture
+def broker():
+    with MockBroker() as broker:
+        yield broker
+
+
+def test_created_ids():
+    result = BatchResult.from_response(201, IDS, IDS)
+    assert result.ok and result.succeeded == IDS
+
+
+def test_upsert_without_body():
+    result = BatchResult.from_response(204, None, IDS)
+    assert result.ok and result.succeeded == IDS
+
+
+def test_partial_success():
+    body = {
+        "success": IDS[:2],
+        "errors": [{"entityId": IDS[2], "error": EXISTS}],
+    }
+    result = BatchResult.from_response(207, json.dumps(body), IDS)
+    assert result.succeeded == IDS[:2]
+    assert result.errors == {IDS[2]: "Exists"}
+    assert result.existing == [IDS[2]]
+    result.accept_existing()
+    assert result.ok and result.succeeded == IDS
+
+
+def test_error_which_is_not_a_conflict():
+    error = {"type": "https://uri.etsi.org/ngsi-ld/errors/BadRequestData"}
+    body = {"success": [], "errors": [{"entityId": IDS[0], "error": error}]}
+    result = BatchResult.from_response(207, body, IDS[:1])
+    assert result.existing == []
+    assert result.errors == {IDS[0]: json.dumps(error)}
+
+
+def test_failure_of_the_whole_batch():
+    result = BatchResult.from_response(
+        400, {"title": "Bad request", "detail": "not an array"}, IDS
+    )
+    assert result.succeeded == []
+    assert set(result.errors.values()) == {"Bad request: not an array"}
+
+
+def run_import(broker, **options):
+    with ScenarioManagerEndpoint(broker.url, retries=0) as endpoint:
+        return import_network(NET1, endpoint, ImportOptions("test", **options))
+
+
+def test_batch_upsert_import_can_be_repeated(broker):
+    first = run_import(broker, batch_size=10, batch_operation="upsert")
+    second = run_import(broker, batch_size=10, batch_operation="upsert")
+    assert len(broker.entities) == first.models == second.models == 27
+    assert first.stats["batches"] == second.stats["batches"] > 1
+
+
+def test_batch_create_reports_the_existing_entities(broker):
+    run_import(broker, batch_size=10)
+    with pytest.raises(UploadError) as raised:
+        run_import(broker, batch_size=10)
+    assert "urn:ngsi:Junction:10: Exists" in raised.value.details
@@ -0,0 +1,50 @@
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kbscenariotools.converters import (  # noqa: E402
+    EPANET_CONVERTERS,
+    SERIES_REFERENCES,
+    urn_factory,
+)
+from kbscenariotools.idindex import IdTypeIndex  # noqa: E402
+
+NET1 = os.path.join(ROOT, "net1.json")
+
+
+def load_net1():
+    with open(NET1, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def element(data, section, name):
+    return next(item for item in data[section] if item["name"] == name)
+
+
+def test_series_references_are_optional():
+    data = load_net1()
+    junction = element(data, "nodes", "10")
+    convert = EPANET_CONVERTERS.compile("Junction", urn_factory())
+    assert "demandPattern" not in convert(junction)
+
+    convert = EPANET_CONVERTERS.compile(
+        "Junction", urn_factory(), options=[SERIES_REFERENCES]
+    )
+    assert convert(junction)["demandPattern"] == "urn:ngsi:Pattern:1"
+
+
+def test_pump_curve_reference():
+    data = load_net1()
+    index = IdTypeIndex.from_items(
+        (node["name"], node["node_type"]) for node in data["nodes"]
+    )
+    pump = element(data, "links", "9")
+    convert = EPANET_CONVERTERS.compile(
+        "Pump", urn_factory("S-"), index, options=[SERIES_REFERENCES]
+    )
+    entity = convert(pump)
+    assert entity["pumpCurve"] == f"urn:ngsi:Curve:S-{pump['pump_curve_name']}"
+    assert entity["startsAt"] == "urn:ngsi:Reservoir:S-9"
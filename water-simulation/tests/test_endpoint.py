@@ -0,0 +1,89 @@
+import os
+import socket
+import socketserver
+import sys
+import threading
+
+import pytest
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+from mockbroker import MockBroker  # noqa: E402
+
+from kbscenariotools.endpoint import ScenarioManagerEndpoint  # noqa: E402
+
+ENTITY = {"id": "urn:ngsi-ld:Junction:J-1", "type": "Junction"}
+
+
+@pytest.fixture
+def slow_broker():
+    with MockBroker(latency=0.3) as broker:
+        yield broker
+
+
+def slow_endpoint(broker):
+    return ScenarioManagerEndpoint(broker.url, retries=2, retry_backoff=0, timeout=0.1)
+
+
+def test_post_is_not_sent_again_after_a_timeout(slow_broker):
+    with slow_endpoint(slow_broker) as endpoint:
+        with pytest.raises(requests.Timeout):
+            endpoint.post("/ngsi-ld/v1/entities/", ENTITY, "application/ld+json")
+    assert slow_broker.requests == 1
+
+
+def test_get_is_retried_after_a_timeout(slow_broker):
+    with slow_endpoint(slow_broker) as endpoint:
+        with pytest.raises(requests.ConnectionError):
+            endpoint.get(f"/ngsi-ld/v1/entities/{ENTITY['id']}")
+    assert slow_broker.requests == 3
+
+
+class _DroppingHandler(socketserver.BaseRequestHandler):
+    """Answers the first request of a connection, drops it on the second one"""
+
+    def handle(self):
+        reader = self.request.makefile("rb")
+        for answered in (True, False):
+            length = 0
+            line = reader.readline()
+            while line not in (b"\r\n", b""):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+                line = reader.readline()
+            reader.read(length)
+            if not answered:
+                # Like a broker closing an idle keep-alive connection
+                self.request.shutdown(socket.SHUT_RDWR)
+                return
+            self.server.requests += 1
+            self.request.sendall(
+                b"HTTP/1.1 201 Created\r\nContent-Length: 0\r\n"
+                b"Connection: keep-alive\r\n\r\n"
+            )
+
+
+@pytest.fixture
+def dropping_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _DroppingHandler)
+    server.daemon_threads = True
+    server.requests = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_post_is_retried_on_a_dropped_keep_alive_connection(dropping_server):
+    host, port = dropping_server.server_address
+    with ScenarioManagerEndpoint(f"http://{host}:{port}", retries=2) as endpoint:
+        for _ in range(3):
+            status, _ = endpoint.post(
+                "/ngsi-ld/v1/entities/", ENTITY, "application/ld+json"
+            )
+            assert status == 201
+    assert dropping_server.requests == 3
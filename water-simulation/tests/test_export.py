@@ -0,0 +1,60 @@
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+from mockbroker import MockBroker  # noqa: E402
+
+from kbscenariotools.endpoint import ScenarioManagerEndpoint  # noqa: E402
+from kbscenariotools.export import (  # noqa: E402
+    count_entities,
+    fetch_page,
+    iter_pages,
+    Page,
+)
+from kbscenariotools.importer import ImportOptions, import_network  # noqa: E402
+
+NET1 = os.path.join(ROOT, "net1.json")
+TYPES = ("Junction", "Pipe", "Pattern", "WaterNetwork")
+
+
+@pytest.fixture
+def endpoint():
+    with MockBroker() as broker:
+        with ScenarioManagerEndpoint(broker.url, retries=0) as endpoint:
+            import_network(NET1, endpoint, ImportOptions("test", batch_size=10))
+            yield endpoint
+
+
+def test_count_uses_the_import_context(endpoint):
+    assert count_entities(endpoint, "Junction", {}) == 9
+    # Without the Link header the type is expanded with the core context
+    assert count_entities(endpoint, "Junction", {}, headers={}) == 0
+
+
+def test_paged_export_returns_every_entity_once(endpoint):
+    counts = {type_: count_entities(endpoint, type_, {}) for type_ in TYPES}
+    pages = list(iter_pages(endpoint, counts, 3, {}, concurrency=3))
+    ids = [entity["id"] for page in pages for entity in page]
+    assert len(ids) == len(set(ids)) == sum(counts.values())
+    assert all(len(page) <= 3 for page in pages)
+
+
+def test_export_without_count_reads_until_a_short_page(endpoint):
+    pages = list(iter_pages(endpoint, {"Pipe": None}, 5, {}))
+    assert [len(page) for page in pages] == [5, 5, 2]
+
+
+def test_prefix_filter(endpoint):
+    params = {"idPattern": "^urn:ngsi:[^:]+:1"}
+    entities = fetch_page(endpoint, Page("Junction", 0, 100), params)
+    assert sorted(entity["id"] for entity in entities) == [
+        "urn:ngsi:Junction:10",
+        "urn:ngsi:Junction:11",
+        "urn:ngsi:Junction:12",
+        "urn:ngsi:Junction:13",
+    ]
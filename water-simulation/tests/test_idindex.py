@@ -0,0 +1,52 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kbscenariotools.idindex import ElementType, IdTypeIndex  # noqa: E402
+
+ITEMS = [("J-1", "Junction"), ("Tänk", "Tank"), ("P-1", "Pipe")] + [
+    (f"J-{i}", "Junction") for i in range(2, 1000)
+]
+
+
+def check(index):
+    assert index["Tänk"] == "Tank"
+    assert index.type_code("P-1") == ElementType.Pipe
+    assert all(index[name] == type_ for name, type_ in ITEMS)
+    assert "missing" not in index
+    assert index.get("missing", "Pipe") == "Pipe"
+    with pytest.raises(KeyError):
+        index["missing"]
+
+
+def test_lookup():
+    index = IdTypeIndex.from_items(ITEMS)
+    assert len(index) == len(ITEMS)
+    check(index)
+
+
+def test_name_added_again_replaces_the_type():
+    index = IdTypeIndex.from_items([("R-1", "Junction"), ("R-1", "Reservoir")])
+    assert index["R-1"] == "Reservoir"
+
+
+def test_spill_and_open(tmp_path):
+    path = str(tmp_path / "nodes.idx")
+    index = IdTypeIndex.from_items(ITEMS)
+    index.spill(path)
+    check(index)
+    with pytest.raises(RuntimeError):
+        index.add("J-0", "Junction")
+    opened = IdTypeIndex.open(path)
+    check(opened)
+    opened.close()
+    index.close()
+
+
+def test_empty():
+    index = IdTypeIndex()
+    assert len(index) == 0
+    assert "J-1" not in index
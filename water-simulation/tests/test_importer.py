@@ -0,0 +1,123 @@
+import copy
+import json
+import multiprocessing
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+from mockbroker import MockBroker  # noqa: E402
+
+from kbscenariotools.endpoint import ScenarioManagerEndpoint  # noqa: E402
+from kbscenariotools.importer import (  # noqa: E402
+    ImportOptions,
+    NetworkImport,
+    import_network,
+)
+
+NET1 = os.path.join(ROOT, "net1.json")
+
+
+@pytest.fixture
+def broker():
+    with MockBroker() as broker:
+        yield broker
+
+
+def run_import(broker, **options):
+    endpoint = ScenarioManagerEndpoint(broker.url, retries=0)
+    try:
+        return import_network(NET1, endpoint, ImportOptions("test", **options))
+    finally:
+        endpoint.close()
+
+
+def truncate_journal(path, keep):
+    """Keeps the header and the first ``keep`` URNs, as if the import was killed"""
+    with open(path, encoding="utf-8") as f:
+        lines = f.readlines()
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(lines[: keep + 1])
+
+
+def test_resume_delete_missing_keeps_journaled_entities(broker, tmp_path):
+    options = dict(
+        incremental=True,
+        manifest=str(tmp_path / "manifest.sqlite"),
+        journal=str(tmp_path / "journal.txt"),
+    )
+    first = run_import(broker, **options)
+    entities = len(broker.entities)
+    assert entities == first.models
+
+    second = run_import(broker, resume=True, delete_missing=True, **options)
+    assert second.stats.get("deleted", 0) == 0
+    assert second.stats["skipped"] == entities
+    assert len(broker.entities) == entities
+
+
+def test_resume_batch_accepts_existing_entities(broker, tmp_path):
+    journal = str(tmp_path / "journal.txt")
+    first = run_import(broker, batch_size=10, journal=journal)
+    truncate_journal(journal, 5)
+
+    second = run_import(broker, batch_size=10, journal=journal, resume=True)
+    assert second.stats["skipped"] == 5
+    assert second.stats.get("failed", 0) == 0
+    assert len(broker.entities) == first.models
+
+
+def test_import_leaves_the_source_unchanged(broker):
+    with open(NET1, encoding="utf-8") as f:
+        network = json.load(f)
+    source = copy.deepcopy(network)
+    options = ImportOptions("test", crs="EPSG:3857", dedup_series=True)
+    endpoint = ScenarioManagerEndpoint(broker.url, retries=0)
+    try:
+        import_network(source, endpoint, options)
+        first = dict(broker.entities)
+        import_network(source, endpoint, options._replace(prefix="again-"))
+    finally:
+        endpoint.close()
+    assert source == network
+    junction = json.loads(first["urn:ngsi:Junction:10"])
+    again = json.loads(broker.entities["urn:ngsi:Junction:again-10"])
+    assert again["location"] == junction["location"]
+
+
+def test_incremental_import_appends_added_attributes(broker, tmp_path):
+    with open(NET1, encoding="utf-8") as f:
+        network = json.load(f)
+    options = ImportOptions(
+        "test", incremental=True, manifest=str(tmp_path / "manifest.sqlite")
+    )
+    endpoint = ScenarioManagerEndpoint(broker.url, retries=0)
+    try:
+        import_network(network, endpoint, options)
+        junction = next(node for node in network["nodes"] if node["name"] == "10")
+        junction["tag"] = "north"
+        junction["elevation"] = 220.0
+        report = import_network(network, endpoint, options)
+    finally:
+        endpoint.close()
+    assert report.stats["updated"] == 1
+    stored = json.loads(broker.entities["urn:ngsi:Junction:10"])
+    assert stored["tag"] == "north"
+    assert stored["elevation"] == 220.0
+
+
+def test_workers_are_forked_by_prepare(broker):
+    # Before the caller starts threads (e.g. a progress bar) and before run()
+    # starts the upload threads
+    with ScenarioManagerEndpoint(broker.url, retries=0) as endpoint:
+        network_import = NetworkImport(
+            NET1, endpoint, ImportOptions("test", workers=2, concurrency=4)
+        )
+        network_import.prepare()
+        assert len(multiprocessing.active_children()) == 2
+        report = network_import.run()
+    assert report.models == len(broker.entities) == 27
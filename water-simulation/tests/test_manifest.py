@@ -0,0 +1,85 @@
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+from kbscenariotools.manifest import EntityChange, ImportManifest  # noqa: E402
+
+PIPE = {
+    "id": "urn:ngsi:Pipe:1",
+    "type": "Pipe",
+    "diameter": 12.0,
+    "length": 100.0,
+    "tag": "old",
+}
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "manifest.sqlite")
+
+
+def record(path, *entities, scenario="test", prefix=""):
+    manifest = ImportManifest(path, scenario, prefix)
+    changes = [manifest.diff(entity) for entity in entities]
+    for entity, change in zip(entities, changes):
+        if change.action != "unchanged":
+            manifest.confirm(entity["id"])
+    return manifest, changes
+
+
+def test_new_entity_is_created(path):
+    manifest, [change] = record(path, PIPE)
+    manifest.close()
+    assert change == EntityChange("create", [], [], ["diameter", "length", "tag"])
+
+
+def test_unchanged_entity(path):
+    record(path, PIPE)[0].close()
+    manifest, [change] = record(path, dict(PIPE))
+    manifest.close()
+    assert change == EntityChange("unchanged", [], [], [])
+
+
+def test_changed_added_and_removed_attributes(path):
+    record(path, PIPE)[0].close()
+    pipe = {**PIPE, "diameter": 16.0, "roughness": 100.0}
+    del pipe["tag"]
+    manifest, [change] = record(path, pipe)
+    manifest.close()
+    assert change == EntityChange("update", ["diameter"], ["tag"], ["roughness"])
+    # The confirmed update is the new baseline
+    manifest, [change] = record(path, pipe)
+    manifest.close()
+    assert change.action == "unchanged"
+
+
+def test_unconfirmed_upload_is_sent_again(path):
+    manifest = ImportManifest(path, "test", "")
+    manifest.diff(PIPE)
+    manifest.close()
+    manifest, [change] = record(path, PIPE)
+    manifest.close()
+    assert change.action == "create"
+
+
+def test_missing_entities_and_forget(path):
+    junction = {"id": "urn:ngsi:Junction:2", "type": "Junction", "elevation": 1.0}
+    record(path, PIPE, junction)[0].close()
+    manifest, _ = record(path, junction)
+    assert list(manifest.missing()) == [PIPE["id"]]
+    manifest.forget(PIPE["id"])
+    assert list(manifest.missing()) == []
+    manifest.close()
+
+
+def test_scenarios_and_prefixes_are_separate(path):
+    record(path, PIPE)[0].close()
+    for scenario, prefix in (("other", ""), ("test", "Test")):
+        manifest, [change] = record(path, PIPE, scenario=scenario, prefix=prefix)
+        manifest.close()
+        assert change.action == "create"
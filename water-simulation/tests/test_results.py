@@ -0,0 +1,166 @@
+import json
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+np = pytest.importorskip("numpy")
+
+from mockbroker import MockBroker  # noqa: E402
+
+from kbscenariotools import results  # noqa: E402
+from kbscenariotools.batch import BatchResult  # noqa: E402
+from kbscenariotools.converters import EPANET_CONTEXT  # noqa: E402
+from kbscenariotools.endpoint import ScenarioManagerEndpoint  # noqa: E402
+from kbscenariotools.results import (  # noqa: E402
+    TEMPORAL_ENTITIES_PATH,
+    ResultsEncoder,
+    ResultTable,
+    observed_at,
+    report_times,
+)
+from kbscenariotools.serializer import context_fragment, get_serializer  # noqa: E402
+
+TIME_OPTIONS = {"report_start": 0.0, "report_timestep": 3600.0}
+TIMESTAMPS = observed_at(datetime(2024, 5, 1), np.array([0.0, 3600.0, 7200.0]))
+TYPES = {"10": "Junction", "11": "Junction", "9": "Pump", "12": "Pipe"}
+
+
+def tables():
+    return [
+        ResultTable(
+            "node",
+            "pressure",
+            ["10", "11"],
+            None,
+            np.array([[1.0, 2.0], [1.5, np.nan], [1.25, 2.5]]),
+        ),
+        # Junction 11 has no demand results
+        ResultTable("node", "demand", ["10"], None, np.array([[0.1], [0.2], [1 / 3]])),
+        ResultTable("link", "flow", ["9", "12"], None, np.arange(6.0).reshape(3, 2)),
+    ]
+
+
+def resolve(kind, name):
+    return f"urn:ngsi:{TYPES[name]}:{name}", TYPES[name]
+
+
+def encoder(precision=None):
+    serializer = get_serializer("json")
+    return ResultsEncoder(
+        tables(),
+        TIMESTAMPS,
+        resolve,
+        serializer,
+        context_fragment(EPANET_CONTEXT, serializer),
+        precision,
+    )
+
+
+def values(instances):
+    return [(i["value"], i["observedAt"]) for i in instances]
+
+
+def test_report_times_and_timestamps():
+    seconds = report_times(TIME_OPTIONS, tables())
+    assert seconds.tolist() == [0.0, 3600.0, 7200.0]
+    assert observed_at(datetime(2024, 5, 1, 6), seconds + 0.5).tolist() == [
+        "2024-05-01T06:00:00.500Z",
+        "2024-05-01T07:00:00.500Z",
+        "2024-05-01T08:00:00.500Z",
+    ]
+    mismatch = [tables()[0]._replace(times=np.array([0.0, 60.0, 120.0]))]
+    with pytest.raises(ValueError):
+        report_times(TIME_OPTIONS, mismatch)
+
+
+@pytest.mark.parametrize("with_orjson", [True, False], ids=["orjson", "numpy"])
+def test_temporal_payloads(monkeypatch, with_orjson):
+    if not with_orjson:
+        monkeypatch.setattr(results, "orjson", None)
+    elif results.orjson is None:
+        pytest.skip("orjson is not installed")
+    payloads = dict(encoder().temporal())
+    assert list(payloads) == [resolve("", name)[0] for name in ("10", "11", "9", "12")]
+    junction = json.loads(payloads["urn:ngsi:Junction:10"])
+    assert junction["@context"] == EPANET_CONTEXT
+    assert junction["type"] == "Junction"
+    assert values(junction["pressure"]) == list(
+        zip([1.0, 1.5, 1.25], TIMESTAMPS.tolist())
+    )
+    assert [value for value, _ in values(junction["demand"])] == [0.1, 0.2, 1 / 3]
+    # The NaN is left out, as is the attribute without results
+    other = json.loads(payloads["urn:ngsi:Junction:11"])
+    assert values(other["pressure"]) == [
+        (2.0, TIMESTAMPS[0]),
+        (2.5, TIMESTAMPS[2]),
+    ]
+    assert "demand" not in other
+    pump = json.loads(payloads["urn:ngsi:Pump:9"])
+    assert [value for value, _ in values(pump["flow"])] == [0.0, 2.0, 4.0]
+
+
+def test_precision_and_steps_per_request():
+    payloads = [
+        (urn, json.loads(payload))
+        for urn, payload in encoder(precision=2).temporal(steps_per_request=2)
+    ]
+    assert encoder().count_temporal(2) == 8 == len(payloads)
+    demand = [
+        value
+        for urn, payload in payloads
+        if urn == "urn:ngsi:Junction:10"
+        for value, _ in values(payload["demand"])
+    ]
+    assert demand == [0.1, 0.2, 0.33]
+
+
+def test_batch_updates_in_time_order():
+    blocks = list(encoder().batch(batch_size=1))
+    assert encoder().count_batches(1) == 12
+    assert len(blocks) == 4
+    steps = list(blocks[1])
+    assert [ids for ids, _ in steps] == [["urn:ngsi:Junction:11"]] * 2
+    assert json.loads(steps[-1][1][0])["pressure"]["value"] == 2.5
+
+
+def test_upload_to_the_broker():
+    with MockBroker() as broker:
+        with ScenarioManagerEndpoint(broker.url, retries=0) as endpoint:
+            encoder_ = encoder()
+            for _, payload in encoder_.temporal(steps_per_request=2):
+                status, _ = endpoint.post(
+                    TEMPORAL_ENTITIES_PATH, payload, "application/ld+json"
+                )
+                assert status in (201, 204)
+            status, history = endpoint.get(
+                TEMPORAL_ENTITIES_PATH + "urn:ngsi:Junction:10"
+            )
+    assert status == 200
+    assert values(history["pressure"]) == list(
+        zip([1.0, 1.5, 1.25], TIMESTAMPS.tolist())
+    )
+
+
+def test_batch_upload_keeps_the_last_step():
+    with MockBroker() as broker:
+        with ScenarioManagerEndpoint(broker.url, retries=0) as endpoint:
+            entities = [
+                {"id": resolve("", name)[0], "type": type_, "@context": EPANET_CONTEXT}
+                for name, type_ in TYPES.items()
+            ]
+            status, res = endpoint.batch("create", entities)
+            assert BatchResult.from_response(status, res, []).ok
+            for steps in encoder().batch(batch_size=2):
+                for ids, payloads in steps:
+                    status, res = endpoint.batch("update", payloads)
+                    assert BatchResult.from_response(status, res, ids).ok
+        stored = json.loads(broker.entities["urn:ngsi:Junction:11"])
+        history = broker.temporal["urn:ngsi:Junction:11"]
+    assert stored["pressure"]["value"] == 2.5
+    assert [value for value, _ in values(history["pressure"])] == [2.0, 2.5]
@@ -0,0 +1,116 @@
+import copy
+import json
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+np = pytest.importorskip("numpy")
+
+from mockbroker import MockBroker  # noqa: E402
+
+from kbscenariotools.endpoint import ScenarioManagerEndpoint  # noqa: E402
+from kbscenariotools.importer import ImportOptions, import_network  # noqa: E402
+from kbscenariotools.series import deduplicate, rewrite_references  # noqa: E402
+
+NET1 = os.path.join(ROOT, "net1.json")
+
+
+def names(result):
+    return [element["name"] for element in result.elements]
+
+
+def test_identical_series_are_merged():
+    patterns = [
+        {"name": "a", "multipliers": [1.0, 0.5]},
+        {"name": "b", "multipliers": [1.0, 0.5]},
+        {"name": "c", "multipliers": [1.0, 0.5, 1.0]},
+        {"name": "d", "multipliers": [0.0, -0.0]},
+        {"name": "e", "multipliers": [-0.0, 0.0]},
+        {"name": "f", "multipliers": None},
+    ]
+    result = deduplicate(patterns, "multipliers")
+    assert names(result) == ["a", "c", "d", "f"]
+    assert result.canonical == {
+        "a": "a",
+        "b": "a",
+        "c": "c",
+        "d": "d",
+        "e": "d",
+        "f": "f",
+    }
+    # The kept elements are passed through unchanged
+    assert result.elements[0] is patterns[0]
+
+
+def test_series_are_merged_after_rounding():
+    patterns = [
+        {"name": "a", "multipliers": [1.0004, 0.5]},
+        {"name": "b", "multipliers": [0.9996, 0.5001]},
+    ]
+    assert names(deduplicate(patterns, "multipliers")) == ["a", "b"]
+    result = deduplicate(patterns, "multipliers", precision=3)
+    assert names(result) == ["a"]
+    assert result.elements[0]["multipliers"] == [1.0, 0.5]
+    assert patterns[0]["multipliers"] == [1.0004, 0.5]
+
+
+def test_curves_of_other_types_are_kept():
+    curves = [
+        {"name": "head", "curve_type": "HEAD", "points": [[1.0, 2.0]]},
+        {"name": "volume", "curve_type": "VOLUME", "points": [[1.0, 2.0]]},
+        {"name": "head2", "curve_type": "HEAD", "points": [[1.0, 2.0]]},
+    ]
+    result = deduplicate(curves, "points", tag_key="curve_type")
+    assert names(result) == ["head", "volume"]
+    assert result.canonical["head2"] == "head"
+
+
+def test_rewrite_references():
+    nodes = [
+        {"name": "j", "demand_timeseries_list": [{"pattern_name": "b"}]},
+        {"name": "r", "head_pattern_name": "a"},
+        {"name": "t", "vol_curve_name": "v2"},
+    ]
+    links = [{"name": "p", "pump_curve_name": "v2", "speed_pattern_name": "b"}]
+    changed = rewrite_references(
+        nodes, links, {"a": "a", "b": "a"}, {"v1": "v1", "v2": "v1"}
+    )
+    assert changed == 4
+    assert nodes[0]["demand_timeseries_list"][0]["pattern_name"] == "a"
+    assert nodes[1]["head_pattern_name"] == "a"
+    assert nodes[2]["vol_curve_name"] == "v1"
+    assert links[0] == {
+        "name": "p",
+        "pump_curve_name": "v1",
+        "speed_pattern_name": "a",
+    }
+
+
+def test_import_with_dedup_series():
+    with open(NET1) as f:
+        network = json.load(f)
+    # A second copy of the demand pattern, used by junction 11
+    pattern = copy.deepcopy(network["patterns"][0])
+    pattern["name"] = "2"
+    network["patterns"].append(pattern)
+    junction = next(node for node in network["nodes"] if node["name"] == "11")
+    junction["demand_timeseries_list"][0]["pattern_name"] = "2"
+    with MockBroker() as broker:
+        with ScenarioManagerEndpoint(broker.url, retries=0) as endpoint:
+            report = import_network(
+                network, endpoint, ImportOptions("test", dedup_series=True)
+            )
+        entities = {urn: json.loads(entity) for urn, entity in broker.entities.items()}
+    assert report.counts["Pattern"] == 1
+    assert "urn:ngsi:Pattern:2" not in entities
+    for name in ("10", "11"):
+        assert entities[f"urn:ngsi:Junction:{name}"]["demandPattern"] == (
+            "urn:ngsi:Pattern:1"
+        )
+    # The series stage works on copies of the elements
+    assert junction["demand_timeseries_list"][0]["pattern_name"] == "2"
@@ -0,0 +1,150 @@
+import json
+import math
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+np = pytest.importorskip("numpy")
+
+from mockbroker import MockBroker  # noqa: E402
+
+from kbscenariotools.endpoint import ScenarioManagerEndpoint  # noqa: E402
+from kbscenariotools.importer import ImportOptions, import_network  # noqa: E402
+from kbscenariotools.spatial import (  # noqa: E402
+    EARTH_RADIUS,
+    group_by_tile,
+    iter_grouped,
+    locate,
+    parse_tiles,
+    reproject,
+    tile_indices,
+)
+
+NET1 = os.path.join(ROOT, "net1.json")
+
+
+def mercator(lon, lat):
+    return (
+        EARTH_RADIUS * math.radians(lon),
+        EARTH_RADIUS * math.log(math.tan(math.pi / 4 + math.radians(lat) / 2)),
+    )
+
+
+def test_reproject_web_mercator():
+    x, y = zip(mercator(13.405, 52.52), mercator(-74.006, 40.7128))
+    lon, lat = reproject(np.array(x), np.array(y), "epsg:3857")
+    assert np.allclose(lon, [13.405, -74.006])
+    assert np.allclose(lat, [52.52, 40.7128])
+    # WGS84 positions are passed through
+    assert reproject(np.array(x), np.array(y), "EPSG:4326")[0] is not None
+
+
+def test_locate_nodes_and_links():
+    nodes = [
+        {"name": "a", "coordinates": list(mercator(13.4, 52.5))},
+        {"name": "b", "coordinates": list(mercator(13.5, 52.6))},
+        {"name": "c", "coordinates": None},
+    ]
+    links = [
+        {
+            "name": "ab",
+            "start_node_name": "a",
+            "end_node_name": "b",
+            "vertices": [list(mercator(13.45, 52.55))],
+        },
+        {"name": "bc", "start_node_name": "b", "end_node_name": "c", "vertices": []},
+    ]
+    locate(nodes, links, "EPSG:3857")
+    assert nodes[0]["coordinates"] == [13.4, 52.5]
+    assert nodes[2]["coordinates"] is None
+    assert links[0]["coordinates"] == [[13.4, 52.5], [13.45, 52.55], [13.5, 52.6]]
+    # Without the position of its end node a link gets no LineString
+    assert "coordinates" not in links[1]
+
+
+def test_tile_indices():
+    lon = np.array([0.0, -180.0, 179.9999, 13.405])
+    lat = np.array([0.0, 85.06, -85.06, 52.52])
+    xs, ys = tile_indices(lon, lat, 14)
+    assert xs.tolist() == [8192, 0, 16383, 8802]
+    assert ys.tolist() == [8192, 0, 16383, 5373]
+    assert [v.tolist() for v in tile_indices(lon, lat, 0)] == [[0] * 4, [0] * 4]
+
+
+def test_parse_tiles():
+    assert parse_tiles("14/8802/5373, 14/08803/5373") == (
+        14,
+        {"14/8802/5373", "14/8803/5373"},
+    )
+    with pytest.raises(ValueError):
+        parse_tiles("14/8802")
+    with pytest.raises(ValueError):
+        parse_tiles("14/8802/5373,13/4401/2686")
+
+
+def test_group_by_tile():
+    elements = [
+        ("Junction", {"name": "east", "coordinates": [13.41, 52.52]}),
+        ("Junction", {"name": "none"}),
+        ("Junction", {"name": "west", "coordinates": [-74.0, 40.7]}),
+        ("Pipe", {"name": "p", "coordinates": [[13.41, 52.52], [-74.0, 40.7]]}),
+    ]
+    groups = group_by_tile(elements, 14)
+    assert {key: [e["name"] for _, e in items] for key, items in groups.items()} == {
+        "14/4824/6160": ["west"],
+        "14/8802/5373": ["east", "p"],
+        None: ["none"],
+    }
+    assert list(groups) == ["14/4824/6160", "14/8802/5373", None]
+    selected = iter_grouped(groups, ["14/8802/5373"])
+    assert [e["name"] for _, e in selected] == ["east", "p"]
+
+
+def run_import(**options):
+    with MockBroker() as broker:
+        with ScenarioManagerEndpoint(broker.url, retries=0) as endpoint:
+            import_network(NET1, endpoint, ImportOptions("test", **options))
+        return {urn: json.loads(entity) for urn, entity in broker.entities.items()}
+
+
+def test_import_reprojects_the_network():
+    entities = run_import(crs="EPSG:3857")
+    assert entities["urn:ngsi:Junction:10"]["location"] == {
+        "type": "Point",
+        "coordinates": [0.0001797, 0.0006288],
+    }
+    assert entities["urn:ngsi:Pipe:110"]["location"] == {
+        "type": "LineString",
+        "coordinates": [[0.0004492, 0.0008085], [0.0004492, 0.0006288]],
+    }
+
+
+def test_import_of_selected_tiles():
+    entities = run_import(crs="EPSG:3857", tiles="20/524289/524285")
+    assert sorted(entities) == ["urn:ngsi:Pipe:110", "urn:ngsi:Tank:2"]
+
+
+def test_import_in_tile_order():
+    entities = run_import(crs="EPSG:3857", tile_zoom=20)
+    urns = list(entities)
+    assert len(urns) == 27
+    # The first tile holds the nodes and the links starting there
+    assert urns[:4] == [
+        "urn:ngsi:Junction:10",
+        "urn:ngsi:Junction:11",
+        "urn:ngsi:Junction:21",
+        "urn:ngsi:Reservoir:9",
+    ]
+
+
+@pytest.mark.parametrize(
+    "options", [{"tile_zoom": 14}, {"tiles": "14/8802/5373"}], ids=["zoom", "tiles"]
+)
+def test_tiles_need_a_crs(options):
+    with pytest.raises(ValueError, match="--crs"):
+        run_import(**options)
@@ -0,0 +1,61 @@
+import io
+import json
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+import synthetic  # noqa: E402
+
+from kbscenariotools import streaming  # noqa: E402
+
+SECTIONS = ("nodes", "links", "curves", "patterns")
+
+
+@pytest.fixture(autouse=True)
+def without_ijson(monkeypatch):
+    monkeypatch.setattr(streaming, "ijson", None)
+
+
+@pytest.fixture(scope="module")
+def network(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("streaming") / "network.json")
+    synthetic.generate(path, 20000)
+    with open(path) as f:
+        return path, json.load(f)
+
+
+def test_sections_of_a_large_network(network):
+    path, data = network
+    # The input spans several chunks of the scanner
+    assert os.path.getsize(path) > 2 << 20
+    streamed = {key: [] for key in SECTIONS}
+    for key, value in streaming.iter_sections(path, SECTIONS):
+        if key in SECTIONS:
+            streamed[key].append(value)
+        else:
+            streamed[key] = value
+    assert streamed == data
+
+
+def test_values_across_chunk_boundaries():
+    # Numbers, strings and nesting split at every position
+    values = [1.5e-7, -12, 'a \\" [string]', {"a": [1, {"b": None}]}, True, []]
+    text = json.dumps(values, indent=1)
+    scanner = streaming.JsonScanner(io.StringIO(text), chunk_size=3)
+    assert list(scanner.iter_array()) == values
+
+
+def test_iter_array_reads_bytes():
+    values = [{"id": f"urn:ngsi:Pipe:{i}", "length": i / 3} for i in range(5000)]
+    source = io.BytesIO(json.dumps(values).encode("utf-8"))
+    assert list(streaming.iter_array(source)) == values
+
+
+def test_invalid_input():
+    with pytest.raises(ValueError):
+        list(streaming.iter_sections(io.BytesIO(b'{"nodes": [1 2]}'), SECTIONS))
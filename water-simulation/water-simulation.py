@@ -1,10 +1,14 @@
 #!/usr/bin/env python
 
 import argparse
-import json
+import sys
 
 from kbscenariotools.argparse import add_default_args
+from kbscenariotools.batch import BATCH_OPERATIONS
+from kbscenariotools.context import CONTEXT_MODES, DEFAULT_CACHE_DIR
 from kbscenariotools.endpoint import ScenarioManagerEndpoint
+from kbscenariotools.importer import ImportOptions, NetworkImport, UploadError
+from kbscenariotools.metrics import Metrics
 from tqdm import tqdm
 
 parser = argparse.ArgumentParser(
@@ -42,6 +46,8 @@ The script takes the json file with a structure like this and calls the scenario
 
 Currently, only the nodes and links are converted, and a network grouping all the data is created using the --network-name parameter.
 
+The same import can be run in-process with kbscenariotools.importer.import_network().
+
 """,
 )
 add_default_args(parser, scenario_id=True)
@@ -59,6 +65,13 @@ parser.add_argument(
     action="store",
     default="WaterNetwork1",
 )
+parser.add_argument(
+    "--network-chunk-size",
+    help="Split the members of the network into nested WaterNetwork entities of at most N members each, keeping the payloads bounded (default: 0, one network listing all members)",
+    type=int,
+    action="store",
+    default=0,
+)
 parser.add_argument(
     "--prefix",
     help='Prefix for NGSI identifies (Prefix "Test" makes "urn:ngsi:Pipe:TestPipe42" from "Pipe42", default: None)',
@@ -66,314 +79,236 @@ parser.add_argument(
     action="store",
     default="",
 )
-args = parser.parse_args()
-scenario_id = args.scenario
-
-endpoint = ScenarioManagerEndpoint.from_args(args)
-
-# Parse the input file
-with open(args.input_json, "r") as f:
-    data = json.load(f)
-junctions = list(filter(lambda node: node["node_type"] == "Junction", data["nodes"]))
-tanks = list(filter(lambda node: node["node_type"] == "Tank", data["nodes"]))
-reservoirs = list(filter(lambda node: node["node_type"] == "Reservoir", data["nodes"]))
-pipes = list(filter(lambda link: link["link_type"] == "Pipe", data["links"]))
-pumps = list(filter(lambda link: link["link_type"] == "Pump", data["links"]))
-curves = list(data["curves"])
-patterns = list(data["patterns"])
-options = data["options"]
-node_id_type_map = {node["name"]: node["node_type"] for node in data["nodes"]}
-link_id_type_map = {link["name"]: link["link_type"] for link in data["links"]}
-curve_id_type_map = {curve["name"]: curve["curve_type"] for curve in data["curves"]}
-
-print("-[ Import Results ]-----------------")
-print(f"{len(junctions):6} junctions")
-print(f"{len(tanks):6} tanks")
-print(f"{len(reservoirs):6} reservoirs")
-print(f"{len(pipes):6} pipes")
-print(f"{len(pumps):6} pumps")
-print(f"{len(curves):6} curves")
-print(f"{len(patterns):6} patterns")
-print("     1 network")
-total = (
-    len(junctions)
-    + len(tanks)
-    + len(reservoirs)
-    + len(pipes)
-    + len(pumps)
-    + len(curves)
-    + len(patterns)
-    + 1
+parser.add_argument(
+    "--batch-size",
+    help="Number of entities sent per NGSI-LD batch request (default: 0, one POST per entity)",
+    type=int,
+    action="store",
+    default=0,
 )
-print("------------------------------------")
-print(f"{total:6} models total\n")
-if any(link["link_type"] == "Valve" for link in data["links"]):
-    print("WARNING: Data contains valves, but this script does not support them (yet)!")
-
-# Check the scenario exists:
-# status, res = endpoint.get(f"/scenarios/{scenario_id}")
-# assert status == 200, f"Scenario does not exist: {scenario_id}"
-#print(f"Using scenario {scenario_id}: {res['name']}\n")
-
-
-def make_urn(id, type_=None, id_type_map=None):
-    if type_ is None:
-        if id_type_map is None:
-            raise ValueError("id_type_map cannot be None.")
-        type_ = id_type_map[id]
-    return f"urn:ngsi:{type_}:{args.prefix}{id}"
-
-
-def set_urn(data_in, data_out, id_in, id_out=None, id_type_map=None):
-    if id_in in data_in and data_in[id_in] is not None:
-        urn = make_urn(data_in[id_in], id_type_map=id_type_map)
-        data_out[id_out if id_out is not None else id_in] = urn
-
-
-def set_if_not_null(data_in, data_out, id_in, id_out=None, conv=lambda x: x):
-    if id_in in data_in and data_in[id_in] is not None:
-        data_out[id_out if id_out is not None else id_in] = conv(data_in[id_in])
-
-
-def set_data_series(data_in, data_out, id_in, index, id_out=None):
-    if (
-        id_in in data_in
-        and type(data_in[id_in]) == list
-        and all((isinstance(l, list) and len(l) == 2) for l in data_in[id_in])
-    ):
-        data_out[id_out if id_out is not None else id_in] = [
-            l[index] for l in data_in[id_in]
-        ]
-
-
-def set_curveType(data_in, data_out, id_in, id_out=None):
-    if id_in in data_in and data_in[id_in] is not None:
-        curveType_dict = {
-            "HEAD": "FLOW-HEAD",
-            "EFFICIENCY": "FLOW-EFFICIENCY",
-            "HEADLOSS": "FLOW-HEADLOSS",
-            "VOLUME": "LEVEL-VOLUME",
-        }
-        if data_in[id_in] in curveType_dict.keys():
-            data_out[id_out if id_out is not None else id_in] = curveType_dict[
-                data_in[id_in]
-            ]
-    else:
-        raise ValueError("Wrong curve type for curve {}".format(data_in["name"]))
-
-
-def set_geojson_point(data_in, data_out, id_in, id_out=None):
-    if id_in in data_in and type(data_in[id_in]) == list and len(data_in[id_in]) == 2:
-        data_out[id_out if id_out is not None else id_in] = {
-            "type": "Point",
-            "coordinates": data_in[id_in],
-        }
-
-
-def observe(data):
-    return {"value": data}
-
-
-def set_node_data(data_in, data_out):
-    set_geojson_point(data_in, data_out, "coordinates", "location")
-    set_if_not_null(data_in, data_out, "initial_quality", "initialQuality", observe)
-    set_if_not_null(data_in, data_out, "name")
-    set_if_not_null(data_in, data_out, "tag")
-
-
-def set_link_data(data_in, data_out):
-    set_urn(data_in, data_out, "start_node_name", "startsAt", node_id_type_map)
-    set_urn(data_in, data_out, "end_node_name", "endsAt", node_id_type_map)
-    data_out["initialStatus"] = data_in["initial_status"].upper()  # required
-    set_if_not_null(data_in, data_out, "name")
-    set_if_not_null(data_in, data_out, "tag")
-    # Fields which should go to simulation metadata
-    #   - initial_setting
-
-
-def set_curve_data(data_in, data_out):
-    if "curve_type" in data_in and data_in["curve_type"] is not None:
-        curve_type_dict = {
-            "HEAD": "FLOW-HEAD",
-            "EFFICIENCY": "FLOW-EFFICIENCY",
-            "HEADLOSS": "FLOW-HEADLOSS",
-            "VOLUME": "LEVEL-VOLUME",
-        }
-        data_out["curveType"] = curve_type_dict[data_in["curve_type"]]
-    else:
-        raise ValueError(
-            "curve_type {ct} not valid. Must be one HEAD, EFFICIENCY, HEADLOSS of VOLUME".format(
-                ct=str(data_in["curve_type"])
-            )
+parser.add_argument(
+    "--batch-operation",
+    help="Batch operation used with --batch-size (default: create)",
+    type=str,
+    action="store",
+    choices=BATCH_OPERATIONS,
+    default="create",
+)
+parser.add_argument(
+    "--stream",
+    help="Read the input incrementally and upload entities while parsing, keeping memory bounded for huge networks",
+    action="store_true",
+)
+parser.add_argument(
+    "--index-file",
+    help="Keep the node/link id index in this memory-mapped file instead of RAM (for networks exceeding the memory)",
+    type=str,
+    action="store",
+    default=None,
+)
+parser.add_argument(
+    "--incremental",
+    help="Only send entities which are new or changed since the last import (see --manifest)",
+    action="store_true",
+)
+parser.add_argument(
+    "--manifest",
+    help="Manifest with the content hashes of imported entities, per scenario and prefix (default: import-manifest.sqlite)",
+    type=str,
+    action="store",
+    default="import-manifest.sqlite",
+)
+parser.add_argument(
+    "--delete-missing",
+    help="With --incremental, delete entities of the last import which are no longer part of the network",
+    action="store_true",
+)
+parser.add_argument(
+    "--journal",
+    help="Journal of the URNs confirmed by the broker, used by --resume (default: import-journal.txt)",
+    type=str,
+    action="store",
+    default="import-journal.txt",
+)
+parser.add_argument(
+    "--resume",
+    help="Continue an interrupted import, skipping the entities confirmed in the --journal",
+    action="store_true",
+)
+parser.add_argument(
+    "--workers",
+    help="Number of processes converting and serializing the entities (default: 1, in the main process)",
+    type=int,
+    action="store",
+    default=1,
+)
+parser.add_argument(
+    "--concurrency",
+    help="Maximum number of requests in flight at the same time (default: 1)",
+    type=int,
+    action="store",
+    default=1,
+)
+parser.add_argument(
+    "--context-mode",
+    help="""How the entities reference the JSON-LD @context (default: inline):
+  inline:   an @context member in every entity (application/ld+json)
+  link:     a Link header per request or batch (application/json)
+  expanded: attribute names expanded to IRIs locally with the cached context,
+            so the broker does not resolve any context (application/json)""",
+    type=str,
+    action="store",
+    choices=CONTEXT_MODES,
+    default="inline",
+)
+parser.add_argument(
+    "--context-file",
+    help="Vendored copy of the @context document, used instead of downloading it",
+    type=str,
+    action="store",
+    default=None,
+)
+parser.add_argument(
+    "--context-cache",
+    help=f"Directory for downloaded @context documents (default: {DEFAULT_CACHE_DIR})",
+    type=str,
+    action="store",
+    default=DEFAULT_CACHE_DIR,
+)
+parser.add_argument(
+    "--context-refresh",
+    help="Revalidate the cached @context document (ETag) before expanding",
+    action="store_true",
+)
+parser.add_argument(
+    "--crs",
+    help="Coordinate reference system of the input coordinates, e.g. EPSG:32633; they are converted to WGS84 and the links\nget a LineString location (EPSG:3857 and WGS84 built in, others need pyproj, default: None, unchanged)",
+    type=str,
+    action="store",
+    default=None,
+)
+parser.add_argument(
+    "--tile-zoom",
+    help="Upload the nodes and links grouped by web map tile (z/x/y) of this zoom level, e.g. 14; needs --crs (default: 0, in file order)",
+    type=int,
+    action="store",
+    default=0,
+)
+parser.add_argument(
+    "--tiles",
+    help="Only import the nodes and links in these tiles, e.g. 14/8580/5738,14/8581/5738, to refresh a district (needs --crs);\ncurves, patterns and the network are left as they are",
+    type=str,
+    action="store",
+    default=None,
+)
+parser.add_argument(
+    "--series-references",
+    help="Add relationships from the nodes and links to their patterns and curves (demandPattern, pumpCurve, ...);\nthis changes the entities of imports made without it",
+    action="store_true",
+)
+parser.add_argument(
+    "--dedup-series",
+    help="Upload identical patterns and curves only once, the nodes and links reference the first of them\n(implies --series-references)",
+    action="store_true",
+)
+parser.add_argument(
+    "--series-precision",
+    help="Round pattern multipliers and curve points to this many decimals, which merges nearly identical series\nand shortens the payloads (implies --dedup-series, default: None, unchanged)",
+    type=int,
+    action="store",
+    default=None,
+)
+parser.add_argument(
+    "--no-validate",
+    help="Skip the check of the network (e.g. links to unknown nodes) before the upload;\nwith --stream the check reads the input one more time",
+    dest="validate",
+    action="store_false",
+)
+args = parser.parse_args()
+args.pool_size = max(args.pool_size, args.concurrency)
+
+metrics = Metrics.from_args(args)
+endpoint = ScenarioManagerEndpoint.from_args(args, metrics)
+
+
+def update_progress(count, **counters):
+    # Called by the importer with its lock held
+    limiter = endpoint.limiter
+    if counters or limiter is not None:
+        postfix = {k: v for k, v in network_import.stats.items() if v}
+        if limiter is not None:
+            postfix["limit"] = int(limiter.limit)
+            postfix["req/s"] = round(limiter.rate)
+        pbar.set_postfix(postfix, refresh=False)
+    pbar.update(count)
+
+
+try:
+    network_import = NetworkImport(
+        args.input_json,
+        endpoint,
+        ImportOptions.from_args(args),
+        metrics,
+        update_progress,
+    )
+except ValueError as e:
+    parser.error(str(e))
+
+# Parse and check the input file
+if args.stream:
+    print(f"Streaming models from {args.input_json}\n")
+try:
+    network_import.prepare()
+except ValueError as e:
+    sys.exit(str(e))
+
+if not args.stream:
+    counts = network_import.counts
+    selected_tiles = network_import.selected_tiles
+    print("-[ Import Results ]-----------------")
+    print(f"{counts['Junction']:6} junctions")
+    print(f"{counts['Tank']:6} tanks")
+    print(f"{counts['Reservoir']:6} reservoirs")
+    print(f"{counts['Pipe']:6} pipes")
+    print(f"{counts['Pump']:6} pumps")
+    print(f"{counts['Valve']:6} valves")
+    series_counts = network_import.series_counts
+    if series_counts is not None and not selected_tiles:
+        print(f"{counts['Curve']:6} curves ({series_counts[1]} before deduplication)")
+        print(
+            f"{counts['Pattern']:6} patterns ({series_counts[0]} before deduplication)"
         )
-    set_if_not_null(data_in, data_out, "dataProvider")
-    set_if_not_null(data_in, data_out, "dateCreated")
-    set_if_not_null(data_in, data_out, "dateModified")
-    set_if_not_null(data_in, data_out, "description")
-    set_if_not_null(data_in, data_out, "source")
-    set_data_series(data_in, data_out, "points", 0, "xData")
-    set_data_series(data_in, data_out, "points", 1, "yData")
-
-
-def set_pattern_data(data_in, data_out, options):
-    set_if_not_null(data_in, data_out, "multipliers")
-    set_if_not_null(options["time"], data_out, "pattern_timestep", "timeStep")
-    set_if_not_null(
-        options["time"], data_out, "pattern_start", "startTime"
-    )  # TODO: choose a suitable time format
-    set_if_not_null(data_in, data_out, "dataProvider")
-    set_if_not_null(data_in, data_out, "dateCreated")
-    set_if_not_null(data_in, data_out, "dateModified")
-    set_if_not_null(data_in, data_out, "description")
-    set_if_not_null(data_in, data_out, "source")
-
-def dump_response(data):
-    dump_file = open("request_data.json", "a")
-    dump_file.write("\n------------------ RESPONSE START ----------------------\n")
-    binary_data = data.encode('ascii')
-    decoded_data = binary_data.decode("ascii")
-    #json_formatted_response_data = json.dumps(decoded_data, indent = 4) 
-    dump_file.write(str(decoded_data))
-    dump_file.write("\n------------------ RESPONSE END ----------------------\n")
-    dump_file.close()
-
-def dump_request(data):
-    dump_file = open("request_data.json", "a")
-    dump_file.write("\n------------------ REQUEST START ----------------------\n")
-    json_formatted_request_data = json.dumps(data, indent = 4) 
-    dump_file.write(str(json_formatted_request_data))
-    dump_file.write("\n------------------ REQUEST END ----------------------\n")
-    dump_file.close()
+    else:
+        print(f"{counts['Curve']:6} curves")
+        print(f"{counts['Pattern']:6} patterns")
+    if not selected_tiles:
+        print("     1 network")
+    if args.network_chunk_size > 0 and not selected_tiles:
+        print(f"{network_import.sub_networks:6} sub-networks")
+    if network_import.tiles is not None:
+        print(f"{network_import.tiles:6} tiles at zoom {network_import.tile_zoom}")
+    print("------------------------------------")
+    print(f"{network_import.total:6} models total\n")
 
-def upload_model(data):
-    # context_entry = {"@context": [
-    #     "https://raw.githubusercontent.com/smart-data-models/dataModel.WaterDistributionManagementEPANET/master/context.jsonld"
-    # ]}
-    # data_json = json.dumps(data)
-    # data_json.dumps(context_entry)
-    data["@context"] = "https://raw.githubusercontent.com/smart-data-models/dataModel.WaterDistributionManagementEPANET/master/context.jsonld"
-    path = f"/ngsi-ld/v1/entities/"
-    dump_request(data)
-    status, res = endpoint.post(path, data, "application/ld+json")
-    if not (200 <= status <= 299):
-        print(f"POST {path} failed for {data['id']}")
-        print("Request Body:")
-        print(json.dumps(data, indent=2))
-        print("Response Body:")
-        print(res)
-        dump_response(res)
-        raise RuntimeError(f"Got status code {status} while posting {data['id']}.")
+# Check the scenario exists:
+# status, res = endpoint.get(f"/scenarios/{args.scenario}")
+# assert status == 200, f"Scenario does not exist: {args.scenario}"
+#print(f"Using scenario {args.scenario}: {res['name']}\n")
 
+if args.resume:
+    print(
+        f"Resuming: {len(network_import.journal)} models already confirmed in {args.journal}\n"
+    )
 
 print("Creating models:")
-with tqdm(total=total, unit="models") as pbar:
-    composed_of = []
-
-    for junction in junctions:
-        jdata = {"id": make_urn(junction["name"], "Junction"), "type": "Junction"}
-        set_node_data(junction, jdata)
-        set_if_not_null(junction, jdata, "elevation")
-        set_if_not_null(junction, jdata, "emitter_coefficient", "emitterCoefficient")
-        # Fields which should go to simulation metadata
-        #   - minimum_pressure
-        #   - pressure_exponent
-        #   - required_pressure
-        composed_of.append(jdata["id"])
-        upload_model(jdata)
-        pbar.update(1)
-
-    for reservoir in reservoirs:
-        rdata = {"id": make_urn(reservoir["name"], "Reservoir"), "type": "Reservoir"}
-        set_node_data(reservoir, rdata)
-        set_if_not_null(reservoir, rdata, "base_head", "reservoirHead")
-        # To be added once we have patterns and curves:
-        #   - head_pattern_name
-        composed_of.append(rdata["id"])
-        upload_model(rdata)
-        pbar.update(1)
-
-    for tank in tanks:
-        tdata = {"id": make_urn(tank["name"], "Tank"), "type": "Tank"}
-        set_node_data(tank, tdata)
-        set_if_not_null(tank, tdata, "bulk_coeff", "bulkReactionCoefficient")
-        set_if_not_null(tank, tdata, "diameter", "nominalDiameter")
-        set_if_not_null(tank, tdata, "elevation")
-        set_if_not_null(tank, tdata, "init_level", "initial_level")
-        set_if_not_null(tank, tdata, "initial_quality", "initialQuality")
-        set_if_not_null(tank, tdata, "max_level", "maxLevel")
-        set_if_not_null(tank, tdata, "min_level", "minLevel")
-        set_if_not_null(tank, tdata, "min_vol", "minVolume")
-        set_if_not_null(tank, tdata, "mixing_fraction", "mixingFraction")
-        # Fields which should go to simulation metadata
-        #   - overflow (boolean)
-        # To be added once we have patterns and curves:
-        #   - vol_curve_name
-        # Ignored fields:
-        #   - mixing_model (quality related, irrelevant for us)
-        composed_of.append(tdata["id"])
-        upload_model(tdata)
-        pbar.update(1)
-
-    for pipe in pipes:
-        pdata = {
-            "id": make_urn(pipe["name"], "Pipe"),
-            "type": "Pipe",
-        }
-        set_link_data(pipe, pdata)
-        set_if_not_null(pipe, pdata, "bulk_coeff", "bulkCoeff")
-        set_if_not_null(pipe, pdata, "diameter")
-        set_if_not_null(pipe, pdata, "length")
-        set_if_not_null(pipe, pdata, "minor_loss", "minorLoss")
-        set_if_not_null(pipe, pdata, "roughness")
-        set_if_not_null(pipe, pdata, "wall_coeff", "wallCoeff")
-        # Ignored Fields:
-        #   - check_valve (missing equivalent in the SMD)
-        composed_of.append(pdata["id"])
-        upload_model(pdata)
-        pbar.update(1)
-
-    for pump in pumps:
-        pdata = {
-            "id": make_urn(pump["name"], "Pump"),
-            "type": "Pump",
-        }
-        set_link_data(pump, pdata)
-        set_if_not_null(pump, pdata, "base_speed", "speed")
-        set_if_not_null(pump, pdata, "energy_price", "energyPrice")
-        # Ignored Fields:
-        #   - efficiency (can be computed using effiCurve)
-        #   - pump_type (distinction between HeadPump and PowerPump. We only use HeadPump, as PowerPumps are a simplification)
-        #   - power (parameter related to PowerPumps, so we can ignore it when assuming HeadPumps)
-        # To be added once we have patterns and curves:
-        #   - energy_pattern
-        #   - pump_curve_name
-        #   - speed_pattern_name
-        composed_of.append(pdata["id"])
-        upload_model(pdata)
-        pbar.update(1)
-
-    for curve in curves:
-        cdata = {"id": make_urn(curve["name"], "Curve"), "type": "Curve"}
-        set_curve_data(curve, cdata)
-        composed_of.append(cdata["id"])
-        upload_model(cdata)
-        pbar.update(1)
-
-    for pattern in patterns:
-        pattern_data = {"id": make_urn(pattern["name"], "Pattern"), "type": "Pattern"}
-        set_pattern_data(pattern, pattern_data, options)
-        composed_of.append(pattern_data["id"])
-        upload_model(pattern_data)
-        pbar.update(1)
-
-    network = {
-        "id": make_urn(args.network_name, "WaterNetwork"),
-        "type": "WaterNetwork",
-        "isComposedOf": composed_of,
-        "description": data["name"] + "\n\n" + data["comment"],
-        "name": args.network_name,
-    }
-    upload_model(network)
-    pbar.update(1)
-
+try:
+    with tqdm(total=network_import.total, unit="models") as pbar:
+        network_import.run()
+except UploadError as e:
+    print(e.details)
+    raise
+finally:
+    endpoint.close()
+    if metrics is not None:
+        metrics.report()
 print("Done.")